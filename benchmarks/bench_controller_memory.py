@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Memory footprint of the controller objects.
+
+Builds a number of controller instances from a configuration file and reports
+the bytes allocated per controller, per detector and per extender. Run from
+the repository root:
+
+    python benchmarks/bench_controller_memory.py --count 50
+
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tracemalloc
+
+CONTROL_ENGINE_SRC = os.path.join(os.path.dirname(__file__), "..", "services", "control_engine", "src")
+sys.path.append(os.path.abspath(CONTROL_ENGINE_SRC))
+
+from signal_group_controller import PhaseRingController  # noqa: E402
+from timer import Timer  # noqa: E402
+
+DEFAULT_CONF_FILE = "models/test/simple/contr.json"
+
+
+def build_controllers(cnf, count):
+    """Builds count controllers, the config prints are suppressed"""
+    controllers = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(count):
+            timer = Timer(cnf["timer"])
+            controllers.append(PhaseRingController(cnf["controller"], timer))
+    return controllers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Controller memory benchmark")
+    parser.add_argument("--conf-file", default=DEFAULT_CONF_FILE)
+    parser.add_argument("--count", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(args.conf_file) as f:
+        cnf = json.load(f)
+
+    build_controllers(cnf, 1)  # Warm up imports and class level caches
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    controllers = build_controllers(cnf, args.count)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    dets = sum(len(c.req_dets) + len(c.ext_dets) + len(c.ext_groups) + len(c.e3detectors) for c in controllers)
+    print("Controllers: {}, detectors: {}".format(len(controllers), dets))
+    print("Bytes per controller: {:.0f}".format(total / len(controllers)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Controller throughput with synthetic traffic.
+
+Runs the controller with the traffic generator and the virtual timer, i.e.
+without SUMO, and reports the simulated seconds per wall clock second. Run
+from the repository root:
+
+    python benchmarks/bench_controller_throughput.py --sim-time 3600
+
+"""
+import argparse
+import json
+import os
+import sys
+
+CONTROL_ENGINE_SRC = os.path.join(os.path.dirname(__file__), "..", "services", "control_engine", "src")
+sys.path.append(os.path.abspath(CONTROL_ENGINE_SRC))
+
+from traffic_generator import run  # noqa: E402
+
+DEFAULT_CONF_FILE = "models/test/simple/contr.json"
+DEFAULT_DEMAND = 200 # veh/h per approach, below the capacity of the simple model
+SATURATED_QUEUE_SHARE = 0.05 # of the arrived vehicles left in the queues at the end
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Controller throughput benchmark")
+    parser.add_argument("--conf-file", default=DEFAULT_CONF_FILE)
+    parser.add_argument("--sim-time", type=float, default=3600)
+    parser.add_argument("--demand", type=float, default=DEFAULT_DEMAND, help="veh/h per approach")
+    parser.add_argument("--arrivals", choices=["poisson", "platoon"], default="poisson")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with open(args.conf_file) as f:
+        cnf = json.load(f)
+    gen_conf = {"demand": args.demand, "arrivals": args.arrivals, "seed": args.seed}
+    stats, wall_time = run(cnf, args.sim_time, gen_conf)
+    print(json.dumps(stats, indent=4))
+    if stats["queue"] > SATURATED_QUEUE_SHARE * stats["arrived"]:
+        # The queues grow without limit, the delays depend on the simulated time
+        print("Saturated: {} of {} arrived vehicles left in the queues".format(stats["queue"], stats["arrived"]))
+    print("Simulated seconds per second: {:.0f}".format(stats["sim_time"] / wall_time))
+
+
+if __name__ == "__main__":
+    main()
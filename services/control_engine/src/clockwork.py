@@ -154,15 +154,17 @@ class DataDistributor:
         return mapping
 
     def detector_message_to_controller(self, msg, channel):
+        # Note: values are buffered and applied by the controller at tick start
         msg_dict = json.loads(msg)
         #det_list = []
 
         if channel in self.det_mapping:
+            input_buffer = self.controller.input_buffer
             for det in self.det_mapping[channel]:
                 if not det.type=="e3detector": 
-                    det.loop_on = msg_dict["loop_on"]
+                    input_buffer.set_loop(det, msg_dict["loop_on"])
                 else:
-                    det.update_e3_vehicles(msg_dict['objects'])
+                    input_buffer.set_e3_objects(det, msg_dict['objects'])
 
                 #det_list.append(self.det_mapping[channel])
         #print("Setting detectors", det_list, " with message:", msg_dict)
@@ -173,13 +175,13 @@ class DataDistributor:
         if channel in self.group_request_mapping:
             # If request true, we set the request to the group
             if msg_dict["request"]:
-                self.group_request_mapping[channel].request_green=True
+                self.controller.input_buffer.request_green(self.group_request_mapping[channel])
                 print("Setting request for group:", self.group_request_mapping[channel].group_name, " to:", msg_dict["request"])
 
     def group_status_message_request_to_controller(self, msg, channel):
         "This function reads the status messages and if the status changes from non request status to request status, it sets the request to the group"
         if self.group_status_storage.request_changed_on(msg, channel):
-            self.group_status_mapping[channel].request_green=True
+            self.controller.input_buffer.request_green(self.group_status_mapping[channel])
             print("Setting request for group:", self.group_status_mapping[channel].group_name)
 
 
@@ -3,116 +3,157 @@
 
 This module implements detecors for traffic controllers
 
+The detector objects are created for every controller instance, thus they are
+kept small: all the per type state is stored in __slots__ and the values read
+from the configuration are kept in a shared, immutable DetectorParams object.
+
 """
 # Copyright 2020 by Conveqs Oy and Kari Koskinen
 # All Rights Reserved
 #
 # import traci
 
+from collections import namedtuple
+
+# Detector types having a sumo detector as a source
+SUMO_DETECTOR_TYPES = ('request', 'extender', 'e3detector', 'prio', 'ext_extender')
+
+DEFAULT_PRIORITY_LEVEL = 2
+DEFAULT_MAX_DIST = 200.0
+
 
 def main():
     print('testing dets')
     conf = {
+        'type': 'request',
         'sumo_id':'0',
         'request_groups':['group0', 'group1']
     }
-    det = Detector('det0', conf)
+    det = Detector(None, 'det0', conf)
     print(det)
 
+
+_DetectorParamsBase = namedtuple('_DetectorParamsBase', [
+    'type', 'sumo_id', 'owngroup_name', 'priolevel', 'v2x_ON', 'vtypes',
+    'weight', 'lanes', 'MaxDist', 'channel', 'ext_time', 'extgroup_name'])
+
+
+class DetectorParams(_DetectorParamsBase):
+    """Immutable detector parameters read from the configuration
+
+    Params are interned: detectors with equal configuration (e.g. the same
+    controller conf loaded for many junctions or rollouts) share one object.
+    """
+    __slots__ = ()
+    _interned = {}
+
+    @classmethod
+    def from_conf(cls, conf):
+        """Returns the shared params object for a detector conf dict"""
+        det_type = conf['type']
+        if det_type in SUMO_DETECTOR_TYPES:
+            sumo_id = conf['sumo_id']
+        else:
+            sumo_id = None
+
+        if det_type in ['request']:
+            owngroup_name = conf['request_groups'][0]
+        else:
+            owngroup_name = conf['group']
+
+        params = cls(
+            type=det_type,
+            sumo_id=sumo_id,
+            owngroup_name=owngroup_name,
+            priolevel=conf.get('priority', DEFAULT_PRIORITY_LEVEL),
+            v2x_ON=conf.get('v2x-on', False),
+            vtypes=tuple(conf.get('vtypes', ())),    # DBIK202602 vehicle types filter for e3-detectors
+            weight=conf.get('weight', 0),            # DBIK202602 weight for e3-detectors
+            lanes=tuple(conf.get('lanes', ())),      # DBIK202602 lanes for e3-detectors
+            MaxDist=conf.get('max_dist', DEFAULT_MAX_DIST),  # DBIK202602 max distance for e3-detector
+            channel=conf.get('channel', None),
+            ext_time=conf.get('ext_time', 0),
+            extgroup_name=conf.get('extgroup', ''),
+        )
+        return cls._interned.setdefault(params, params)
+
+
 class Detector:
-    """docstring for Detector"""
+    """Request detector, base class for the other detector types"""
+    __slots__ = ('system_timer', 'conf', 'name', 'params', '_loop_on',
+                 'request_groups', 'detection_at', 'detection_end_at',
+                 'owngroup_obj', 'extgroup_obj')
+
     def __init__(self, system_timer, name, conf):
         self.system_timer = system_timer
         self.conf = conf
         self.name = name
-        self.type = conf['type']
+        self.params = DetectorParams.from_conf(conf)
         self._loop_on = False
         self.request_groups = []
-        self.priolevel = 2
-        self.vtypes = []  
-        self.weight = 0
-        self.lanes = []
-        self.MaxDist = 200.0
-        
-        if self.type in ['request','extender','e3detector', 'prio','ext_extender']:
-            self.sumo_id = conf['sumo_id']
-        else:
-            self.sumo_id = None
-        
+
         self.detection_at = 0  # detection start time in seconds
         self.detection_end_at = 0  # detection end time, extension countdown start
-        
-        if self.type in ['request']:
-            names = conf['request_groups']
-            self.owngroup_name = names[0]
-        else: 
-            self.owngroup_name = conf['group']
-        
-        if 'priority' in conf: 
-            self.priolevel = conf['priority']
-            print('Priority detector: ', name,' Priority level: ', self.priolevel)
-        else:
-            self.priolevel = 2
 
-        if 'v2x-on' in conf: 
-            self.v2x_ON = conf['v2x-on']
+        if 'priority' in conf:
+            print('Priority detector: ', name,' Priority level: ', self.priolevel)
+        if 'v2x-on' in conf:
             print('V2X-detector: ', name,' V2X-ON: ', self.v2x_ON)
-        else:
-            self.v2x_ON = False
-
-        # DBIK202602  Add vehicle types fileter to e3-detectors        
-        if 'vtypes' in conf: 
-            self.vtypes = conf['vtypes']
+        if 'vtypes' in conf:
             print('e3-detector: ', name,' vtypes: ', self.vtypes)
-        else:
-            self.vtypes = []   
-
-        # DBIK202602  Add weight to e3-detectors
-        if 'weight' in conf: 
-            self.weight = conf['weight']
+        if 'weight' in conf:
             print('e3-detector: ', name,' Weight: ', self.weight)
-        else:
-            self.weight = 0   
-
-        # DBIK202602  Add lanes to e3-detectors
-        if 'lanes' in conf: 
-            self.lanes = conf['lanes']
+        if 'lanes' in conf:
             print('e3-detector: ', name,' Lanes: ', self.lanes)
-
-        else:
-            self.lanes = []   
-        
-        # DBIK202602  Add Max distance to e3-detector
-        if 'max_dist' in conf: 
-            self.MaxDist = conf['max_dist']
+        if 'max_dist' in conf:
             print('e3-detector: ', name,' Max Dist: ', self.MaxDist)
-            BP = 1
-        else:
-            self.MaxDist = 200   
-
 
         self.owngroup_obj = None
-
         self.extgroup_obj = None
-        self.extgroup_name = '' 
 
-        self.extend_on = False
+    #
+    # Configured values, read only
+    #
 
-        self.det_vehicles_dict = {}
-        self.last_vehicles_dict = {}
+    @property
+    def type(self):
+        return self.params.type
 
-        
+    @property
+    def sumo_id(self):
+        return self.params.sumo_id
 
-         # DBIK202502 Variables for safety green extension
-        self.MinOZ = 40.0
-        self.MaxOZ = 120.0
-        self.SafeDist = 30.0
-        self.SafeExtOn = False
-        self.ShortGapFound = False
-        
+    @property
+    def owngroup_name(self):
+        return self.params.owngroup_name
 
+    @property
+    def priolevel(self):
+        return self.params.priolevel
 
+    @property
+    def v2x_ON(self):
+        return self.params.v2x_ON
 
+    @property
+    def vtypes(self):
+        return self.params.vtypes
+
+    @property
+    def weight(self):
+        return self.params.weight
+
+    @property
+    def lanes(self):
+        return self.params.lanes
+
+    @property
+    def MaxDist(self):
+        return self.params.MaxDist
+
+    @property
+    def extgroup_name(self):
+        return self.params.extgroup_name
 
     def __str__(self):
         return "Det:{}, conf:{}".format(self.name, self.conf)
@@ -174,13 +215,9 @@ class Detector:
             for grp in self.request_groups:
                 grp.request_green = True  # DBIK231213 Note: req turned ON by pulse up only, to be reseted by group after served
                 
-                # DBIK202411 Set priority request by detector logic
-                grp.own_request_level = self.priolevel # DBIK241029 pass the request priority level to the signal group
-                for confgrp in grp.conflicting_groups:  # DBIK241101 pass the request priority level to the conflicting signal groups
-                    other_req_level = confgrp['group'].other_request_level
-                    if self.priolevel > other_req_level:
-                        confgrp['group'].other_request_level = self.priolevel # DBIK201105 Set only if higher request level 
-          
+                # DBIK202411 Set priority request by detector logic, also passed to the conflicting groups
+                if self.priolevel != DEFAULT_PRIORITY_LEVEL:
+                    grp.add_priority_request(self, self.priolevel)
                 
         if not set_on and self._loop_on:
             self.pulse_down()
@@ -196,10 +233,15 @@ class Detector:
 
 class ExtDetector(Detector):
     """Detector for extending"""
-    def __init__(self, system_timer, name, conf):
-        super(ExtDetector, self).__init__(system_timer, name, conf)
-        self.group = conf['group']
-        self.ext_time = conf['ext_time']
+    __slots__ = ()
+
+    @property
+    def group(self):
+        return self.params.owngroup_name
+
+    @property
+    def ext_time(self):
+        return self.params.ext_time
 
     def is_extending(self):
         """Returns true if detector on OR time passed after pulse down is less than the ext_time"""  
@@ -211,10 +253,7 @@ class ExtDetector(Detector):
 
 class Ext_Extender(ExtDetector):
     """Detector for extending"""
-    def __init__(self, system_timer, name, conf):
-        super(ExtDetector, self).__init__(system_timer, name, conf)
-        self.group = conf['group']
-        self.ext_time = conf['ext_time']
+    __slots__ = ()
 
     def is_extending(self):
         """Returns true if detector on """  
@@ -227,20 +266,22 @@ class Ext_Extender(ExtDetector):
 # BBIK231214  New detector class for extending by signal groups 
 class GrpDetector(Detector):
     """Detector for a group extending extending another group"""
+    __slots__ = ('extgroup',)
+
     def __init__(self, system_timer, name, conf):
         super(GrpDetector, self).__init__(system_timer, name, conf)
-        # self.group_name = conf['group']
-        self.ext_time = conf['ext_time']
-        self.extgroup_name = conf['extgroup']
+        self.extgroup = None # Set by the controller
+
+    @property
+    def ext_time(self):
+        return self.params.ext_time
 
     def is_extending(self):
         """Returns true if extending signal group is green OR time passed after the green start is less than the ext_time"""
-        ext_grp_on = self.extgroup.group_on
         if self.extgroup.green_started_at < 0:
             return False
         ext_time_on = (self.extgroup.green_started_at + self.ext_time) > self.system_timer.seconds
-        ext_on = ext_time_on
-        return ext_on
+        return ext_time_on
     
     def tick(self):  # DBIK240801
         """tick is doing nothing, but has to defined. Otherwise will inherit from Request detector"""
@@ -249,15 +290,30 @@ class GrpDetector(Detector):
 # BBIK230731  New detector class for extending based on e3 detectors 
 class e3Detector(Detector):
     """Detector for extending"""
+    __slots__ = ('vehcount', 'errorcount', 'speedsum', 'det_vehicles_dict',
+                 'last_vehicles_dict', 'extend_on', 'SafeExtOn', 'ShortGapFound')
+
+    # DBIK202502 Constants for safety green extension (shared by all e3-detectors)
+    MinOZ = 40.0
+    MaxOZ = 120.0
+    SafeDist = 30.0
+
     def __init__(self, system_timer, name, conf):
         super(e3Detector, self).__init__(system_timer, name, conf)
-        # self.group = conf['group']
         self.vehcount = 0
         self.errorcount = 0
         self.speedsum = 0
-        if 'channel' in conf:
-            self.e3channel = conf['channel']
-        BP = 1
+        self.det_vehicles_dict = {}
+        self.last_vehicles_dict = {}
+        self.extend_on = False
+
+        # DBIK202502 Variables for safety green extension
+        self.SafeExtOn = False
+        self.ShortGapFound = False
+
+    @property
+    def e3channel(self):
+        return self.params.channel
         
     def is_extending(self):
         """Returns true if vehicle count is more than zero"""
@@ -279,6 +335,8 @@ class e3Detector(Detector):
         self.vehcount = 0
         self.ShortGapFound = False  # DBIK20250312
         self.speedsum = 0
+        vtypes = self.params.vtypes
+        max_dist = self.params.MaxDist
         
         SIM = True
         COORD1 = True
@@ -300,10 +358,10 @@ class e3Detector(Detector):
             TLSno = self.det_vehicles_dict[vehid].get('TLSno', "not_found")               # DBIK202602 Set traffic signal number
 
             if TLSdist != "not_found":
-                if (TLSdist > self.MaxDist):
+                if (TLSdist > max_dist):
                     continue
 
-            if (self.vtypes != []) and not(vtype in self.vtypes):
+            if vtypes and not(vtype in vtypes):
                 BP=1
                 continue
                 
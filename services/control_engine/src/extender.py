@@ -10,9 +10,15 @@ it easier to implement external control schemes
 # All Rights Reserved
 #
 
-from signal_group import SignalGroup
+from collections import namedtuple
 import keyboard, time
 
+# Flat imports when run as a script, relative when imported as a package (tests)
+if __package__:
+    from .signal_group import SignalGroup, Substate
+else:
+    from signal_group import SignalGroup, Substate
+
 
 def main():
     print('Testing the ext')
@@ -25,8 +31,34 @@ def keyboard_break(ch):
     print('Demo continued: ')
 
 
+_ExtenderParamsBase = namedtuple('_ExtenderParamsBase', [
+    'ext_mode', 'ext_threshold', 'time_discount', 'safety_ext', 'safety_time'])
+
+
+class ExtenderParams(_ExtenderParamsBase):
+    """Extension parameters read from the configuration
+
+    The parameters are immutable and interned, thus all the extenders with the
+    same configuration share one object.
+    """
+    __slots__ = ()
+    _interned = {}
+
+    @classmethod
+    def from_conf(cls, ext_params):
+        params = cls(
+            ext_mode=ext_params.get('ext_mode', 3),
+            ext_threshold=ext_params.get('ext_threshold', 0.25),
+            time_discount=ext_params.get('time_discount', 60),
+            safety_ext=ext_params.get('safety_ext', False),
+            safety_time=ext_params.get('safety_time', 0))
+        return cls._interned.setdefault(params, params)
+
+
 class StaticExtender:
     """This creates an extender that is always on or always on/off"""
+    __slots__ = ('extend',)
+
     def __init__(self, do_extend):
         self.extend = do_extend
 
@@ -36,6 +68,10 @@ class StaticExtender:
 
 class Extender:
     """docstring for Detector"""
+    __slots__ = ('system_timer', 'group', 'grpdets', 'dets', 'e3dets', 'extend', '_extend',
+                 'conf_groups', 'vehcount', 'conf_sum', 'threshold', 'momentum',
+                 'ext_ended_at', 'ext3_status', 'prev_status', 'params', 'group_name')
+
     def __init__(self, timer, group, dets, grpdets, e3dets, ext_params): # DBIK200803, add e3dets
         self.system_timer = timer
         self.group = group
@@ -54,31 +90,8 @@ class Extender:
         self.ext3_status = 0
         self.prev_status = 0
 
-        self.ext_mode = 3
-        if 'ext_mode' in ext_params:
-            self.ext_mode = ext_params['ext_mode']
-            BP = 1
-
-        self.ext_threshold = 0.25
-        if 'ext_threshold' in ext_params:
-            self.ext_threshold = ext_params['ext_threshold']
-            BP = 1
-
-        self.time_discount = 60
-        if 'time_discount' in ext_params:
-            self.time_discount = ext_params['time_discount']
-            BP = 1
-
-
-        self.safety_ext = False
-        if 'safety_ext' in ext_params:
-            self.safety_ext = ext_params['safety_ext']
-            BP = 1
-        self.safety_time = 0
-        if 'safety_time' in ext_params:
-            self.safety_time = ext_params['safety_time']
-            BP = 1
-                
+        self.params = ExtenderParams.from_conf(ext_params)
+
         for grp in self.group.conflicting_groups:
             self.conf_groups.append(grp) 
             print('conf group added: ',grp)
@@ -114,6 +127,26 @@ class Extender:
     def __repr__(self):
         return "Ext<{}>".format(self.group)
 
+    @property
+    def ext_mode(self):
+        return self.params.ext_mode
+
+    @property
+    def ext_threshold(self):
+        return self.params.ext_threshold
+
+    @property
+    def time_discount(self):
+        return self.params.time_discount
+
+    @property
+    def safety_ext(self):
+        return self.params.safety_ext
+
+    @property
+    def safety_time(self):
+        return self.params.safety_time
+
     def update_extension(self):
         """Function updates the extension status to the group"""
         for det in self.dets:
@@ -143,6 +176,7 @@ class Extender:
 
 # This is a new extender type using the e3-detectors as input #DBIK240731
 class e3Extender(Extender):
+    __slots__ = ()
 
     def update_extension(self):
         """Function updates the extension status to the group"""
@@ -273,7 +307,7 @@ class e3Extender(Extender):
         else:
             self.ext3_status = self.update_safety_extension()
         
-        if (self.safety_ext) and (self.group.state=='Green_Extending'):  
+        if (self.safety_ext) and (self.group.substate == Substate.GREEN_EXTENDING):  
             if (self.prev_status==1) and (self.ext3_status==0): 
                 self.ext_ended_at = self.system_timer.seconds
                 self.ext3_status=2     
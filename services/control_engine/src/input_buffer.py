@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""The controller input buffer.
+
+This module implements the buffer between the message handlers and the
+controller. The NATS callbacks only store the incoming values here and the
+controller applies them once at the start of every tick, thus the detector and
+group states do not change in the middle of a controller cycle.
+
+Values are coalesced: only the latest loop state and e3 object list per
+detector is kept. A detector pulse that starts and ends within one tick is
+not lost, it is applied as on followed by off.
+
+"""
+# Copyright 2025 by Conveqs Oy and Kari Koskinen
+# All Rights Reserved
+#
+
+
+class ControllerInputBuffer:
+    """Coalescing input buffer, applied by the controller at tick start"""
+
+    def __init__(self):
+        # Pending values, swapped with the spare dicts when applied
+        self._loops = {}     # det -> [rising edge seen, latest loop_on]
+        self._e3_objects = {}  # det -> latest object list
+        self._requests = {}  # group -> None, dict keeps the arrival order
+        self._spare_loops = {}
+        self._spare_e3_objects = {}
+        self._spare_requests = {}
+        self.received = 0  # Number of values put into the buffer
+        self.applied = 0   # Number of values applied to the controller
+
+    def __len__(self):
+        return len(self._loops) + len(self._e3_objects) + len(self._requests)
+
+    def set_loop(self, det, loop_on):
+        """Stores the loop state of a detector"""
+        self.received += 1
+        pending = self._loops.get(det)
+        if pending is None:
+            self._loops[det] = [loop_on and not det.loop_on, loop_on]
+        else:
+            if loop_on and not pending[1]:
+                pending[0] = True
+            pending[1] = loop_on
+
+    def set_e3_objects(self, det, obj_list):
+        """Stores the latest object list of an e3 detector"""
+        self.received += 1
+        self._e3_objects[det] = obj_list
+
+    def request_green(self, group):
+        """Stores a green request for the group"""
+        self.received += 1
+        self._requests[group] = None
+
+    def apply(self):
+        """Applies the pending values, called by the controller at tick start"""
+        if not (self._loops or self._e3_objects or self._requests):
+            return
+        loops, self._loops = self._loops, self._spare_loops
+        e3_objects, self._e3_objects = self._e3_objects, self._spare_e3_objects
+        requests, self._requests = self._requests, self._spare_requests
+
+        for det, (rising_edge, loop_on) in loops.items():
+            if rising_edge and not loop_on:
+                det.loop_on = True  # Short pulse, the request must not be lost
+            det.loop_on = loop_on
+        for det, obj_list in e3_objects.items():
+            det.update_e3_vehicles(obj_list)
+        for group in requests:
+            group.request_green = True
+        self.applied += len(loops) + len(e3_objects) + len(requests)
+
+        loops.clear()
+        e3_objects.clear()
+        requests.clear()
+        self._spare_loops = loops
+        self._spare_e3_objects = e3_objects
+        self._spare_requests = requests
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""The priority requests.
+
+This module implements the book keeping of the active priority requests of a
+signal group. The requests are stored by source (e.g. a detector), thus
+several priority vehicles (trams, buses) can have overlapping requests and
+serving one of them does not cancel the others.
+
+The highest active level is kept on top of a heap, removed requests are
+dropped lazily when they reach the top. The heap is rebuilt from the active
+requests when the removed ones outnumber them, so it stays bounded.
+
+"""
+# Copyright 2025 by Conveqs Oy and Kari Koskinen
+# All Rights Reserved
+#
+import heapq
+
+DEFAULT_REQUEST_LEVEL = 2
+
+
+class PriorityRequests:
+    """Active priority requests of a signal group by source"""
+    __slots__ = ("_levels", "_heap", "_seq")
+
+    def __init__(self):
+        self._levels = {}  # source -> (level, seq)
+        self._heap = []    # (-level, seq, source)
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._levels)
+
+    def __contains__(self, source):
+        return source in self._levels
+
+    def __repr__(self):
+        return "PriorityRequests<{}>".format(self.level)
+
+    @property
+    def sources(self):
+        return list(self._levels)
+
+    @property
+    def level(self):
+        """Highest active request level, the default if no requests"""
+        heap = self._heap
+        while heap:
+            neg_level, seq, source = heap[0]
+            entry = self._levels.get(source)
+            if entry is not None and entry[1] == seq:
+                return -neg_level
+            heapq.heappop(heap) # Removed or replaced request
+        return DEFAULT_REQUEST_LEVEL
+
+    def add(self, source, level):
+        """Sets the request of the source, replaces the old level"""
+        self._seq += 1
+        self._levels[source] = (level, self._seq)
+        heapq.heappush(self._heap, (-level, self._seq, source))
+        self._compact()
+
+    def discard(self, source):
+        """Removes the request of the source, if any"""
+        if self._levels.pop(source, None) is not None:
+            self._compact()
+
+    def _compact(self):
+        """Rebuilds the heap if more than half of it are removed or replaced requests"""
+        if len(self._heap) > 2 * len(self._levels):
+            self._heap = [(-level, seq, source) for source, (level, seq) in self._levels.items()]
+            heapq.heapify(self._heap)
+
+    def clear(self):
+        self._levels.clear()
+        self._heap.clear()
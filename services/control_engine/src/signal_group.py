@@ -11,12 +11,19 @@ signal group controller
 
 import time
 import math
+from enum import IntEnum
+from operator import attrgetter
 #from transitions_gui import WebMachine
 #from transitions import Machine, State
 #from transitions import State
 #from transitions.extensions import HierarchicalGraphMachine as Machine
 from transitions.extensions import HierarchicalMachine as Machine
 from transitions.extensions.nesting import NestedState as State
+# Flat imports when run as a script, relative when imported as a package (tests)
+if __package__:
+    from .priority_requests import PriorityRequests
+else:
+    from priority_requests import PriorityRequests
 
 # Constant minimums in seconds
 MINIMUM_GREEN = 10
@@ -28,6 +35,114 @@ DEFAULT_TIME_STEP = 0.01  # seconds
 
 INSTANT_TRANSFER = True
 
+# Callback name or path -> getter from the group, see GroupMachine
+CALLBACK_GETTERS = {}
+
+
+class Substate(IntEnum):
+    """Integer codes for the composite (parent_child) states of a group"""
+    START = 0
+    RED_INIT = 1
+    RED_MINIMUMTIME = 2
+    RED_CANEND = 3
+    RED_FORCEGREEN = 4
+    RED_WAITINTERGREEN = 5
+    RED_EXIT = 6
+    AMBERRED_INIT = 7
+    AMBERRED_MINIMUMTIME = 8
+    AMBERRED_EXIT = 9
+    GREEN_INIT = 10
+    GREEN_MINIMUMTIME = 11
+    GREEN_EXTENDING = 12
+    GREEN_REMAINGREEN = 13
+    GREEN_EXIT = 14
+    AMBER_INIT = 15
+    AMBER_MINIMUMTIME = 16
+    AMBER_EXIT = 17
+
+
+# State machine state name -> substate code
+SUBSTATE_CODES = {
+    'Start': Substate.START,
+    'Red_Init': Substate.RED_INIT,
+    'Red_MinimumTime': Substate.RED_MINIMUMTIME,
+    'Red_CanEnd': Substate.RED_CANEND,
+    'Red_ForceGreen': Substate.RED_FORCEGREEN,
+    'Red_WaitIntergreen': Substate.RED_WAITINTERGREEN,
+    'Red_Exit': Substate.RED_EXIT,
+    'AmberRed_Init': Substate.AMBERRED_INIT,
+    'AmberRed_MinimumTime': Substate.AMBERRED_MINIMUMTIME,
+    'AmberRed_Exit': Substate.AMBERRED_EXIT,
+    'Green_Init': Substate.GREEN_INIT,
+    'Green_MinimumTime': Substate.GREEN_MINIMUMTIME,
+    'Green_Extending': Substate.GREEN_EXTENDING,
+    'Green_RemainGreen': Substate.GREEN_REMAINGREEN,
+    'Green_Exit': Substate.GREEN_EXIT,
+    'Amber_Init': Substate.AMBER_INIT,
+    'Amber_MinimumTime': Substate.AMBER_MINIMUMTIME,
+    'Amber_Exit': Substate.AMBER_EXIT,
+}
+
+
+def substate_mask(*substates):
+    """Returns a bitmask with the bits of the given substates set"""
+    mask = 0
+    for substate in substates:
+        mask |= 1 << substate
+    return mask
+
+
+# State name -> substate bit, for testing the state against the masks below
+SUBSTATE_BITS = {name: 1 << code for name, code in SUBSTATE_CODES.items()}
+
+RED_STATES = substate_mask(Substate.RED_INIT, Substate.RED_MINIMUMTIME, Substate.RED_CANEND,
+                           Substate.RED_FORCEGREEN, Substate.RED_WAITINTERGREEN, Substate.RED_EXIT)
+AMBERRED_STATES = substate_mask(Substate.AMBERRED_INIT, Substate.AMBERRED_MINIMUMTIME, Substate.AMBERRED_EXIT)
+GREEN_STATES = substate_mask(Substate.GREEN_INIT, Substate.GREEN_MINIMUMTIME, Substate.GREEN_EXTENDING,
+                             Substate.GREEN_REMAINGREEN, Substate.GREEN_EXIT)
+AMBER_STATES = substate_mask(Substate.AMBER_INIT, Substate.AMBER_MINIMUMTIME, Substate.AMBER_EXIT)
+
+# Green, going green or ending green
+ON_STATES = GREEN_STATES | AMBER_STATES | AMBERRED_STATES
+GREEN_OR_AMBER_STATES = GREEN_STATES | AMBER_STATES
+# Red and not going green, or going red
+STAYING_RED_STATES = AMBER_STATES | substate_mask(
+    Substate.RED_INIT, Substate.RED_MINIMUMTIME, Substate.RED_CANEND, Substate.RED_FORCEGREEN)
+# Active (or starting) green, blocks the conflicting groups
+BLOCKING_STATES = substate_mask(Substate.RED_FORCEGREEN, Substate.RED_WAITINTERGREEN,
+                                Substate.AMBERRED_MINIMUMTIME, Substate.GREEN_MINIMUMTIME,
+                                Substate.GREEN_EXTENDING)
+STARTING_STATES = substate_mask(Substate.RED_WAITINTERGREEN, Substate.AMBERRED_MINIMUMTIME)
+MIN_GREEN_STATES = STARTING_STATES | substate_mask(Substate.GREEN_MINIMUMTIME)
+ACTIVE_GREEN_STATES = substate_mask(Substate.GREEN_MINIMUMTIME, Substate.GREEN_EXTENDING,
+                                    Substate.GREEN_REMAINGREEN)
+ACTIVE_GREEN_PASSED_STATES = substate_mask(Substate.GREEN_REMAINGREEN, Substate.AMBER_MINIMUMTIME,
+                                           Substate.RED_MINIMUMTIME, Substate.RED_CANEND)
+MIN_GREEN_STARTED_STATES = substate_mask(Substate.GREEN_MINIMUMTIME)
+MIN_GREEN_ENDED_STATES = substate_mask(Substate.GREEN_EXTENDING, Substate.GREEN_REMAINGREEN)
+ANY_STATES = substate_mask(*Substate)
+
+# Substate code -> status char in 'traditional' format, see get_grp_state
+GRP_STATUS_CHARS = tuple({
+    Substate.RED_MINIMUMTIME: 'a',
+    Substate.RED_CANEND: 'b',
+    Substate.RED_FORCEGREEN: 'f',
+    Substate.RED_WAITINTERGREEN: 'g',
+    Substate.AMBERRED_MINIMUMTIME: '0',
+    Substate.GREEN_MINIMUMTIME: '1',
+    Substate.GREEN_EXTENDING: '5',
+    Substate.GREEN_REMAINGREEN: '4',
+    Substate.AMBER_MINIMUMTIME: '>'
+}.get(code, '*') for code in Substate)
+
+# Substate code -> status in sumo format
+SUMO_STATUS_CHARS = tuple(
+    'r' if (1 << code) & RED_STATES else
+    'u' if (1 << code) & AMBERRED_STATES else
+    'g' if (1 << code) & GREEN_STATES else
+    'y' if (1 << code) & AMBER_STATES else None
+    for code in Substate)
+
 
 def value_is_number(input):
     try:
@@ -108,11 +223,84 @@ def draw_graphs():
 # NOTE: Should we add Zero transfers?
 #       if for exsample no amber light (e.g. pedestrian lights)
 
-class SignalGroup(Machine):
-    """Implements Signal Group state machine"""
+class GroupMachine(Machine):
+    """The signal group state machine, the groups are the models
+
+    The machine only holds the states and transitions, thus one machine can be
+    shared by all the groups of a controller. The callbacks are names of the
+    group methods or paths to the substates of the group, e.g.
+    'va_green.min_time_passed'.
+    """
+
+    def __init__(self):
+        states = [
+            State(name='Start'),
+            #State(name='Red', on_enter='start_red'),
+            GroupBasedRed.as_state('Red', 'group_based_red', on_enter='start_red_cb'),
+            FixedTime.as_state('AmberRed', 'fixed_amber_red'),
+            VehicleActuated.as_state('Green', 'va_green', on_enter='start_green_cb'),
+            FixedTime.as_state('Amber', 'fixed_amber', on_enter='start_amber_cb')
+            ]
+        transitions = [
+            {
+                'trigger': 'next_state',
+                'source': 'Start',
+                'dest': 'Red_Init'
+            },
+            {
+                'trigger': 'next_state',
+                'source': 'Red_Exit',
+                'dest': 'AmberRed_Init'
+            },
+
+            {
+                'trigger': 'next_state',
+                'source': 'AmberRed_Exit',
+                'dest': 'Green_Init'
+            },
+            {
+                'trigger': 'next_state',
+                'source': 'Green_Exit',
+                'dest': 'Amber_Init'
+            },
+
+            {
+                'trigger': 'next_state',
+                'source': 'Amber_Exit',
+                'dest': 'Red_Init'
+            }
+        ]
+        initial = 'Start'
+
+        Machine.__init__(
+            self,
+            model=[], # The groups are added by add_model
+            states=states,
+            transitions=transitions,
+            initial=initial,
+            auto_transitions=False
+            )
+
+    @staticmethod
+    def resolve_callable(func, event_data):
+        """Resolves the callbacks on the group, the names can be paths to the substates"""
+        if isinstance(func, str):
+            getter = CALLBACK_GETTERS.get(func)
+            if getter is None:
+                getter = CALLBACK_GETTERS[func] = attrgetter(func)
+            return getter(event_data.model)
+        return func
+
+
+class SignalGroup:
+    """Implements Signal Group state machine
+    machine: GroupMachine shared by the groups of a controller, own if not given
+    """
 
-    def __init__(self, system_timer, name, grp_conf, instant_transfer=INSTANT_TRANSFER, controller_index=None):
-        self.group_name = name # Note, "name" conflicts with Machine?
+    def __init__(self, system_timer, name, grp_conf, instant_transfer=INSTANT_TRANSFER, controller_index=None,
+                 machine=None):
+        self.group_name = name
+        self.name = name + ': ' # The name given to the own machine before, the extenders and UI use this
         self.controller_index = controller_index # groups assigned to controller are indexed from 1 upwards
         self.grp_conf = grp_conf
         self.system_timer = system_timer
@@ -140,16 +328,16 @@ class SignalGroup(Machine):
         self._permit_green = False  # controller permission to go green
         self.other_group_requests_end_green = False #This is for rest greens
 
-        # Priority levels for requests and extensions
-        self.own_request_level = 2
-        self.other_request_level = 2
+        # Priority requests of this and the conflicting groups, by source
+        self.own_requests = PriorityRequests()
+        self.other_requests = PriorityRequests()
     
         # External objects to be connected later
         self._extender = None # Extender sets this
         self.e3extender = None # DBIK240803 added
         self._stat_logger = None # set outside
 
-        # Substates
+        # Substates, these hold the timers and parameters of the nested states
         # For fixed we always use the min as time
         self.fixed_amber = FixedTime(self.system_timer, self, min_length=grp_conf['min_amber'])
         self.fixed_amber_red = FixedTime(self.system_timer, self, min_length=grp_conf['min_amber_red'])
@@ -163,55 +351,11 @@ class SignalGroup(Machine):
         # fixed_red = FixedTime(self.system_timer, self, min_length=grp_conf['min_red'])
         self.group_based_red = GroupBasedRed(self.system_timer, self, min_length=grp_conf['min_red'])
 
-
-        states = [
-            State(name='Start'),
-            #State(name='Red', on_enter='start_red'),
-            {'name': 'Red', 'on_enter': self.start_red_cb, 'children':self.group_based_red},
-            {'name': 'AmberRed', 'children':self.fixed_amber_red},
-            {'name': 'Green', 'on_enter': self.start_green_cb, 'children':self.va_green},
-            {'name': 'Amber', 'on_enter': self.start_amber_cb, 'children':self.fixed_amber}
-            ]
-        transitions = [
-            {
-                'trigger': 'next_state',
-                'source': 'Start',
-                'dest': 'Red_Init'
-            },
-            {
-                'trigger': 'next_state',
-                'source': 'Red_Exit',
-                'dest': 'AmberRed_Init'
-            },
-
-            {
-                'trigger': 'next_state',
-                'source': 'AmberRed_Exit',
-                'dest': 'Green_Init'
-            },
-            {
-                'trigger': 'next_state',
-                'source': 'Green_Exit',
-                'dest': 'Amber_Init'
-            },
-
-            {
-                'trigger': 'next_state',
-                'source': 'Amber_Exit',
-                'dest': 'Red_Init'
-            }
-        ]
-        initial = 'Start'
-
-        # Note, this deorates this object by passing self...
-        Machine.__init__(
-            self,
-            name=name,
-            states=states,
-            transitions=transitions,
-            initial=initial,
-            auto_transitions=False
-            )
+        # Note, this decorates this object with the state and the triggers
+        if machine is None:
+            machine = GroupMachine()
+        self.machine = machine
+        machine.add_model(self)
 
         self.next_state() # This will trigger the Start->Red
 
@@ -284,28 +428,31 @@ class SignalGroup(Machine):
         ret += '  Delaying: {}'.format(self.delaying_groups)  # DBIK231209
         return ret
 
+    @property
+    def substate(self):
+        """Current composite state as an integer code"""
+        return SUBSTATE_CODES[self.state]
+
+    def in_states(self, mask):
+        """True if the current state is one of the states in the bitmask"""
+        return bool(SUBSTATE_BITS[self.state] & mask)
+
+    def state_changed(self, prev_mask, mask):
+        """True if the previous state (saved by the controller) and the current state are in the bitmasks"""
+        return bool(SUBSTATE_BITS[self.prev_state] & prev_mask) and self.in_states(mask)
+
     def get_grp_state(self):
         """Returns status (char) of the group in 'traditional' format"""
-        grp_statuses = {
-            'Red_MinimumTime': 'a',
-            'Red_CanEnd': 'b',
-            'Red_ForceGreen': 'f',
-            'Red_WaitIntergreen': 'g',
-            'AmberRed_MinimumTime': '0',
-            'Green_MinimumTime': '1',
-            'Green_Extending': '5',
-            'Green_RemainGreen': '4',
-            'Amber_MinimumTime': '>'     
-        }
-        status = grp_statuses.get(self.state, '*')
+        status = GRP_STATUS_CHARS[SUBSTATE_CODES[self.state]]
 
         # Should be own state
-        if status in ['b'] and self.grp_conf['request_type'] == 'fixed':
-            status = 'C' # FIX ME
-        if status in ['b'] and self.request_green:
-            status = 'c'
-        if status in ['b'] and self.permit_green:
-            status = 'e' 
+        if status == 'b':
+            if self.grp_conf['request_type'] == 'fixed':
+                status = 'C' # FIX ME
+            elif self.request_green:
+                status = 'c'
+            elif self.permit_green:
+                status = 'e' 
 
         return status
 
@@ -314,17 +461,7 @@ class SignalGroup(Machine):
     def get_sumo_state(self):
         """Returns status in sumo format (char)"""
         # Note: this is not correct mapping
-
-        # Note: assumed the state names to be separated by _
-        parent_state = self.state.split('_')[0]
-
-        sumo_statuses = {
-            'Red': 'r',
-            'Green': 'g',
-            'Amber': 'y',
-            'AmberRed': 'u'
-        }
-        return sumo_statuses[parent_state]
+        return SUMO_STATUS_CHARS[SUBSTATE_CODES[self.state]]
 
 
     def get_params(self):
@@ -463,6 +600,30 @@ class SignalGroup(Machine):
                     grp._request_green = False
 
 
+    # DBIK241029 Priority request levels, default 2
+    @property
+    def own_request_level(self):
+        """Highest active priority request level of this group"""
+        return self.own_requests.level
+
+    @property
+    def other_request_level(self):
+        """Highest active priority request level of the conflicting groups"""
+        return self.other_requests.level
+
+    def add_priority_request(self, source, level):
+        """Sets a priority request for this group and the conflicting groups"""
+        self.own_requests.add(source, level)
+        for confgrp in self.conflicting_groups:
+            confgrp['group'].other_requests.add((self, source), level)
+
+    def clear_priority_requests(self):
+        """Priority requests served, removed from this and the conflicting groups"""
+        for source in self.own_requests.sources:
+            for confgrp in self.conflicting_groups:
+                confgrp['group'].other_requests.discard((self, source))
+        self.own_requests.clear()
+
     @property
     def permit_green(self):
         """True if controller has given permission for green"""
@@ -499,7 +660,7 @@ class SignalGroup(Machine):
     # DBIK 20230915 Check if any non-conflicting group is active
     def any_nonconflicting_green_active(self,nfg):
         for nfg in self.non_conflicting_groups:
-            if nfg['group'].state in ['Red_ForceGreen','Red_WaitIntergreen','AmberRed_MinimumTime','Green_MinimumTime', 'Green_Extending']:
+            if nfg['group'].in_states(BLOCKING_STATES):
                return True
         return False
 
@@ -508,16 +669,16 @@ class SignalGroup(Machine):
     def can_conflicting_greens_terminated(self):
         """We ask if all conflicting greens can be terminated"""
         for grp in self.conflicting_groups:
-            if grp['group'].state in ['Green_Extending']:
+            if grp['group'].substate == Substate.GREEN_EXTENDING:
                grp['group'].other_group_requests_end_green = True  # Set the request
-            if grp['group'].state in ['Green_RemainGreen']:
+            if grp['group'].substate == Substate.GREEN_REMAINGREEN:
                if not(self.any_nonconflicting_green_active(grp)):
                   grp['group'].other_group_requests_end_green = True  # Set the request
                else:
                   grp['group'].other_group_requests_end_green = False  # Don't set the request
 
         for grp in self.conflicting_groups:
-            if grp['group'].state in ['Red_ForceGreen','Red_WaitIntergreen','AmberRed_MinimumTime','Green_MinimumTime','Green_Extending']:
+            if grp['group'].in_states(BLOCKING_STATES):
                 return False  # Set the return value
         return True
         
@@ -606,25 +767,12 @@ class SignalGroup(Machine):
         """Returns true if group is in red state and not going green
             i.e. the group is Amber, MinRed, CanEnd or ForceGreen
         """
-        isred = False
-        par_st = self.state.split('_')[0] # parent state
-        # going red ->  red
-        if par_st == 'Amber':
-            return True
-        
-        # Red and not transitin to other state -> is red  'DBIK Red_ForceGreen' included 13.3.23
-        if self.state in ['Red_Init', 'Red_MinimumTime', 'Red_CanEnd', 'Red_ForceGreen']: 
-            isred = True
-        #print("isred:", isred)
-        return isred
+        # going red ->  red, 'DBIK Red_ForceGreen' included 13.3.23
+        return self.in_states(STAYING_RED_STATES)
 
     def group_green(self):
         """Returns true if group is in green state"""
-        par_st = self.state.split('_')[0]
-        if par_st == 'Green':
-            return True
-        else:
-            return False
+        return self.in_states(GREEN_STATES)
 
 
     def group_on(self):
@@ -632,11 +780,7 @@ class SignalGroup(Machine):
         1) green,
         2) going green (AmberRed) or
         3) ending green (Amber)"""
-        par_st = self.state.split('_')[0]
-        is_on = par_st in ('Green', 'Amber', 'AmberRed')
-
-        # is_on = self.is_Green or self.is_Amber or self.is_AmberRed
-        return is_on
+        return self.in_states(ON_STATES)
 
     def group_main_state_changed(self,newstate,curstate,prevstate):
         cur_st = curstate.split('_')[0]
@@ -659,34 +803,25 @@ class SignalGroup(Machine):
         1) green or
         2) going green (Amber)
         """
-        par_st = self.state.split('_')[0]
-        is_on = par_st in ('Green', 'Amber')
-
-        # is_on = self.is_Green or self.is_Amber or self.is_AmberRed
-        return is_on
+        return self.in_states(GREEN_OR_AMBER_STATES)
     
     def group_red_started(self):
         """Returns true if red signal has started"""
-        
-        is_started = False
-        if self.state in ['Red_MinimumTime']: #  and self.prev_state in ['Amber']:
-            is_started = True
-
-        return is_started
+        return self.substate == Substate.RED_MINIMUMTIME
 
     #
     # Controller conditions query these
     #
     def is_in_phase_min_time(self):
-        if self.state in ['Red_WaitIntergreen','AmberRed_MinimumTime'] or \
-           ((self.state in ['Green_MinimumTime','Green_Extending','Green_RemainGreen']) and 
+        if self.in_states(STARTING_STATES) or \
+           (self.in_states(ACTIVE_GREEN_STATES) and 
            (self.system_timer.seconds - self.green_started_at < 3.0)):
             return True
         return False
     
     def phase_min_time_reached2(self):
         phasetime = self.system_timer.seconds - self.phase_started_at
-        if (self.state in ['Green_MinimumTime','Green_Extending','Green_RemainGreen']) and (phasetime > 3.0):
+        if self.in_states(ACTIVE_GREEN_STATES) and (phasetime > 3.0):
             return phasetime
         return 0.0
     
@@ -696,7 +831,7 @@ class SignalGroup(Machine):
         else:
             phasetime = self.system_timer.seconds - self.phase_started_at
 
-        if (self.state in ['Green_MinimumTime','Green_Extending','Green_RemainGreen']) and (phasetime > 3.0):
+        if self.in_states(ACTIVE_GREEN_STATES) and (phasetime > 3.0):
             return phasetime
         return 0.0
 
@@ -706,10 +841,7 @@ class SignalGroup(Machine):
             That is: we are extending or remain green
         """
         # DBIK20231013 The start of MinGreen is detected by the current state and the previous state
-        if self.prev_state in ['Any'] and self.state in ['Green_MinimumTime']: # DBIK241107 
-            return True
-        else:
-            return False
+        return self.state_changed(ANY_STATES, MIN_GREEN_STARTED_STATES) # DBIK241107 
 
     def min_green_end(self):
         """
@@ -717,33 +849,21 @@ class SignalGroup(Machine):
             That is: we are extending or remain green
         """
         # DBIK20231013 The End of MinGreen is detected by state current state and the previous state
-        if self.prev_state in ['Any'] and self.state in ['Green_Extending','Green_RemainGreen']: # DBIK20231013 
-            return True
-        else:
-            return False
+        return self.state_changed(ANY_STATES, MIN_GREEN_ENDED_STATES) # DBIK20231013 
 
     def is_in_min_green(self):
         """True if group is in min green"""
         # if self.state=='Green_MinimumTime':
-        if self.state in ['Red_WaitIntergreen','AmberRed_MinimumTime','Green_MinimumTime']:
-            return True
-        else:
-            return False
+        return self.in_states(MIN_GREEN_STATES)
         
     def is_not_in_min_green(self):
         """True if group is in min green"""
-        if self.state!='Green_MinimumTime':
-            return True
-        else:
-            return False
+        return self.substate != Substate.GREEN_MINIMUMTIME
         
     # DBIK231129 New function for detecting if a green signal is starting  
     def is_starting(self):
         """True if group if the group has started transition to green"""
-        if self.state in ['Red_WaitIntergreen','AmberRed_MinimumTime']:
-            return True
-        else:
-            return False
+        return self.in_states(STARTING_STATES)
 
         
 
@@ -753,12 +873,9 @@ class SignalGroup(Machine):
             Returns true if green after active green
             That is: we are in remain green, yellow, minred, redreq
         """
-        if self.state in ['Green_RemainGreen','Amber_MinimumTime', 'Red_MinimumTime', 'Red_CanEnd']:
         # DBIK20231016 Looking for a given change of state, not state 
         # if self.prev_state in ['Green_MinimumTime','Green_Extending'] and self.state in ['Green_RemainGreen']: # DBIK20231016     
-            return True
-        else:
-            return False
+        return self.in_states(ACTIVE_GREEN_PASSED_STATES)
         
     # DBIK231127 New function for detecting if all conflicting active green has been paased    
     def conflicting_active_green_passed(self):
@@ -768,7 +885,7 @@ class SignalGroup(Machine):
         """
         active_conf_greens_passed = True
         for grp in self.conflicting_groups:
-            if not grp['group'].state in ['Green_RemainGreen','Amber_MinimumTime', 'Red_MinimumTime', 'Red_CanEnd']:
+            if not grp['group'].in_states(ACTIVE_GREEN_PASSED_STATES):
                 active_conf_greens_passed = False  # Found one conflicting active green signal
         return active_conf_greens_passed  
     
@@ -781,8 +898,12 @@ class SignalGroup(Machine):
             grp['group'].permit_green = False  # Found one conflicting active green
     
     
-class FixedTime(Machine):
-    """Fixed time state machine"""
+class FixedTime:
+    """Fixed time substate
+
+    The states and transitions are nested into the GroupMachine, this object
+    only holds the timer and parameters of one group.
+    """
 
     def __init__(self, system_timer, group, min_length):
         self.group = group
@@ -790,12 +911,18 @@ class FixedTime(Machine):
         self.min_length = min_length  # Seconds
         self.min_started_at = 0
 
-        states = [
-            {'name': 'Init', 'on_enter': self.init_start_cb},
-            {'name': 'MinimumTime', 'on_enter': self.min_start_cb},
-            {'name': 'Exit', 'on_enter': self.exit_start_cb}
+    @classmethod
+    def get_states(cls, path):
+        """Returns the states, path is the attribute of the substate in the group"""
+        return [
+            {'name': 'Init', 'on_enter': path + '.init_start_cb'},
+            {'name': 'MinimumTime', 'on_enter': path + '.min_start_cb'},
+            {'name': 'Exit', 'on_enter': path + '.exit_start_cb'}
             ]
-        transitions = [
+
+    @classmethod
+    def get_transitions(cls, path):
+        return [
             {
                 'trigger': 'next_state',
                 'source': 'Init',
@@ -805,19 +932,15 @@ class FixedTime(Machine):
                 'trigger': 'next_state',
                 'source': 'MinimumTime',
                 'dest': 'Exit',
-                'conditions': [self.min_time_passed]
+                'conditions': [path + '.min_time_passed']
             }
         ]
-        initial = 'Init'
-        # Note, this deorates this object by passing self...
-        Machine.__init__(
-            self,
-            states=states,
-            transitions=transitions,
-            initial=initial,
-            auto_transitions=False
-            )
 
+    @classmethod
+    def as_state(cls, name, path, **kwargs):
+        """Returns the nested state for the group machine"""
+        return dict(name=name, children=cls.get_states(path), transitions=cls.get_transitions(path),
+                    initial='Init', **kwargs)
 
 
     # conditions
@@ -843,8 +966,6 @@ class FixedTime(Machine):
             self.min_started_at = self.system_timer.seconds
         #if self.group.stat_logger:
         #    self.group.stat_logger.add_data(self.group, self.group.state)
-        if self.group.instant_transfer:
-            self.next_state() #group?
 
     def exit_start_cb(self):
         if self.group.stat_logger:
@@ -859,7 +980,7 @@ class FixedTime(Machine):
     def init_start_cb(self):
         #pass
         # FIX ME, should be in va_green....
-        if self.group.state == 'Green_Init':
+        if self.group.substate == Substate.GREEN_INIT:
             self.group.request_green = False  # requests have been given green
         if self.group.stat_logger:
             self.group.stat_logger.add_data(self.group, self.group.state)
@@ -880,79 +1001,84 @@ class VehicleActuated(FixedTime):
         self.max_length = max_length
         self.green_end = green_end # Modes: after_ext, remain
 
-
-        # We don't go to exit without extension
-        self.remove_transition(trigger='next_state', dest='Exit')
-
-
+    @classmethod
+    def get_states(cls, path):
+        states = super().get_states(path)
         # WARNING: I have no idea why state callback is never executed
         # This is not in transition instead, would be:
-        #self.add_state('Extending', on_enter=self.extension_start_cb)
-        self.add_state('Extending')
-        self.add_state('RemainGreen')
+        #states.append({'name': 'Extending', 'on_enter': path + '.extension_start_cb'})
+        states.append({'name': 'Extending'})
+        states.append({'name': 'RemainGreen'})
+        return states
+
+    @classmethod
+    def get_transitions(cls, path):
+        transitions = super().get_transitions(path)
+        # We don't go to exit without extension
+        transitions = [t for t in transitions if t['dest'] != 'Exit']
 
         # After minimim, we always go to extending state
-        self.add_transition(trigger='next_state',
-                            source='MinimumTime',
-                            dest='Extending',
-                            conditions=[self.min_time_passed],
-                            after=self.extension_start_cb,
-                            )
+        transitions.append(dict(trigger='next_state',
+                                source='MinimumTime',
+                                dest='Extending',
+                                conditions=[path + '.min_time_passed'],
+                                after=path + '.extension_start_cb',
+                                ))
         # Extending stops at green end at:
         # 1) end of extensions AND after_ext set OR
         # 2) passing of maximum time
-        self.add_transition(trigger='next_state',
-                            source='Extending',
-                            dest='Exit',
-                            conditions=[self.external_not_extending, self.terminate_after_ext_mode],
-                            )
+        transitions.append(dict(trigger='next_state',
+                                source='Extending',
+                                dest='Exit',
+                                conditions=[path + '.external_not_extending', path + '.terminate_after_ext_mode'],
+                                ))
         # Extension can go to RemainGreen state if remain set and no extensions end
-        self.add_transition(trigger='next_state',
-                            source='Extending',
-                            dest='RemainGreen',
-                            conditions=[self.external_not_extending, self.remain_green_mode]  
-                            )
+        transitions.append(dict(trigger='next_state',
+                                source='Extending',
+                                dest='RemainGreen',
+                                conditions=[path + '.external_not_extending', path + '.remain_green_mode']  
+                                ))
         
         # Extension can go to RemainGreen state if remain set and priority request end
-        self.add_transition(trigger='next_state',
-                            source='Extending',
-                            dest='RemainGreen',
-                            conditions=[self.other_group_request_priority, self.remain_green_mode]  # DBIK241029 add new transition condition for priority request 
-                            )
+        transitions.append(dict(trigger='next_state',
+                                source='Extending',
+                                dest='RemainGreen',
+                                conditions=[path + '.other_group_request_priority', path + '.remain_green_mode']  # DBIK241029 add new transition condition for priority request 
+                                ))
         
         # Maximum time and no remain green -> exit
-        self.add_transition(trigger='next_state',
-                            source='Extending',
-                            dest='Exit',
-                            conditions=[self.max_time_passed, self.terminate_after_ext_mode],
-                            # conditions=[self.max_time_passed], # DBIK20231018 Mode is not affecting max time termination
-                            )
+        transitions.append(dict(trigger='next_state',
+                                source='Extending',
+                                dest='Exit',
+                                conditions=[path + '.max_time_passed', path + '.terminate_after_ext_mode'],
+                                # conditions=[path + '.max_time_passed'], # DBIK20231018 Mode is not affecting max time termination
+                                ))
         # Maximum time but there is remain green -> RemainGreen
-        self.add_transition(trigger='next_state',
-                            source='Extending',
-                            dest='RemainGreen',
-                            conditions=[self.max_time_passed, self.remain_green_mode],
-                            )
+        transitions.append(dict(trigger='next_state',
+                                source='Extending',
+                                dest='RemainGreen',
+                                conditions=[path + '.max_time_passed', path + '.remain_green_mode'],
+                                ))
                 
         # Remain green go back to to Extending if EXT=ON // DBIK 12.4.23
-        self.add_transition(trigger='next_state',
-                            source='RemainGreen',
-                            dest='Extending',
-                            # conditions=[self.external_extending]
-                            conditions=[self.external_extending, self.extension_repetitive] # DBIK20231018 We should add one shot mode extension mode
-                            )
+        transitions.append(dict(trigger='next_state',
+                                source='RemainGreen',
+                                dest='Extending',
+                                # conditions=[path + '.external_extending']
+                                conditions=[path + '.external_extending', path + '.extension_repetitive'] # DBIK20231018 We should add one shot mode extension mode
+                                ))
 
 
         # Remain green ends if any conflicting signal group has request // DBIK 7.9.23
         # TO BE FIXED, do not terminate signal group if is not in conflict currently active green" DBIK 7.9.23
-        self.add_transition(trigger='next_state',
-                            source='RemainGreen',
-                            dest='Exit',
-                            conditions=[self.other_group_requests_end_green]
-                            )
+        transitions.append(dict(trigger='next_state',
+                                source='RemainGreen',
+                                dest='Exit',
+                                conditions=[path + '.other_group_requests_end_green']
+                                ))
 
         # Note: One should check the order of applying the transfers?
-
+        return transitions
 
 
     # Conditional: external extension
@@ -1012,65 +1138,74 @@ class GroupBasedRed(FixedTime):
         self.system_timer = system_timer
         self.group = group
         self.min_length = min_length
-        
-        # After minimum red, new states will be added this tranfer should
-        # not happen
-        self.remove_transition(trigger='next_state', dest='Exit')
 
+    @classmethod
+    def get_states(cls, path):
+        states = super().get_states(path)
         # in this state we can end the red, however, we wait for
         # 1) Request and 2) Permission
         # This refers to B, C or E in trad controller (depending on req)
-        self.add_state('CanEnd')
+        states.append({'name': 'CanEnd'})
         # At this phase the group tries to force conflict groups to go green
         # This refers to F in trad contoller
-        self.add_state('ForceGreen')
+        states.append({'name': 'ForceGreen'})
 
         # All conflicts are enging or ended their green, however, 
         # We still have to wait for intergreens to have passed
         # This refers to G green in trad controller
-        self.add_state('WaitIntergreen')
-        
+        states.append({'name': 'WaitIntergreen'})
+        return states
+
+    @classmethod
+    def get_transitions(cls, path):
+        """The conditions without path are methods of the group"""
+        transitions = super().get_transitions(path)
+        # After minimum red, new states will be added this tranfer should
+        # not happen
+        transitions = [t for t in transitions if t['dest'] != 'Exit']
+
         # After min red has passed -> we can end this red
-        self.add_transition(trigger='next_state',
-                            source='MinimumTime',
-                            dest='CanEnd',
-                            conditions=[self.min_time_passed],
-                            after=self.can_start_cb
-                            )
+        transitions.append(dict(trigger='next_state',
+                                source='MinimumTime',
+                                dest='CanEnd',
+                                conditions=[path + '.min_time_passed'],
+                                after=path + '.can_start_cb'
+                                ))
 
         # if we have request and permisison -> we try to end conflicting greens
-        #self.add_transition(trigger='next_state',
-        #                    source='CanEnd',
-        #                    dest='ForceGreen',
-        #                    conditions=[self.group.has_green_request, self.group.has_green_permission],
-        #                    after=self.force_green_cb
-        #                    )
+        #transitions.append(dict(trigger='next_state',
+        #                        source='CanEnd',
+        #                        dest='ForceGreen',
+        #                        conditions=['has_green_request', 'has_green_permission'],
+        #                        after=path + '.force_green_cb'
+        #                        ))
         
         # DBIK230911 Callback function shifted into transition condition called at every uodate
-        self.add_transition(trigger='next_state',
-                            source='CanEnd',
-                            dest='ForceGreen',
-                            conditions=[self.group.has_green_request, self.group.has_green_permission],  # self.group.can_conflicting_greens_terminated  DBIK230920 Next phase started too early, previous phase not fully served   
-                            # conditions=[self.group.has_green_request, self.group.has_green_permission],  # DBIK230920 Get stucked into the f-state                    
-                            after=self.force_green_cb  # DBIK 20231010 Test move Force Green to IG
-                            )
+        transitions.append(dict(trigger='next_state',
+                                source='CanEnd',
+                                dest='ForceGreen',
+                                conditions=['has_green_request', 'has_green_permission'],  # 'can_conflicting_greens_terminated'  DBIK230920 Next phase started too early, previous phase not fully served   
+                                # conditions=['has_green_request', 'has_green_permission'],  # DBIK230920 Get stucked into the f-state                    
+                                after=path + '.force_green_cb'  # DBIK 20231010 Test move Force Green to IG
+                                ))
 
         # all conflicts red -> we wait for intergreens (if any)
-        self.add_transition(trigger='next_state',
-                            source='ForceGreen',
-                            dest='WaitIntergreen',
-                            conditions=[self.group.all_conflicts_red],
-                            after=self.wait_intergreen_cb  # DBIK 20231010 Test move Force Green to IG
-                            )
+        transitions.append(dict(trigger='next_state',
+                                source='ForceGreen',
+                                dest='WaitIntergreen',
+                                conditions=['all_conflicts_red'],
+                                after=path + '.wait_intergreen_cb'  # DBIK 20231010 Test move Force Green to IG
+                                ))
 
         # all conflicts red -> we wait for intergreens (if any)
-        self.add_transition(trigger='next_state',
-                            source='WaitIntergreen',
-                            dest='Exit',
-                            # conditions=[self.group.intergreens_passed,self.group.start_delay_passed],
-                            conditions=[self.group.intergreens_passed],
-                            after=self.exit_start_cb
-                            )
+        transitions.append(dict(trigger='next_state',
+                                source='WaitIntergreen',
+                                dest='Exit',
+                                # conditions=['intergreens_passed', 'start_delay_passed'],
+                                conditions=['intergreens_passed'],
+                                after=path + '.exit_start_cb'
+                                ))
+        return transitions
 
 
     #callbacks
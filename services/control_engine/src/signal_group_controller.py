@@ -21,16 +21,29 @@ Design principles:
 
 #from transitions.extensions import GraphMachine as Machine
 from transitions import Machine as Machine
-from confread import GlobalConf # For testing
 import pandas as pd
 
-from signal_group import SignalGroup
-from signal_group import value_is_number # Should be in utils unit or something
-from timer import Timer
-from stats import StatLogger
-from detector import Detector, ExtDetector, GrpDetector, e3Detector
-from extender import Extender, StaticExtender, e3Extender
-from lane import Lane
+# Flat imports when run as a script, relative when imported as a package (tests)
+if __package__:
+    from .confread import GlobalConf # For testing
+    from .signal_group import GroupMachine, SignalGroup, Substate
+    from .signal_group import value_is_number # Should be in utils unit or something
+    from .timer import Timer
+    from .stats import StatLogger
+    from .detector import Detector, ExtDetector, GrpDetector, e3Detector
+    from .extender import Extender, StaticExtender, e3Extender
+    from .lane import Lane
+    from .input_buffer import ControllerInputBuffer
+else:
+    from confread import GlobalConf # For testing
+    from signal_group import GroupMachine, SignalGroup, Substate
+    from signal_group import value_is_number # Should be in utils unit or something
+    from timer import Timer
+    from stats import StatLogger
+    from detector import Detector, ExtDetector, GrpDetector, e3Detector
+    from extender import Extender, StaticExtender, e3Extender
+    from lane import Lane
+    from input_buffer import ControllerInputBuffer
 import sys
 import json
 
@@ -234,6 +247,9 @@ class PhaseRingController:
         self.timer = timer
         # Stat logger?
 
+        # Inbound messages are buffered here and applied at the start of tick
+        self.input_buffer = ControllerInputBuffer()
+
         #phase_ring will be tuple of tuples
         new_phases = []
         for conf_phase in conf['phases']:
@@ -263,10 +279,12 @@ class PhaseRingController:
 
         groups = []
         controller_index = 0
+        group_machine = GroupMachine() # The groups share the states and transitions
         for group_id in self.group_list:
             controller_index += 1 # Note: indexing starts from 1
             conf_vals = conf['signal_groups'][group_id]
-            new_group = SignalGroup(self.timer, group_id, conf_vals, controller_index=controller_index)
+            new_group = SignalGroup(self.timer, group_id, conf_vals, controller_index=controller_index,
+                                    machine=group_machine)
             #new_group.stat_logger = self.stat_logger
             groups.append(new_group)
         self.groups = tuple(groups)
@@ -404,6 +422,9 @@ class PhaseRingController:
         """This is the clocking function moving the group states and system timer
         And in effect the phasing (timing depenmds on group operations)"""
 
+        # Detector and request messages received since the last tick
+        self.input_buffer.apply()
+
         # extension is based on this
         for det in self.ext_dets:
             det.tick()  # testing git branch 3
@@ -495,10 +516,8 @@ class PhaseRingController:
         for grp in self.groups:
                 if grp.is_in_min_green():
                     grp.permit_green = False
-                    if grp.own_request_level > 2: 
-                        grp.own_request_level = 2   #DBIK241030 Reset priority request
-                        for confgrp in grp.conflicting_groups:
-                            confgrp['group'].other_request_level = 2  #DBIK241107 Reset conflict group priority request
+                    if grp.own_requests: 
+                        grp.clear_priority_requests()   #DBIK241030 Reset priority request, also from conflict groups
                 
         if self.next_main_phase:
             if self.next_main_phase.phase_has_started(): 
@@ -530,28 +549,10 @@ class PhaseRingController:
             if self.next_main_phase:
                 self.next_main_phase.set_signalgroup_green_permissions(do_permit=True)
         
-        MultiPrio = False
-        if MultiPrio:
-            for grp in self.groups:
-                    if grp.min_green_start: # DBIK241107 State shift, under testing 
-                        grp.permit_green = False
-                        grp.own_request_level = 2   #DBIK241030 Reset priority request
-                        for confgrp in grp.conflicting_groups:
-                            OtherPrioReq = 2
-                            for conf2grp in confgrp.conflicting_groups: # DBIK241119 Check if there are other active priority requests
-                                if conf2grp.own_request_level > 2:
-                                    OtherPrioReq = conf2grp.own_request_level
-                            confgrp['group'].other_request_level = OtherPrioReq  #DBIK241107 Reset conflict group priority request
-        else:
-            for grp in self.groups:
-                if grp.min_green_start: # DBIK241107 State shift, under testing 
-                    grp.permit_green = False
-                    grp.own_request_level = 2   #DBIK241030 Reset priority request
-                    for confgrp in grp.conflicting_groups:
-                        confgrp['group'].other_request_level = 2  #DBIK241107 Reset conflict group priority request
-          
-            
-
+        for grp in self.groups:
+            if grp.min_green_start(): # DBIK241107 State shift, under testing 
+                grp.permit_green = False
+                grp.clear_priority_requests()   #DBIK241030 Reset priority request, also from conflict groups
 
         if self.next_main_phase:
             if self.next_main_phase.phase_has_started(): 
@@ -763,7 +764,7 @@ class PhaseRingController:
             for grp in self.groups:
                 grpno += 1
                 if grp.e3extender:                   
-                    if grp.get_grp_state() in ['5']:
+                    if grp.substate == Substate.GREEN_EXTENDING:
                         val1 = grp.e3extender.vehcount
                         if grp.e3extender.ext_mode == 1:
                             val2 = 1.0
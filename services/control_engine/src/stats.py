@@ -13,11 +13,16 @@ for clockwork_tc
 
 
 import pandas as pd
-from signal_group import SignalGroup
 
-# just for debug
-from confread import GlobalConf
-from timer import Timer
+# Flat imports when run as a script, relative when imported as a package (tests)
+if __package__:
+    from .signal_group import SignalGroup
+    from .confread import GlobalConf # just for debug
+    from .timer import Timer
+else:
+    from signal_group import SignalGroup
+    from confread import GlobalConf # just for debug
+    from timer import Timer
 
 def main():
     timer=Timer(0.1)
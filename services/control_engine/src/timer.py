@@ -86,5 +86,37 @@ class Timer():
     def seconds(self, new_seconds):
         # Sets _steps_ to closest second value
         self.steps = round(new_seconds/self.time_step,5)  # one might consider flooring?
+
+
+class VirtualTimer(Timer):
+    """Timer not bound to the wall clock, for running the controller as fast as possible
+    Real time is the simulated time, i.e. there is no time drift"""
+    def __init__(self, timer_prm):
+        super().__init__(timer_prm)
+        self.start_rtime = 0.0
+        self.cur_rtime = 0.0
+        self.last_update = 0.0
+
+    def reset(self):
+        """Starts the timer from zero"""
+        self.steps = 0
+        self.cur_rtime = 0.0
+
+    def tick(self):
+        """One time step forward"""
+        self.steps += 1
+        self.cur_rtime = self.steps * self.time_step
+
+    def sleep_tick(self):
+        pass
+
+    def get_time_since_last_update(self):
+        return self.time_step
+
+    def reset_time_step(self):
+        self.aggregate_time_drift = 0.0
+
+    def get_next_time_step(self):
+        return 0.0
        
     
\ No newline at end of file
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""The synthetic traffic generator.
+
+This module drives the controller detectors without a simulation model. The
+vehicles arrive to every signal group (approach) with a given demand, queue at
+the stop line and are discharged at the saturation flow when the group is
+green. The request and extension detectors see the arrivals as pulses and the
+e3-detectors get the list of vehicles on the approach.
+
+Together with the VirtualTimer this is used for load testing and tuning the
+controller configurations. Run from the repository root, for example:
+
+    python services/control_engine/src/traffic_generator.py --conf-file models/test/simple/contr.json
+
+"""
+# Copyright 2025 by Conveqs Oy and Kari Koskinen
+# All Rights Reserved
+#
+import argparse
+import contextlib
+import io
+import json
+import time
+
+import numpy as np
+
+# Flat imports when run as a script, relative when imported as a package (tests)
+if __package__:
+    from .confread import GlobalConf
+    from .signal_group_controller import PhaseRingController
+    from .timer import VirtualTimer
+else:
+    from confread import GlobalConf
+    from signal_group_controller import PhaseRingController
+    from timer import VirtualTimer
+
+DEFAULT_CONF_FILE = "models/test/simple/contr.json"
+DEFAULT_SIM_TIME = 3600 # seconds
+
+DEFAULT_DEMAND = 300.0          # veh/h per approach
+DEFAULT_SATURATION_FLOW = 1800.0  # veh/h of green
+DEFAULT_PLATOON_SIZE = 4.0      # mean vehicles per platoon
+DEFAULT_OCCUPANCY_TIME = 0.5    # seconds a passing vehicle occupies a loop
+DEFAULT_E3_INTERVAL = 1.0       # seconds between e3 vehicle list updates
+DEFAULT_APPROACH_SPEED = 10.0   # m/s, speed of the vehicles not queuing
+DEFAULT_VTYPE_MIX = {"car_type": 0.9, "truck_type": 0.1}
+
+
+class TrafficGenerator:
+    """Generates arrivals and queues for all the groups of a controller
+        gen_conf:
+            arrivals: 'poisson' or 'platoon'
+            demand: veh/h per group, or a dict of group name -> veh/h
+            vtype_mix: dict of vehicle type -> share
+            saturation_flow, platoon_size, occupancy_time, e3_interval, seed
+    """
+
+    def __init__(self, controller, timer, gen_conf=None):
+        if gen_conf is None:
+            gen_conf = {}
+        self.controller = controller
+        self.timer = timer
+        self.rng = np.random.default_rng(gen_conf.get("seed"))
+
+        self.groups = controller.groups
+        self.group_index = {grp.group_name: i for i, grp in enumerate(self.groups)}
+        n = len(self.groups)
+
+        demand = gen_conf.get("demand", DEFAULT_DEMAND)
+        if isinstance(demand, dict):
+            self.demand = np.array([demand.get(grp.group_name, 0.0) for grp in self.groups], dtype=float)
+        else:
+            self.demand = np.full(n, float(demand))
+
+        self.arrival_mode = gen_conf.get("arrivals", "poisson")
+        if self.arrival_mode not in ("poisson", "platoon"):
+            raise ValueError("Unknown arrival mode: {}".format(self.arrival_mode))
+        self.platoon_size = float(gen_conf.get("platoon_size", DEFAULT_PLATOON_SIZE))
+        self.saturation_flow = float(gen_conf.get("saturation_flow", DEFAULT_SATURATION_FLOW))
+        self.occupancy_time = gen_conf.get("occupancy_time", DEFAULT_OCCUPANCY_TIME)
+        self.e3_interval = gen_conf.get("e3_interval", DEFAULT_E3_INTERVAL)
+
+        vtype_mix = gen_conf.get("vtype_mix", DEFAULT_VTYPE_MIX)
+        self.vtypes = list(vtype_mix)
+        shares = np.array([vtype_mix[vt] for vt in self.vtypes], dtype=float)
+        self.vtype_shares = shares / shares.sum()
+
+        # Per approach state
+        self.queue = np.zeros(n, dtype=np.int64)
+        self.discharge_credit = np.zeros(n)
+        self.last_arrival = np.full(n, -np.inf)
+        self.last_departure = np.full(n, -np.inf)
+        self.vehicles = [[] for _ in range(n)] # (vehid, vtype), only kept for e3 approaches
+        self.next_vehid = 0
+        self.next_e3_update = 0.0
+
+        # Statistics
+        self.arrived = 0
+        self.departed = 0
+        self.queue_seconds = 0.0 # Sum of queue lengths over time i.e. delay in veh*s
+
+        self.req_dets = self._dets_by_group(controller.req_dets, request=True)
+        self.ext_dets = self._dets_by_group(controller.ext_dets)
+        self.e3dets = self._dets_by_group(controller.e3detectors)
+        self.keep_vehicles = np.array([bool(dets) for dets in self.e3dets])
+
+    def _dets_by_group(self, dets, request=False):
+        """Returns the list of detectors for every group"""
+        by_group = [[] for _ in self.groups]
+        for det in dets:
+            if request:
+                names = [grp.group_name for grp in det.request_groups]
+            else:
+                names = [det.owngroup_name]
+            for name in names:
+                if name in self.group_index:
+                    by_group[self.group_index[name]].append(det)
+        return by_group
+
+    def _arrivals(self, time_step):
+        """Number of arrivals per approach in this time step"""
+        rates = self.demand / 3600.0 * time_step
+        if self.arrival_mode == "poisson":
+            return self.rng.poisson(rates)
+        # Platoons arrive as Poisson process, the size is 1 + Poisson
+        platoons = self.rng.poisson(rates / self.platoon_size)
+        extra = self.rng.poisson(platoons * (self.platoon_size - 1.0))
+        return platoons + extra
+
+    def _departures(self, green, time_step):
+        """Number of vehicles discharged per approach in this time step"""
+        self.discharge_credit = np.where(green, self.discharge_credit + self.saturation_flow / 3600.0 * time_step, 0.0)
+        departures = np.minimum(self.queue, np.floor(self.discharge_credit).astype(np.int64))
+        self.discharge_credit -= departures
+        return departures
+
+    def tick(self):
+        """Moves the traffic one time step forward, called before the controller tick"""
+        time_step = self.timer.time_step
+        now = self.timer.seconds
+        green = np.array([grp.group_green() for grp in self.groups], dtype=bool)
+
+        arrivals = self._arrivals(time_step)
+        departures = self._departures(green, time_step)
+        self.queue += arrivals - departures
+        self.arrived += int(arrivals.sum())
+        self.departed += int(departures.sum())
+        self.queue_seconds += float(self.queue.sum()) * time_step
+        self.last_arrival[arrivals > 0] = now
+        self.last_departure[departures > 0] = now
+
+        self._update_vehicles(arrivals, departures)
+        self._update_loops(now)
+        if now >= self.next_e3_update:
+            self.next_e3_update = now + self.e3_interval
+            self._update_e3(green)
+
+    def _update_vehicles(self, arrivals, departures):
+        """Keeps the vehicle lists of the approaches with e3-detectors"""
+        total = int(arrivals[self.keep_vehicles].sum())
+        if not total:
+            new_vtypes = []
+        else:
+            new_vtypes = self.rng.choice(self.vtypes, size=total, p=self.vtype_shares).tolist()
+        pos = 0
+        for i in np.flatnonzero(self.keep_vehicles):
+            vehicles = self.vehicles[i]
+            if departures[i]:
+                del vehicles[:departures[i]]
+            for _ in range(arrivals[i]):
+                vehicles.append(("gen{}".format(self.next_vehid), new_vtypes[pos]))
+                self.next_vehid += 1
+                pos += 1
+
+    def _update_loops(self, now):
+        """Request loops see arrivals and the standing queue, extension loops the passing vehicles"""
+        passing = (now - np.maximum(self.last_arrival, self.last_departure)) < self.occupancy_time
+        arriving = (now - self.last_arrival) < self.occupancy_time
+        standing = self.queue > 0
+        input_buffer = self.controller.input_buffer
+        for i, dets in enumerate(self.req_dets):
+            loop_on = bool(arriving[i] or standing[i])
+            for det in dets:
+                input_buffer.set_loop(det, loop_on)
+        for i, dets in enumerate(self.ext_dets):
+            loop_on = bool(passing[i])
+            for det in dets:
+                input_buffer.set_loop(det, loop_on)
+
+    def _update_e3(self, green):
+        """Sends the vehicle lists to the e3-detectors"""
+        for i, dets in enumerate(self.e3dets):
+            if not dets:
+                continue
+            speed = DEFAULT_APPROACH_SPEED if green[i] else 0.0
+            obj_list = {vehid: {"vtype": vtype, "speed": speed} for vehid, vtype in self.vehicles[i]}
+            for det in dets:
+                self.controller.input_buffer.set_e3_objects(det, obj_list)
+
+    def get_stats(self):
+        """Returns the generator statistics as dict"""
+        return {
+            "sim_time": self.timer.seconds,
+            "arrived": self.arrived,
+            "departed": self.departed,
+            "queue": int(self.queue.sum()),
+            "avg_delay": self.queue_seconds / self.departed if self.departed else 0.0,
+        }
+
+
+def run(cnf, sim_time, gen_conf=None):
+    """Runs the controller with generated traffic, returns the stats and the wall time used"""
+    with contextlib.redirect_stdout(io.StringIO()): # Config prints
+        timer = VirtualTimer(cnf["timer"])
+        controller = PhaseRingController(cnf["controller"], timer)
+    controller.print_status = False
+    generator = TrafficGenerator(controller, timer, gen_conf)
+    steps = int(sim_time / timer.time_step)
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        generator.tick()
+        controller.tick()
+        timer.tick()
+    wall_time = time.perf_counter() - start
+    return generator.get_stats(), wall_time
+
+
+def generator_conf(cnf, args):
+    """Returns the generator parameters of the configuration, the given arguments override them"""
+    gen_conf = dict(cnf.get("traffic_generator", {}))
+    for key in ("demand", "arrivals", "seed"):
+        value = getattr(args, key)
+        if value is not None:
+            gen_conf[key] = value
+    return gen_conf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a controller with synthetic traffic")
+    parser.add_argument("--conf-file", default=DEFAULT_CONF_FILE)
+    parser.add_argument("--sim-time", type=float, default=DEFAULT_SIM_TIME, help="Simulated seconds")
+    # Given arguments override the traffic_generator section of the configuration
+    parser.add_argument("--demand", type=float, help="veh/h per approach (default {})".format(DEFAULT_DEMAND))
+    parser.add_argument("--arrivals", choices=["poisson", "platoon"], help="Arrival process (default poisson)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    cnf = GlobalConf(filename=args.conf_file).cnf
+    gen_conf = generator_conf(cnf, args)
+
+    stats, wall_time = run(cnf, args.sim_time, gen_conf)
+    print(json.dumps(stats, indent=4))
+    print("Wall time: {:.2f} s, {:.0f} simulated seconds per second".format(
+        wall_time, stats["sim_time"] / wall_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+"""Columnar archive of the indicators inputs and outputs
+
+The radar objects, detector edges, group states and the view outputs are
+appended to fixed width record files, one directory per record kind and one
+file (segment) per segment_length seconds. The strings (stream, lane, view
+names etc.) are interned to integers in the strings.txt table of the archive.
+The object ids are not interned, there is no end to them: integer ids are
+stored as such and the others as 64-bit hashes (object_ids). The records are
+converted and written by a background thread, the event loop only puts the
+data into a bounded queue (dropped and counted when full).
+
+The segments are read with numpy.memmap, only the pages of the queried time
+range are read from the disk. The records of a segment are in time order, the
+time range is found with a binary search:
+
+    reader = ArchiveReader("archive")
+    objects = reader.read('view_objects', start, end, group='group11')
+    reader.decode(objects['vtype'])
+    tracked = reader.read('radar', start, end, id=270105)
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+SCHEMA_FILE = "schema.json"
+STRINGS_FILE = "strings.txt"
+SEGMENT_SUFFIX = ".bin"
+DEFAULT_SEGMENT_LENGTH = 3600 # seconds
+DEFAULT_QUEUE_SIZE = 10000 # items waiting for the writer
+NO_STRING = 0 # Interned id of None
+HASHED_ID = 1 << 63 # Set in the hashed object ids, the integer ids are below it
+NS_PER_SECOND = 1000000000
+NS_PER_MS = 1000000
+
+# Record kinds, the 'time' (ns, epoch) is the first column of every kind
+RECORD_TYPES = {
+    "radar": [("time", "<i8"), ("stream", "<u4"), ("id", "<u8"), ("lane", "<u4"), ("cls", "<i4"),
+              ("speed", "<f4"), ("lat", "<f8"), ("lon", "<f8"), ("quality", "<f4")],
+    "detector": [("time", "<i8"), ("detector", "<u4"), ("loop_on", "u1")],
+    "group": [("time", "<i8"), ("group", "<u4"), ("substate", "<u4")],
+    "view": [("time", "<i8"), ("view", "<u4"), ("group", "<u4"), ("substate", "<u4"), ("count", "<i4"),
+             ("radar_count", "<i4"), ("det_vehcount", "<i4")],
+    "view_objects": [("time", "<i8"), ("view", "<u4"), ("group", "<u4"), ("id", "<u8"), ("vtype", "<u4"),
+                     ("speed", "<f4"), ("quality", "<f4")],
+}
+# Columns holding interned strings
+STRING_COLUMNS = {
+    "radar": ("stream", "lane"),
+    "detector": ("detector",),
+    "group": ("group", "substate"),
+    "view": ("view", "group", "substate"),
+    "view_objects": ("view", "group", "vtype"),
+}
+# Columns holding object ids (object_ids)
+ID_COLUMNS = {
+    "radar": ("id",),
+    "view_objects": ("id",),
+}
+
+
+def to_ns(value):
+    """Returns datetime or seconds (epoch) as epoch ns"""
+    if isinstance(value, datetime.datetime):
+        value = value.timestamp()
+    return int(round(value * NS_PER_SECOND))
+
+
+def float_or_nan(value):
+    return np.nan if value is None else value
+
+
+def object_id(value):
+    """Returns the archived id of an object id, non-negative integers as such and others hashed"""
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool) and 0 <= value < HASHED_ID:
+        return int(value)
+    digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") | HASHED_ID
+
+
+def object_ids(values):
+    """Returns the archived ids of the object ids as uint64 array"""
+    return np.fromiter((object_id(value) for value in values), dtype=np.uint64, count=len(values))
+
+
+class StringTable:
+    """Interned strings of the archive, one JSON string per line, id is the line number"""
+
+    def __init__(self, path):
+        self.path = path
+        self.strings = [None] # NO_STRING
+        self.ids = {None: NO_STRING}
+        self._offset = 0
+        self.load()
+
+    def __len__(self):
+        return len(self.strings)
+
+    def load(self):
+        """Reads the strings added after the last load"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break # Being written
+                self._offset += len(line)
+                string = json.loads(line)
+                self.ids[string] = len(self.strings)
+                self.strings.append(string)
+
+    def intern(self, string):
+        """Returns the id of the string, new strings are added to the table (writer only)"""
+        if string is not None and not isinstance(string, str):
+            string = str(string)
+        string_id = self.ids.get(string)
+        if string_id is None:
+            line = (json.dumps(string) + "\n").encode()
+            # New strings are rare, written before the records referring to them
+            with open(self.path, "ab") as f:
+                f.write(line)
+            self._offset += len(line)
+            string_id = len(self.strings)
+            self.ids[string] = string_id
+            self.strings.append(string)
+        return string_id
+
+    def intern_array(self, values):
+        """Returns the ids of the values as uint32 array"""
+        ids = np.empty(len(values), dtype=np.uint32)
+        for i, value in enumerate(values):
+            ids[i] = self.intern(value)
+        return ids
+
+    def lookup(self, string):
+        """Returns the id of the string, None if not in the table"""
+        return self.ids.get(string)
+
+
+class ArchiveWriter:
+    """Writes the archive in a background thread"""
+
+    def __init__(self, directory, segment_length=DEFAULT_SEGMENT_LENGTH, retention=None,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        """retention: seconds the segments are kept, None keeps them all"""
+        self.directory = directory
+        self.segment_length = segment_length
+        self.retention = retention
+        os.makedirs(directory, exist_ok=True)
+        schema_path = os.path.join(directory, SCHEMA_FILE)
+        if os.path.exists(schema_path):
+            with open(schema_path) as f:
+                # The segments of an existing archive keep their length
+                self.segment_length = json.load(f)["segment_length"]
+        else:
+            with open(schema_path, "w") as f:
+                json.dump({"segment_length": segment_length, "record_types": RECORD_TYPES}, f, indent=1)
+        for kind in RECORD_TYPES:
+            os.makedirs(os.path.join(directory, kind), exist_ok=True)
+        self.strings = StringTable(os.path.join(directory, STRINGS_FILE))
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.files = {} # kind -> (segment start, file descriptor)
+        self.dropped = 0
+        self.written = 0 # records
+        self.errors = 0
+        self._thread = None
+
+    def __str__(self):
+        return "ArchiveWriter {}: {} records written, {} dropped".format(
+            self.directory, self.written, self.dropped)
+
+    #
+    # Called from the event loop, only queue the data
+    #
+
+    def put(self, kind, *args):
+        try:
+            self.queue.put_nowait((kind, args))
+        except queue.Full:
+            self.dropped += 1
+
+    def add_radar_frame(self, stream, received, frame):
+        """Archives the objects of a radar frame (RadarFrame), received in epoch ns"""
+        self.put("radar", stream, received, frame)
+
+    def add_detector_data(self, detector, received, loop_on):
+        self.put("detector", detector, received, loop_on)
+
+    def add_group_status(self, group, received, substate):
+        self.put("group", group, received, substate)
+
+    def add_view_output(self, view, group, data):
+        """Archives a view output (e3) and its objects"""
+        self.put("view", view, group, data)
+
+    #
+    # Writer thread
+    #
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="archive-writer", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Writes the queued data and closes the files"""
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+        else:
+            self.write_queued()
+        self.close_files()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.write_queued()
+                return
+            self.write_item(*item)
+
+    def write_queued(self):
+        """Writes all the queued items (without the thread)"""
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self.write_item(*item)
+
+    def write_item(self, kind, args):
+        try:
+            for record_kind, records in self.to_records(kind, *args):
+                self.write_records(record_kind, records)
+        except Exception as error: # Bad data must not stop the writer
+            self.errors += 1
+            print("Archive: could not write {}: {}".format(kind, error))
+
+    def to_records(self, kind, *args):
+        """Returns list of (kind, record array) for a queued item"""
+        strings = self.strings
+        if kind == "radar":
+            stream, received, frame = args
+            records = np.zeros(len(frame), dtype=RECORD_TYPES["radar"])
+            records["time"] = received
+            records["stream"] = strings.intern(stream)
+            records["id"] = object_ids(frame.ids)
+            records["lane"] = strings.intern_array(frame.lane)
+            records["cls"] = frame.cls
+            records["speed"] = frame.speed
+            records["lat"] = frame.lat
+            records["lon"] = frame.lon
+            records["quality"] = frame.quality
+            return [("radar", records)]
+        if kind == "detector":
+            detector, received, loop_on = args
+            records = np.zeros(1, dtype=RECORD_TYPES["detector"])
+            records[0] = (received, strings.intern(detector), bool(loop_on))
+            return [("detector", records)]
+        if kind == "group":
+            group, received, substate = args
+            records = np.zeros(1, dtype=RECORD_TYPES["group"])
+            records[0] = (received, strings.intern(group), strings.intern(substate))
+            return [("group", records)]
+        if kind == "view":
+            view, group, data = args
+            tstamp = data.get("tstamp")
+            tstamp = time.time_ns() if tstamp is None else int(tstamp * NS_PER_MS)
+            view_id = strings.intern(view)
+            group_id = strings.intern(group)
+            records = np.zeros(1, dtype=RECORD_TYPES["view"])
+            records[0] = (tstamp, view_id, group_id, strings.intern(data.get("group_substate")),
+                          data.get("count", -1), data.get("radar_count", -1), data.get("det_vehcount", -1))
+            objects = data.get("objects") or {}
+            obj_records = np.zeros(len(objects), dtype=RECORD_TYPES["view_objects"])
+            obj_records["time"] = tstamp
+            obj_records["view"] = view_id
+            obj_records["group"] = group_id
+            obj_records["id"] = object_ids(list(objects.keys()))
+            obj_records["vtype"] = strings.intern_array([obj.get("vtype") for obj in objects.values()])
+            obj_records["speed"] = [float_or_nan(obj.get("speed")) for obj in objects.values()]
+            obj_records["quality"] = [float_or_nan(obj.get("quality")) for obj in objects.values()]
+            return [("view", records), ("view_objects", obj_records)]
+        raise ValueError("Unknown record kind: {}".format(kind))
+
+    def segment_path(self, kind, segment):
+        return os.path.join(self.directory, kind, "{}{}".format(segment, SEGMENT_SUFFIX))
+
+    def write_records(self, kind, records):
+        if not len(records):
+            return
+        # A record array is written to the segment of its first record
+        segment = int(records["time"][0]) // NS_PER_SECOND // self.segment_length * self.segment_length
+        current = self.files.get(kind)
+        if current is None or current[0] != segment:
+            if current is not None:
+                os.close(current[1])
+            # Unbuffered appends, the readers see whole records as soon as they are written
+            fd = os.open(self.segment_path(kind, segment), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self.files[kind] = (segment, fd)
+            self.remove_expired(kind, segment)
+        os.write(self.files[kind][1], records.tobytes())
+        self.written += len(records)
+
+    def remove_expired(self, kind, now):
+        """Removes the segments older than the retention"""
+        if self.retention is None:
+            return
+        for segment in list_segments(self.directory, kind):
+            if segment + self.segment_length < now - self.retention:
+                os.remove(self.segment_path(kind, segment))
+
+    def close_files(self):
+        for _, fd in self.files.values():
+            os.close(fd)
+        self.files = {}
+
+    def get_stats(self):
+        stats = {}
+        stats["written"] = self.written
+        stats["dropped"] = self.dropped
+        stats["errors"] = self.errors
+        stats["queued"] = self.queue.qsize()
+        return stats
+
+
+def list_segments(directory, kind):
+    """Returns the sorted start times of the segments of the kind"""
+    segments = []
+    kind_dir = os.path.join(directory, kind)
+    if not os.path.isdir(kind_dir):
+        return segments
+    for name in os.listdir(kind_dir):
+        if name.endswith(SEGMENT_SUFFIX):
+            segments.append(int(name[:-len(SEGMENT_SUFFIX)]))
+    return sorted(segments)
+
+
+class ArchiveReader:
+    """Reads the archive with memory mapping"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, SCHEMA_FILE)) as f:
+            schema = json.load(f)
+        self.segment_length = schema["segment_length"]
+        self.dtypes = {kind: np.dtype([tuple(c) for c in columns])
+                       for kind, columns in schema["record_types"].items()}
+        self.strings = StringTable(os.path.join(directory, STRINGS_FILE))
+
+    def __str__(self):
+        return "ArchiveReader {}".format(self.directory)
+
+    def segment(self, kind, segment):
+        """Returns the records of a segment as a memory mapped array"""
+        path = os.path.join(self.directory, kind, "{}{}".format(segment, SEGMENT_SUFFIX))
+        dtype = self.dtypes[kind]
+        count = os.path.getsize(path) // dtype.itemsize # A record may be being written
+        if not count:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+    def read(self, kind, start=None, end=None, **match):
+        """
+            Returns the records of the kind with start <= time < end (datetimes or seconds)
+            match: column=value filters, string values are looked up from the string table
+            and object ids converted with object_id
+        """
+        if kind not in self.dtypes:
+            raise ValueError("Unknown record kind: {}".format(kind))
+        start = np.iinfo(np.int64).min if start is None else to_ns(start)
+        end = np.iinfo(np.int64).max if end is None else to_ns(end)
+        filters = {}
+        if match:
+            self.strings.load() # The writer may have added strings
+        for column, value in match.items():
+            if column in STRING_COLUMNS.get(kind, ()):
+                string_id = self.strings.lookup(value)
+                if string_id is None:
+                    return np.zeros(0, dtype=self.dtypes[kind]) # Never archived
+                filters[column] = string_id
+            elif column in ID_COLUMNS.get(kind, ()):
+                filters[column] = np.uint64(object_id(value))
+            else:
+                filters[column] = value
+        parts = []
+        for segment in list_segments(self.directory, kind):
+            if segment * NS_PER_SECOND >= end or (segment + self.segment_length) * NS_PER_SECOND <= start:
+                continue
+            records = self.segment(kind, segment)
+            times = records["time"]
+            first = np.searchsorted(times, start, side="left")
+            last = np.searchsorted(times, end, side="left")
+            records = records[first:last]
+            if filters:
+                mask = np.ones(len(records), dtype=bool)
+                for column, value in filters.items():
+                    mask &= records[column] == value
+                records = records[mask]
+            parts.append(np.array(records)) # Copied from the map
+        if not parts:
+            return np.zeros(0, dtype=self.dtypes[kind])
+        return np.concatenate(parts)
+
+    def decode(self, ids):
+        """Returns the strings of the interned ids"""
+        self.strings.load()
+        table = np.array(self.strings.strings, dtype=object)
+        return table[np.asarray(ids, dtype=np.int64)]
@@ -0,0 +1,106 @@
+"""Association of the radar objects and the detector counted vehicles
+
+The vehicles counted by the detectors of a lane have no position, their
+distance from the stop line is estimated from the time since they were counted
+at the in detector. The radar objects get their distance from the stop line of
+the lane (lat/lon). A cost matrix is built between all the radar objects and
+detector vehicles of a view: different lanes and distances over the gate are
+not allowed, otherwise the cost is the distance difference weighted with the
+radar quality (good objects are matched first). The assignment is solved with
+vectorized greedy rounds (greedy_assignment, also used by the tracker).
+
+Without a stop line the distances are unknown and only the lanes are used, the
+objects of a lane are then matched in quality order (count reconciliation).
+"""
+
+import numpy as np
+
+EARTH_RADIUS = 6371000.0 # m
+DEFAULT_IN_DET_DISTANCE = 40.0 # m, in detector from the stop line
+DEFAULT_FREE_SPEED = 8.0 # m/s, assumed speed of the counted vehicles
+DEFAULT_GATE_DISTANCE = 30.0 # m, max distance between matched objects
+DEFAULT_QUALITY = 99
+# Confidences of the fused objects (0..1)
+DETECTOR_CONFIDENCE = 0.6 # vehicle counted by the detectors only
+RADAR_ONLY_FACTOR = 0.8 # radar quality is scaled with this if not confirmed by the detectors
+
+
+def stop_line_distance(lat, lon, stop_line):
+    """Returns the distances (m) of the points from the stop line point [lat, lon]"""
+    lat0, lon0 = np.radians(stop_line[0]), np.radians(stop_line[1])
+    x = (np.radians(np.asarray(lon, dtype=float)) - lon0) * np.cos(lat0)
+    y = np.radians(np.asarray(lat, dtype=float)) - lat0
+    return np.hypot(x, y) * EARTH_RADIUS
+
+
+def detector_distance(ages, in_det_distance=DEFAULT_IN_DET_DISTANCE, free_speed=DEFAULT_FREE_SPEED):
+    """Returns the estimated distances (m) of the counted vehicles, the queue is at the stop line"""
+    return np.maximum(0.0, in_det_distance - free_speed * np.asarray(ages, dtype=float))
+
+
+def quality_share(quality):
+    """Returns the radar quality (0..100) as 0..1"""
+    quality = np.asarray(quality, dtype=float)
+    return np.clip(np.where(np.isnan(quality), DEFAULT_QUALITY, quality) / 100.0, 0.0, 1.0)
+
+
+def greedy_assignment(cost):
+    """
+        Returns matched (row, column) index arrays of the cost matrix
+        In each round the pairs that are each other's cheapest are accepted
+    """
+    n_rows, n_cols = cost.shape
+    if not n_rows or not n_cols:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    cost = cost.copy()
+    rows, cols = [], []
+    rng = np.arange(n_rows)
+    while True:
+        best_col = np.argmin(cost, axis=1)
+        best_cost = cost[rng, best_col]
+        best_row = np.argmin(cost, axis=0)
+        mutual = np.isfinite(best_cost) & (best_row[best_col] == rng)
+        if not mutual.any():
+            break
+        r_idx = rng[mutual]
+        c_idx = best_col[mutual]
+        rows.append(r_idx)
+        cols.append(c_idx)
+        cost[r_idx, :] = np.inf
+        cost[:, c_idx] = np.inf
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def association_cost(radar_lane, radar_dist, radar_quality, det_lane, det_dist, gate=DEFAULT_GATE_DISTANCE):
+    """
+        Returns the (radar, detector) cost matrix, inf for the pairs not allowed
+        Unknown (nan) distances do not add to the cost
+    """
+    diff = np.abs(np.asarray(radar_dist, dtype=float)[:, None] - np.asarray(det_dist, dtype=float)[None, :])
+    diff = np.where(np.isnan(diff), 0.0, diff)
+    # Lower quality, higher cost, the constant makes the quality count also at zero distance
+    cost = (diff + 1.0) * (2.0 - quality_share(radar_quality))[:, None]
+    cost[(np.asarray(radar_lane)[:, None] != np.asarray(det_lane)[None, :]) | (diff > gate)] = np.inf
+    return cost
+
+
+def associate(radar_lane, radar_dist, radar_quality, det_lane, det_dist, gate=DEFAULT_GATE_DISTANCE):
+    """
+        Returns the matched (radar, detector) index arrays and the confidences
+        of the radar objects and the detector vehicles (unmatched ones included)
+    """
+    cost = association_cost(radar_lane, radar_dist, radar_quality, det_lane, det_dist, gate)
+    rows, cols = greedy_assignment(cost)
+    quality = quality_share(radar_quality)
+    radar_conf = quality * RADAR_ONLY_FACTOR
+    det_conf = np.full(len(det_lane), DETECTOR_CONFIDENCE)
+    if len(rows):
+        diff = np.abs(np.asarray(radar_dist, dtype=float)[rows] - np.asarray(det_dist, dtype=float)[cols])
+        agreement = 1.0 - np.where(np.isnan(diff), 0.0, diff) / gate
+        # Both sources see the vehicle, the closer the more confident
+        fused = 1.0 - (1.0 - quality[rows]) * (1.0 - DETECTOR_CONFIDENCE * agreement)
+        radar_conf[rows] = fused
+        det_conf[cols] = fused
+    return rows, cols, radar_conf, det_conf
@@ -253,6 +253,19 @@ class GlobalConf:
         return detlogic_outputs
 
 
+    def get_detlogics(self):
+        """Returns the detlogics section, the logic definitions by name"""
+        return self.conf.get('detlogics', {})
+
+    def get_detlogic_output_params(self):
+        """Returns the detlogic outputs, the function is left as the detlogic name"""
+        outputs = self.conf['outputs']
+        detlogic_outputs = {}
+        for output_name, params in outputs.items():
+            if params.get("type", None) == "detlogic":
+                detlogic_outputs[output_name] = params
+        return detlogic_outputs
+
     def get_detlogc_function(self, function_name):
         """Returns the detlogic function from detlogics section"""
         # Handling the missing params
@@ -303,6 +316,8 @@ class GlobalConf:
                         if l_params:
                             lane_params.append(l_params)
                     view_outputs[output_name]['lanes'] = lane_params
+                elif params["type"] == "detlogic":
+                    continue # See get_detlogic_output_params
                 else:
                     print(f"Error: output type {params['type']} not supported")
         return view_outputs
@@ -1,13 +1,18 @@
 "This Unit contains handlers for the detector inputs and outputs."
 
 import datetime
+import functools
 import json
-import asyncio
+import time
+from timed_buffer import TimedRingBuffer
+from timestamps import NS_PER_SECOND, parse_tstamp, seconds_to_ns
+from stream_metrics import StreamMetrics
 
 # Note: should be configureable
-DEFAULT_CLEANUP_INTERVAL = 10 # seconds
 DEFAULT_OLD_DATA_TRESHOLD = 60 # seconds 
+DEFAULT_HISTORY_SIZE = 1000 # loop events
 DEFAULT_SEND_INTERVAL = 1 # seconds
+DEFAULT_INTAKE_POLICY = 'lossless' # no messages are dropped under load
 
 class Detector:
     """A class for handling simple detector inputs and outputs"""
@@ -34,7 +39,15 @@ class Detector:
                 print(f"Detector {det_id} is missing nats_subject".format(det_id))
         else:
             self.nats = False
-        self.data = []
+        self.update_functions = [] # Functions to trigger when new data is received
+        self.archive = None # ArchiveWriter, set by the sensor twin
+        # Detectors send on changes only, thus not stale by default
+        self.metrics = StreamMetrics(det_id, stream_params.get('stale_after', None))
+        # Loop event history, old events are evicted when new ones are added
+        self.data = TimedRingBuffer(
+            capacity=det_params.get('history_size', DEFAULT_HISTORY_SIZE),
+            max_age=det_params.get('history_length', DEFAULT_OLD_DATA_TRESHOLD),
+            units_per_second=NS_PER_SECOND)
         self.data_subject = "detector.data." + self.det_id
         # Detector stats
         self.rising_edge_cnt = 0
@@ -60,42 +73,38 @@ class Detector:
     # Basic data access functions
     def add_data(self, data):
         """Adds data to the radar"""
+        self.metrics.record(data['data_received'], data.get('data_sent'))
+        if self.archive:
+            # Also the edges not counted are archived
+            self.archive.add_detector_data(self.det_id, data['data_received'], data['loop_on'])
         if self.counting_blocked:
             return
-        # Sort the data by received timestamp
-        data_sorted = sorted(self.data, key=lambda x: x['data_received'])
-        self.data = data_sorted
-        # update the status
-        if len(self.data) > 0:
-            if data['loop_on'] and not self.data[-1]['loop_on']:
+        # update the status, compared to the latest received
+        last_data = self.data.last()
+        if last_data is not None:
+            if data['loop_on'] and not last_data['loop_on']:
                 self.rising_edge_cnt += 1
-            if not data['loop_on'] and self.data[-1]['loop_on']:
+            if not data['loop_on'] and last_data['loop_on']:
                 self.falling_edge_cnt += 1
-        elif len(self.data) == 0:
+        else:
             if data['loop_on']:
                 self.rising_edge_cnt += 1
             
-        self.data.append(data)
+        # Kept in received order, out of order data is inserted in place
+        self.data.append(data, data['data_received'])
             # I believe that this is misleading, because the 
             # simulator sends loop down for all in the beginning
             #else:
             #    self.falling_edge_cnt += 1
 
     def remove_old_data(self, treshold=DEFAULT_OLD_DATA_TRESHOLD):
-        "Removes all data with sent timestamp older than treshold"
-        now = datetime.datetime.now()
-        for data in self.data:
-            if 'data_sent' in data:
-                data_sent = data['data_sent']
-                diff = now - data_sent
-                if diff.total_seconds() > treshold:
-                    self.data.remove(data)
+        "Removes all data with received timestamp older than treshold"
+        self.data.evict_older_than(time.time_ns() - seconds_to_ns(treshold))
  
     def get_last_data(self):
-        """Returns the last data item"""
-        if len(self.data) == 0:
-            return None
-        return self.data[-1]
+        """Returns the last data item, None if nothing received within the history length"""
+        self.data.evict_stale() # A silent detector must not serve its last state forever
+        return self.data.last()
     
     def get_vehicle_count(self):
         """Returns the number of passed, based on edge setup"""
@@ -117,6 +126,16 @@ class Detector:
 
         self.status = status
 
+    def add_update_function(self, func):
+        """Adds a function to be called when new data is received"""
+        if func not in self.update_functions:
+            self.update_functions.append(func)
+
+    def trigger_update_functions(self):
+        """Triggers the update functions"""
+        for func in self.update_functions:
+            func()
+
     def get_nats_sub_params(self):
         """
             Returns the nats subscription parameters 
@@ -127,15 +146,13 @@ class Detector:
         params = {}
         params['subject'] = self.nats_subject
         params['callback'] = self.nats_callback
+        # Intake queue between the subscription and the callback
+        stream_params = self.det_params.get('stream', {})
+        params['intake_policy'] = stream_params.get('intake_policy', DEFAULT_INTAKE_POLICY)
+        params['intake_size'] = stream_params.get('intake_size', None)
         return params    
 
     # ASYNC functions
-    async def cleanup_old_data(self):
-        """Removes old data, this should be a separate task running at alla times"""
-        while True:
-            await asyncio.sleep(DEFAULT_CLEANUP_INTERVAL)
-            self.remove_old_data()
-
     async def nats_callback(self, msg):
         """The callback function for the nats and is assigned to the subscription"""
         subject = msg.subject
@@ -146,46 +163,86 @@ class Detector:
         #if data_dict['id'] == 'detector.status.R8KU':
         #print(f"Received a message on '{subject} {reply}': {data}")
         
-        if 'tstamp' in data_dict:
-            tstamp = data_dict['tstamp']
-            #tstamp_in_datetime = datetime.datetime.fromtimestamp(tstamp/1000)
-            if '.' in tstamp:
-                split_by_dot = tstamp.split(".")
-                tstamp = split_by_dot[0] + "." + split_by_dot[1][:6] # Remove the last digits
-            tstamp_in_datetime = datetime.datetime.fromisoformat(tstamp) # Note: this is different from radar
-            tstamp_now = datetime.datetime.now()
-            data_dict['data_sent'] = tstamp_in_datetime
-            data_dict['data_received'] = tstamp_now
+        # Received time (epoch ns) is always set, the history is indexed with it
+        data_dict['data_received'] = time.time_ns()
+        sent = parse_tstamp(data_dict.get('tstamp')) # ISO string or epoch ms
+        if sent is not None:
+            data_dict['data_sent'] = sent
         self.add_data(data_dict)
-
-    # Testing function for sending data
-    async def send_data(self, nats):
-        """Send the queue lengths to the nats"""
-        while True:
-            await asyncio.sleep(DEFAULT_SEND_INTERVAL)
-            data = {}
-            stored_data = []
-            # Make a deep copy of the  data
-            for d in self.data:
-                stored_data.append(dict(d))
-            #print(stored_data)
-            for d in stored_data:
-                d['data_sent'] = d['data_sent'].isoformat()
-                d['data_received'] = d['data_received'].isoformat()
-
-            data['det_id'] = self.det_id
-            data['stored_data'] = stored_data
-            data['tstamp'] = datetime.datetime.now().timestamp() * 1000
-            #await nats.publish(self.data_subject, json.dumps(data).encode())
-            #print(f"Sent det data from {self.det_id}: {data}")
+        self.trigger_update_functions()
 
 
 class DetectorLogic(Detector):
-    """A class for creating new detectors by combining inputs from existing detectors"""
+    """
+        A class for creating new detectors by combining inputs from existing detectors
+        The value is computed by the DetLogicEngine (see detlogic.py), the
+        detector publishes it as a virtual detector. It can also be used
+        like the other detectors (history and edge counts).
+    """
     def __init__(self, det_id, params, status = None):
-        super().__init__(det_id, params, status)
+        # Note: no stream, the data comes from the detlogic engine
+        self.det_id = det_id
+        self.det_params = params
+        self.status = status
+        self.trigger_functions = []
+        self.nats = False
+        self.update_functions = []
+        self.archive = None
+        self.metrics = StreamMetrics(det_id, None)
+        self.data = TimedRingBuffer(
+            capacity=params.get('history_size', DEFAULT_HISTORY_SIZE),
+            max_age=params.get('history_length', DEFAULT_OLD_DATA_TRESHOLD),
+            units_per_second=NS_PER_SECOND)
+        self.rising_edge_cnt = 0
+        self.falling_edge_cnt = 0
+        self.type = 'rising_edge' # Counts the activations
+        self.counting_blocked = False
+        self.function = params.get('function', det_id) # Name of the detlogic
+        self.nats_output_subject = params.get('nats_output_subject', None)
+        self.trigger = params.get('trigger', 'change')
+        self.trigger_time = params.get('trigger_time', DEFAULT_SEND_INTERVAL)
+        self.scheduler = None # TimerWheel running the output, set by schedule_output
+        self.output_job = None
     
     def __str__(self):
         return "DetLogic: {} - {}".format(self.det_id, self.status)
-    
 
+    def set_status(self, status):
+        """Sets the status computed by the detlogic engine"""
+        if status == self.status:
+            return
+        self.status = status
+        now = time.time_ns()
+        self.add_data({'loop_on': status, 'data_sent': now, 'data_received': now})
+        self.trigger_update_functions()
+        if self.output_job is not None and self.trigger == 'change':
+            self.scheduler.wake(self.output_job)
+
+    def get_output_message(self):
+        """Returns the output message, a detector status that is also usable as group request"""
+        data = {}
+        data['id'] = self.det_id
+        data['loop_on'] = bool(self.status)
+        data['request'] = bool(self.status)
+        data['tstamp'] = datetime.datetime.now().isoformat()
+        return data
+
+    def schedule_output(self, scheduler, nats):
+        """
+            Adds the output to the scheduler, returns the job (None if no output subject)
+            Sent when the status changes (change trigger) or periodically (time trigger)
+        """
+        if not self.nats_output_subject:
+            return None
+        self.scheduler = scheduler
+        func = functools.partial(self.send_output, nats)
+        if self.trigger == 'change':
+            self.output_job = scheduler.add_job(self.det_id, func)
+        else:
+            self.output_job = scheduler.add_periodic(self.det_id, func, self.trigger_time)
+        return self.output_job
+
+    # ASYNC functions
+    async def send_output(self, nats):
+        """Sends the status"""
+        await nats.publish(self.nats_output_subject, json.dumps(self.get_output_message()).encode())
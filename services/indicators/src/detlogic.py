@@ -0,0 +1,265 @@
+"""Detector logic engine
+
+The detector logics (the detlogics section of the configuration) define
+virtual detectors computed from the real detectors and other logics. Every
+logic is compiled into a node of a dependency graph. When a detector changes,
+only the nodes depending on it are evaluated, in dependency order. The hold
+and delay nodes use timers, they are evaluated again when their timer expires.
+
+Supported logic types:
+    and, or: "inputs": list of detector or logic names
+    not: "input": detector or logic name
+    hold: "input", "time": stays on for time seconds after the input goes off
+    delay: "input", "time": goes on when the input has been on for time seconds
+    two_det_switch: "detectors": {"request": name, "clear": name},
+        "request_trigger" and "clear_trigger": rising_edge or falling_edge
+        switched on by the request detector edge and off by the clear detector edge
+"""
+
+import asyncio
+import heapq
+import time
+
+DEFAULT_TIMER_CHECK_INTERVAL = 1.0 # seconds, max sleep when no timers are running
+
+
+class LogicNode:
+    """A node of the logic graph, either an input (detector) or a logic"""
+    __slots__ = ("name", "logic_type", "params", "inputs", "dependents", "order",
+                 "value", "last_inputs", "deadline")
+
+    def __init__(self, name, logic_type="input", params=None, inputs=()):
+        self.name = name
+        self.logic_type = logic_type
+        self.params = params if params is not None else {}
+        self.inputs = list(inputs) # Input nodes
+        self.dependents = [] # Nodes using this as input
+        self.order = 0 # Position in the dependency order
+        self.value = False
+        self.last_inputs = [False] * len(self.inputs) # For the edge triggers
+        self.deadline = None # Timer of the hold and delay nodes
+
+    def __repr__(self):
+        return "LogicNode<{}: {} {}>".format(self.name, self.logic_type, self.value)
+
+
+def edge_triggered(trigger, old, new):
+    """Returns True if the change from old to new matches the trigger"""
+    if trigger == "rising_edge":
+        return new and not old
+    if trigger == "falling_edge":
+        return old and not new
+    return old != new
+
+
+class DetLogicEngine:
+    """Compiles the detector logics and evaluates them incrementally"""
+
+    LOGIC_TYPES = ("and", "or", "not", "hold", "delay", "two_det_switch")
+
+    def __init__(self, definitions):
+        """definitions: dict of logic name -> logic params (the detlogics section)"""
+        self.nodes = {}
+        self.output_functions = {} # node name -> list of functions called with the new value
+        self._dirty = [] # heap of (order, name)
+        self._dirty_names = set()
+        self._timers = [] # heap of (deadline, name)
+        self.timers_changed = asyncio.Event()
+        for name in definitions:
+            self.nodes[name] = LogicNode(name) # Inputs resolved below
+        for name, params in definitions.items():
+            self._compile(name, params)
+        self._sort()
+        # Initial values, all the inputs are off
+        for node in sorted(self.nodes.values(), key=lambda n: n.order):
+            if node.logic_type != "input":
+                node.value = self._evaluate(node, 0.0)
+
+    def __str__(self):
+        return "DetLogicEngine: {} logics, {} inputs".format(
+            len(self.nodes) - len(self.input_names), len(self.input_names))
+
+    @property
+    def input_names(self):
+        """Names of the input (detector) nodes"""
+        return [name for name, node in self.nodes.items() if node.logic_type == "input"]
+
+    def _input_node(self, name):
+        if name not in self.nodes:
+            self.nodes[name] = LogicNode(name)
+        return self.nodes[name]
+
+    def _compile(self, name, params):
+        logic_type = params.get("type")
+        if logic_type not in self.LOGIC_TYPES:
+            raise ValueError("Unknown detlogic type: {} in {}".format(logic_type, name))
+        if logic_type == "two_det_switch":
+            detectors = params.get("detectors", {})
+            if "request" not in detectors or "clear" not in detectors:
+                raise ValueError("Detlogic {} needs request and clear detectors".format(name))
+            input_names = [detectors["request"], detectors["clear"]]
+        elif logic_type in ("and", "or"):
+            input_names = params.get("inputs", [])
+        else:
+            input_names = [params.get("input")]
+        if not input_names or None in input_names:
+            raise ValueError("Detlogic {} is missing inputs".format(name))
+        if logic_type in ("hold", "delay") and "time" not in params:
+            raise ValueError("Detlogic {} is missing time".format(name))
+
+        node = self.nodes[name]
+        node.logic_type = logic_type
+        node.params = params
+        node.inputs = [self._input_node(input_name) for input_name in input_names]
+        node.last_inputs = [False] * len(node.inputs)
+        for input_node in node.inputs:
+            input_node.dependents.append(node)
+
+    def _sort(self):
+        """Sets the dependency order of the nodes, raises ValueError on cycles"""
+        pending = {name: len(node.inputs) for name, node in self.nodes.items()}
+        ready = [name for name, count in pending.items() if count == 0]
+        order = 0
+        while ready:
+            node = self.nodes[ready.pop()]
+            node.order = order
+            order += 1
+            for dependent in node.dependents:
+                pending[dependent.name] -= 1
+                if pending[dependent.name] == 0:
+                    ready.append(dependent.name)
+        if order != len(self.nodes):
+            cycle = sorted(name for name, count in pending.items() if count > 0)
+            raise ValueError("Detlogics have a cycle: {}".format(", ".join(cycle)))
+
+    #
+    # Evaluation
+    #
+
+    def _evaluate(self, node, now):
+        """Returns the new value of the node, sets the timers"""
+        values = [input_node.value for input_node in node.inputs]
+        logic_type = node.logic_type
+        if logic_type == "and":
+            return all(values)
+        if logic_type == "or":
+            return any(values)
+        if logic_type == "not":
+            return not values[0]
+        if logic_type == "two_det_switch":
+            value = node.value
+            request_old, clear_old = node.last_inputs
+            if edge_triggered(node.params.get("request_trigger", "rising_edge"), request_old, values[0]):
+                value = True
+            if edge_triggered(node.params.get("clear_trigger", "falling_edge"), clear_old, values[1]):
+                value = False
+            node.last_inputs = values
+            return value
+        if logic_type == "hold":
+            if values[0]:
+                node.deadline = None
+                return True
+            if node.value and node.deadline is None:
+                self._set_timer(node, now + node.params["time"])
+                return True
+            if node.deadline is not None and now < node.deadline:
+                return True
+            node.deadline = None
+            return False
+        if logic_type == "delay":
+            if not values[0]:
+                node.deadline = None
+                return False
+            if node.value:
+                return True
+            if node.deadline is None:
+                self._set_timer(node, now + node.params["time"])
+                return False
+            if now < node.deadline:
+                return False
+            node.deadline = None
+            return True
+        raise ValueError("Unknown detlogic type: {}".format(logic_type))
+
+    def _set_timer(self, node, deadline):
+        node.deadline = deadline
+        heapq.heappush(self._timers, (deadline, node.name))
+        self.timers_changed.set()
+
+    def _mark_dirty(self, node):
+        if node.name not in self._dirty_names:
+            self._dirty_names.add(node.name)
+            heapq.heappush(self._dirty, (node.order, node.name))
+
+    def _propagate(self, now):
+        """Evaluates the dirty nodes in dependency order"""
+        while self._dirty:
+            _, name = heapq.heappop(self._dirty)
+            self._dirty_names.discard(name)
+            node = self.nodes[name]
+            value = self._evaluate(node, now)
+            if value == node.value:
+                continue
+            node.value = value
+            for dependent in node.dependents:
+                self._mark_dirty(dependent)
+            for func in self.output_functions.get(name, []):
+                func(value)
+
+    def set_input(self, name, value, now=None):
+        """Sets the value of an input (detector), evaluates the dependent logics"""
+        if now is None:
+            now = time.time()
+        node = self.nodes.get(name)
+        if node is None or node.logic_type != "input":
+            return
+        value = bool(value)
+        if value == node.value:
+            return
+        node.value = value
+        for dependent in node.dependents:
+            self._mark_dirty(dependent)
+        self._propagate(now)
+
+    def advance(self, now=None):
+        """Evaluates the nodes with expired timers"""
+        if now is None:
+            now = time.time()
+        timers = self._timers
+        while timers and timers[0][0] <= now:
+            deadline, name = heapq.heappop(timers)
+            if self.nodes[name].deadline == deadline: # Not cancelled or replaced
+                self._mark_dirty(self.nodes[name])
+        self._propagate(now)
+
+    def next_deadline(self):
+        """Returns the time of the next timer, None if no timers"""
+        while self._timers and self.nodes[self._timers[0][1]].deadline != self._timers[0][0]:
+            heapq.heappop(self._timers)
+        return self._timers[0][0] if self._timers else None
+
+    def value(self, name):
+        """Returns the current value of a logic or input"""
+        return self.nodes[name].value
+
+    def add_output_function(self, name, func):
+        """Adds a function to be called with the new value when the logic changes"""
+        if name not in self.nodes:
+            raise ValueError("Detlogic {} not defined".format(name))
+        self.output_functions.setdefault(name, []).append(func)
+
+    # ASYNC functions
+    async def run_timers(self):
+        """Evaluates the timers when they expire"""
+        while True:
+            self.timers_changed.clear()
+            deadline = self.next_deadline()
+            if deadline is None:
+                timeout = DEFAULT_TIMER_CHECK_INTERVAL
+            else:
+                timeout = max(0.0, deadline - time.time())
+            try:
+                await asyncio.wait_for(self.timers_changed.wait(), timeout=timeout)
+            except TimeoutError:
+                pass
+            self.advance()
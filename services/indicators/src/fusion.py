@@ -137,13 +137,8 @@ class LaneRadar:
     
     def get_approaching_objects(self, measurements = 1):
         """Returns the number of approaching vehicles in the lane dedicated to this object"""
-        # Old simle implementation
-        objects = self.radar.get_object_list(measurements= measurements)
-        objects_in_lane = []
-        for obj in objects:
-            if str(obj['lane']) == self.lane:
-                objects_in_lane.append(obj)
-        return objects_in_lane
+        # The radar has partitioned the frame by lane at ingest
+        return self.radar.get_lane_object_list(self.lane, measurements= measurements)
 
 
 
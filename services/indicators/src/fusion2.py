@@ -4,18 +4,43 @@
     relevant inputs into it. All data manipualtaion and calculation needed 
     for outputs will be handled here
 """
-import asyncio
 import datetime
+import functools
 import json
+import time
 import uuid
 
+import numpy as np
+
+# Flat imports when run as a script, relative when imported as a package (tests)
+if __package__:
+    from .radar_frame import RadarFrame
+    from .rolling_stats import RollingStats, DEFAULT_WINDOWS
+    from .association import associate, detector_distance, quality_share, stop_line_distance, \
+        DEFAULT_FREE_SPEED, DEFAULT_GATE_DISTANCE, DEFAULT_IN_DET_DISTANCE
+    from .queue_estimator import QueueEstimator, radar_queue_tail
+    from .timestamps import NS_PER_SECOND, seconds_to_ns
+else:
+    from radar_frame import RadarFrame
+    from rolling_stats import RollingStats, DEFAULT_WINDOWS
+    from association import associate, detector_distance, quality_share, stop_line_distance, \
+        DEFAULT_FREE_SPEED, DEFAULT_GATE_DISTANCE, DEFAULT_IN_DET_DISTANCE
+    from queue_estimator import QueueEstimator, radar_queue_tail
+    from timestamps import NS_PER_SECOND, seconds_to_ns
+
 DEFAULT_TRAM_SPEED = 10 # m/s
+DEFAULT_TRIGGER_TIME = 1.0 # seconds
+# For change trigger
+DEFAULT_COALESCE_TIME = 0.05 # seconds to wait for more inputs after a change
+DEFAULT_MIN_INTERVAL = 0.1 # seconds between outputs, at most
+DEFAULT_MAX_INTERVAL = 1.0 # seconds between outputs, at least (also when nothing changes)
 DEFAULT_LANE_VEHTYPE = "car_type"
 RADAR_PAST_MEASUREMENTS = 1
 
 # Maybe configurable in the future, done for demo
 # Note, as for testinf, we only send cars and trucks
 # It is assumed that the other road users cannot be seen in the area
+SENT_VTYPES = ['car_type', 'truck_type', 'bike_type']  #DBIK2025 Added bike_type
 VECLASS_FROM_RADAR_TO_SUMO = {
     0: "car_type",
     1: "bike_type",
@@ -27,9 +52,55 @@ VECLASS_FROM_RADAR_TO_SUMO = {
     7: "truck_type",
     8: "tram_type",}
 
+class DetectorObjectPool:
+    """
+        Synthetic objects for the vehicles counted by the detectors in a lane
+        The objects are kept over the output cycles and resized with the
+        count, thus a counted vehicle keeps its id until it leaves the lane.
+        The vehicles leave in the order they arrived (oldest removed first).
+    """
+
+    def __init__(self, vtype=DEFAULT_LANE_VEHTYPE):
+        self.vtype = vtype
+        self.objects = {} # id -> object, in arrival order
+        self.arrived = {} # id -> time (seconds) the object was added
+
+    def __len__(self):
+        return len(self.objects)
+
+    def new_object(self):
+        """Returns a new synthetic object"""
+        new_obj = {}
+        new_obj['speed'] = DEFAULT_TRAM_SPEED
+        new_obj['vtype'] = self.vtype
+        new_obj['sumo_id'] = None
+        new_obj['source'] = "detector_count"
+        new_obj['notes'] = "Speed and types are default values"
+        return new_obj
+
+    def resize(self, count, now=None):
+        """Sets the number of objects, returns the objects as dict of id -> object"""
+        if now is None:
+            now = time.time()
+        count = max(0, count)
+        while len(self.objects) > count:
+            obj_id = next(iter(self.objects)) # Oldest
+            del self.objects[obj_id]
+            del self.arrived[obj_id]
+        while len(self.objects) < count:
+            obj_id = str(uuid.uuid4())
+            self.objects[obj_id] = self.new_object()
+            self.arrived[obj_id] = now
+        return dict(self.objects)
+
+    def get_ages(self, ids, now):
+        """Returns the seconds since the objects were added"""
+        return now - np.array([self.arrived[obj_id] for obj_id in ids], dtype=float)
+
+
 class Lane:
     """Lane indicators contained"""
-    def __init__(self, params):
+    def __init__(self, params, stats_windows=None):
         self.name = params.get('name', "No name")
         self.in_dets = {} # detectors for incoming traffic
         self.out_dets = {} # detectors for outgoing traffic
@@ -42,6 +113,12 @@ class Lane:
         self.outdet_count = 0
         self.vehcount_offset = 0 # For correctiong the drifting of the detcunt
         self.lane_main_type = params.get('lane_main_type', DEFAULT_LANE_VEHTYPE)
+        self.det_objects = DetectorObjectPool(self.lane_main_type) # Objects counted by the detectors
+        # For estimating the positions in the association
+        self.stop_line = params.get('stop_line', None) # [lat, lon]
+        self.in_det_distance = params.get('in_det_distance', DEFAULT_IN_DET_DISTANCE)
+        self.stats = RollingStats(stats_windows)
+        self.stats_det_counts = None # In and out counts at the last stats update
 
 
     def assign_radars(self, radars):
@@ -81,10 +158,13 @@ class Lane:
 
     def get_detected_objects_e3(self):
         """Returns the number of approaching v"""
-        detected_objects = []
-        for radar in self.input_radars.values():
-            detected_objects += radar.get_approaching_objects(measurements = RADAR_PAST_MEASUREMENTS)
-        return detected_objects
+        return self.get_detected_frame_e3().objects
+
+    def get_detected_frame_e3(self):
+        """Returns the objects detected on the lane as a RadarFrame"""
+        return RadarFrame.concatenate(
+            radar.get_approaching_frame(measurements = RADAR_PAST_MEASUREMENTS)
+            for radar in self.input_radars.values())
 
     def get_detector_based_vehcount(self):
         """Returns the vehicle count based on detectors"""
@@ -107,20 +187,76 @@ class Lane:
         self.vehcount_offset = -1 * (in_count - out_count)
 
 
-    def get_objects_detected_by_detectors(self):
+    def get_detector_counts(self):
+        """Returns the cumulative in and out detector counts"""
+        in_count = sum(det.get_vehicle_count() or 0 for det in self.in_dets.values())
+        out_count = sum(det.get_vehicle_count() or 0 for det in self.out_dets.values())
+        return in_count, out_count
+
+    def get_in_det_occupied_time(self, now_ns):
+        """Returns the seconds the in detectors have been occupied (the longest), 0 if free"""
+        occupied = 0.0
+        for det in self.in_dets.values():
+            data = det.get_last_data()
+            if data is not None and data['loop_on']:
+                occupied = max(occupied, (now_ns - data['data_received']) / NS_PER_SECOND)
+        return occupied
+
+    def has_live_radar(self, now_ns):
+        """Returns true if a radar of the lane has sent frames lately (not stale)"""
+        for lane_radar in self.input_radars.values():
+            metrics = lane_radar.radar.metrics
+            if metrics.last_received is None:
+                continue
+            if metrics.stale_after is None or now_ns - metrics.last_received <= metrics.stale_after * NS_PER_SECOND:
+                return True
+        return False
+
+    def get_stats_changes(self, frame=None):
+        """
+            Returns the changes since the last stats update as dict
+            (the keyword arguments for RollingStats.update), frame is the
+            lane frame if already read
+        """
+        in_count, out_count = self.get_detector_counts()
+        changes = {}
+        if self.stats_det_counts is None:
+            changes['arrivals'] = 0
+            changes['passed'] = 0
+        else:
+            changes['arrivals'] = max(0, in_count - self.stats_det_counts[0])
+            changes['passed'] = max(0, out_count - self.stats_det_counts[1])
+        self.stats_det_counts = (in_count, out_count)
+
+        if frame is None:
+            frame = self.get_detected_frame_e3()
+        speed = frame.speed[~np.isnan(frame.speed)]
+        changes['speed_sum'] = float(speed.sum())
+        changes['speed_count'] = len(speed)
+
+        loops = [det.get_last_data() for det in list(self.in_dets.values()) + list(self.out_dets.values())]
+        loops = [data['loop_on'] for data in loops if data is not None]
+        changes['occupancy'] = sum(loops) / len(loops) if loops else None
+        # Same rule as in combining: the radar list unless the count is larger
+        changes['queue'] = max(len(frame), self.get_detector_based_vehcount())
+        return changes
+
+    def get_objects_detected_by_detectors(self, now=None):
         """Returns all the objects detected by the detectors"""
-        objs_counted = self.get_detector_based_vehcount()
-        obj_dict = {}
-        for obj in range(objs_counted):
-            new_obj = {}
-            id = str(uuid.uuid4())
-            new_obj['speed'] = DEFAULT_TRAM_SPEED
-            new_obj['vtype'] = self.lane_main_type
-            new_obj['sumo_id'] = None
-            new_obj['source'] = "detector_count"
-            new_obj['notes'] = "Speed and types are default values"
-            obj_dict[id] = new_obj
-        return obj_dict
+        # The ids are kept as long as the vehicles are counted in the lane
+        return self.det_objects.resize(self.get_detector_based_vehcount(), now)
+
+    def get_radar_distances(self, frame):
+        """Returns the distances of the radar objects from the stop line, nan if no stop line"""
+        if self.stop_line is None:
+            return np.full(len(frame), np.nan)
+        return stop_line_distance(frame.lat, frame.lon, self.stop_line)
+
+    def get_detector_distances(self, ids, now, free_speed=DEFAULT_FREE_SPEED):
+        """Returns the estimated distances of the detector objects, nan if no stop line"""
+        if self.stop_line is None:
+            return np.full(len(ids), np.nan)
+        return detector_distance(self.det_objects.get_ages(ids, now), self.in_det_distance, free_speed)
 
 
 # This is basically only a container for the lane and radar pair
@@ -136,16 +272,12 @@ class LaneRadar:
     
     def get_approaching_objects(self, measurements = 1):
         """Returns the number of approaching vehicles in the lane dedicated to this object"""
-        # Old simle implementation
-        objects = self.radar.get_object_list(measurements= measurements)
-        objects_in_lane = []
-        for obj in objects:
-            # print(obj['lane'], '  ', self.lane)
-            if str(obj['lane']) == self.lane:
-                objects_in_lane.append(obj)
-                # vt = str(obj['vtype'])
-                # print('Radar lane: ', self.lane, 'Vtype: ')  #DBIK 202511
-        return objects_in_lane
+        return self.get_approaching_frame(measurements).objects
+
+    def get_approaching_frame(self, measurements = 1):
+        """Returns the objects in the lane as a RadarFrame"""
+        # The radar has decoded the frame to columns at ingest
+        return self.radar.get_lane_frame(self.lane, measurements= measurements)
 
 
 
@@ -159,9 +291,28 @@ class FieldOfView:
         self.name = name
         self.params = params
         self.view_type = params.get('type', "")
-        if params.get('trigger', False) == 'time':
-            self.trigger_time = params.get('trigger_time', None)
+        self.trigger = params.get('trigger', 'time')
+        if self.trigger == 'time':
+            self.trigger_time = params.get('trigger_time', DEFAULT_TRIGGER_TIME)
+        elif self.trigger == 'change':
+            # Output is sent when the inputs change, coalesced and rate limited
+            self.coalesce_time = params.get('coalesce_time', DEFAULT_COALESCE_TIME)
+            self.min_interval = params.get('min_interval', DEFAULT_MIN_INTERVAL)
+            self.max_interval = params.get('max_interval', DEFAULT_MAX_INTERVAL)
+        else:
+            print("Trigger: {} not supported in view: {}".format(self.trigger, name))
+        self.scheduler = None # TimerWheel running the output, set by schedule_output
+        self.output_job = None
+        self.last_sent_at = 0.0 # seconds (epoch)
         self.nats_output_subject = params.get('nats_output_subject', None)
+        # Radar and detector association
+        fusion_params = params.get('fusion', {})
+        self.gate_distance = fusion_params.get('gate_distance', DEFAULT_GATE_DISTANCE)
+        self.free_speed = fusion_params.get('free_speed', DEFAULT_FREE_SPEED)
+        self.output_functions = [] # Functions called with every output (dict)
+        # Rolling statistics sent with the e3 output, empty list disables
+        self.stats_windows = params.get('stats_windows', DEFAULT_WINDOWS)
+        self.stats = RollingStats(self.stats_windows)
 
         # We add the lanes, note that input streams are not added here
         # They are added after all the radar/detector objects are created
@@ -169,10 +320,12 @@ class FieldOfView:
         self.lanes = []
         lane_params = params.get('lanes', [])
         for lane_param in lane_params:
-            lane = Lane(lane_param)
+            lane = Lane(lane_param, self.stats_windows)
             self.lanes.append(lane)
         self.group_name = params.get('group', None)
         self.group = None
+        # Queue lengths of the lanes, keys of the params as in QueueEstimator
+        self.queue_estimator = QueueEstimator(len(self.lanes), **params.get('queue_estimator', {}))
         # Omit the dets if told so in the config
         # If not set, we assume they are working
         self.detectors_broken = False
@@ -191,12 +344,37 @@ class FieldOfView:
         # Note: lane will make sure only the correct ones are assigned
         for lane in self.lanes:
             lane.assign_radars(radars)
+            for lane_radar in lane.input_radars.values():
+                self.follow_input(lane_radar.radar)
 
     def assign_detectors(self, detectors):
         """Assigns detectors to the field of view"""
         # Note: lane will make sure only the correct ones are assigned
         for lane in self.lanes:
             lane.assign_detectors(detectors)
+            for det in list(lane.in_dets.values()) + list(lane.out_dets.values()):
+                self.follow_input(det)
+
+    def follow_input(self, sensor):
+        """With change trigger, the view is marked changed when the sensor gets new data"""
+        if self.trigger == 'change':
+            sensor.add_update_function(self.mark_inputs_changed)
+
+    def add_output_function(self, func):
+        """Adds a function to be called with every output of the view"""
+        if func not in self.output_functions:
+            self.output_functions.append(func)
+
+    def mark_inputs_changed(self):
+        """
+            Called by the input sensors when they receive new data
+            The output is woken after the coalesce time, not more often than min interval
+        """
+        if self.output_job is None:
+            return
+        now = self.scheduler.clock() # The intervals are measured with the clock of the wheel
+        delay = max(self.coalesce_time, self.last_sent_at + self.min_interval - now)
+        self.scheduler.wake(self.output_job, delay)
 
     def assign_groups(self, groups):
         """Assigns groups to the field of view"""
@@ -207,6 +385,7 @@ class FieldOfView:
             if group.group_id == self.group_name:
                 self.group = group
                 self.group.add_reset_counter_function(self.reset_lane_detector_vehcounters)
+                self.follow_input(self.group)
 
     def get_output_detectors(self):
         """Returns the output detectors"""
@@ -269,12 +448,17 @@ class FieldOfView:
     " This function find the radar objects from all all lanes DBIK20251107"
     def get_objects_in_all_lanes(self):
         """Returns the number of approaching vehicles"""
-        detected_objects = []
+        return self.get_frame_in_all_lanes().objects
+
+    def get_frame_in_all_lanes(self, lane_frames=None):
+        """Returns the radar objects from all the lanes as a RadarFrame (lane frames in lane order)"""
+        if lane_frames is None:
+            lane_frames = [lane.get_detected_frame_e3() for lane in self.lanes]
+        frames = []
         lane_cnt = 0
-        for lane in self.lanes:
-            det_objs = lane.get_detected_objects_e3()
-            detected_objects += det_objs
-            rad_obj_cnt = len(det_objs)
+        for det_frame in lane_frames:
+            frames.append(det_frame)
+            rad_obj_cnt = len(det_frame)
             # if self.name == "group1_view":
                 # print("Radar objs:", rad_obj_cnt, " Lane: ", lane.name)
             if lane_cnt > 0:
@@ -282,13 +466,37 @@ class FieldOfView:
             self.out_str += str(rad_obj_cnt) + " "
             lane_cnt += 1
             
-
-        all_rad_obj_cnt = len(detected_objects)
+        detected_frame = RadarFrame.concatenate(frames)
+        all_rad_obj_cnt = len(detected_frame)
         # if self.name == "group1_view":
         # print("All Radar objs:", all_rad_obj_cnt, "View: ", self.name)
         self.out_str += "= " + str(all_rad_obj_cnt) 
 
-        return detected_objects
+        return detected_frame
+
+    def update_stats(self, now, lane_frames=None):
+        """Updates the rolling statistics of the lanes and the view (lane frames in lane order)"""
+        if lane_frames is None:
+            lane_frames = [lane.get_detected_frame_e3() for lane in self.lanes]
+        red = not self.group.is_green() if self.group else False
+        view_changes = {'passed': 0, 'arrivals': 0, 'speed_sum': 0.0, 'speed_count': 0, 'queue': 0}
+        occupancies = []
+        for lane, frame in zip(self.lanes, lane_frames, strict=True):
+            changes = lane.get_stats_changes(frame)
+            lane.stats.update(now, red=red, **changes)
+            for key in view_changes:
+                view_changes[key] += changes[key]
+            if changes['occupancy'] is not None:
+                occupancies.append(changes['occupancy'])
+        view_changes['occupancy'] = sum(occupancies) / len(occupancies) if occupancies else None
+        self.stats.update(now, red=red, **view_changes)
+
+    def get_stats(self, now):
+        """Returns the rolling statistics of the view and the lanes"""
+        stats = {}
+        stats['view'] = self.stats.get_stats(now)
+        stats['lanes'] = {lane.name: lane.stats.get_stats(now) for lane in self.lanes}
+        return stats
 
     def reset_lane_detector_vehcounters(self):
         """Resets the vehcounts to zero for all the lanes"""
@@ -296,22 +504,69 @@ class FieldOfView:
             lane.reset_detector_based_vehcount
             ()
 
-    # Async function for sending the data out
-    async def send_nats_messages(self, nats):
-        """Send the queue lengths to the nats"""
-        while True:
-            await asyncio.sleep(self.trigger_time)
-            if self.view_type == "grp_view":
-                out_data = self.get_linewise_output()
-            elif self.view_type == "e3":
-                out_data = self.get_e3_area_output()
-            else:
-                print("Type: {} not supported".format(self.view_type))
-                continue
-            if self.nats_output_subject:
-                await nats.publish(self.nats_output_subject, json.dumps(out_data).encode())
-                #print(f"Sent queue data from {self.name}: {queue_lengths}")
+    def update_queue_estimate(self, now, lane_frames):
+        """Updates the queue estimates of the lanes with the detector counts, radar frames and group state"""
+        estimator = self.queue_estimator
+        counts = np.array([lane.get_detector_counts() for lane in self.lanes], dtype=float).reshape(-1, 2)
+        # Broken detectors are not counted
+        has_in = [bool(lane.in_dets) and not self.detectors_broken for lane in self.lanes]
+        has_out = [bool(lane.out_dets) and not self.detectors_broken for lane in self.lanes]
+        green = self.group.is_green() if self.group else False
+        estimator.predict(now, counts[:, 0], counts[:, 1], has_in, has_out, green)
+        radar_counts = np.full(len(self.lanes), np.nan)
+        radar_quality = np.ones(len(self.lanes))
+        tails = np.full(len(self.lanes), np.nan)
+        now_ns = seconds_to_ns(now)
+        for i, (lane, frame) in enumerate(zip(self.lanes, lane_frames, strict=True)):
+            if not lane.has_live_radar(now_ns):
+                continue # An empty frame is not a measurement
+            radar_counts[i] = len(frame)
+            if len(frame):
+                radar_quality[i] = quality_share(frame.quality).mean()
+            if lane.stop_line is not None:
+                tails[i] = radar_queue_tail(lane.get_radar_distances(frame), frame.speed,
+                                            jam_spacing=estimator.jam_spacing)
+        estimator.update(radar_counts, radar_quality)
+        estimator.update_queue(tails, [lane.in_det_distance for lane in self.lanes],
+                               [lane.get_in_det_occupied_time(now_ns) for lane in self.lanes])
+
+    def get_queue_output(self):
+        """Returns the queue estimates of the lanes as dict of lane name -> estimate"""
+        return {lane.name: self.queue_estimator.get_lane_output(i) for i, lane in enumerate(self.lanes)}
+
+    def is_idle(self):
+        """Returns true if the outputs of the view are not used"""
+        return not self.nats_output_subject and not self.output_functions
+
+    def schedule_output(self, scheduler, nats):
+        """Adds the output of the view to the scheduler, returns the job (None if idle)"""
+        if self.is_idle() or self.trigger not in ('time', 'change'):
+            return None
+        self.scheduler = scheduler
+        func = functools.partial(self.send_output, nats)
+        if self.trigger == 'time':
+            self.output_job = scheduler.add_periodic(self.name, func, self.trigger_time)
+        else:
+            # Sent also when nothing changes
+            self.output_job = scheduler.add_periodic(self.name, func, self.max_interval, align=False)
+        return self.output_job
 
+    # Async function for sending the data out
+    async def send_output(self, nats):
+        """Computes and sends the output of the view"""
+        if self.view_type == "grp_view":
+            out_data = self.get_linewise_output()
+        elif self.view_type == "e3":
+            out_data = self.get_e3_area_output()
+        else:
+            print("Type: {} not supported".format(self.view_type))
+            return
+        self.last_sent_at = self.scheduler.clock() if self.scheduler else time.time()
+        for func in self.output_functions:
+            func(out_data)
+        if self.nats_output_subject:
+            await nats.publish(self.nats_output_subject, json.dumps(out_data).encode())
+            #print(f"Sent queue data from {self.name}: {queue_lengths}")
 
     def get_linewise_output(self):
         """Returns a dictionary for the queue output type"""
@@ -326,40 +581,35 @@ class FieldOfView:
         data['tstamp'] = datetime.datetime.now().timestamp() * 1000
         return data
     
+    def select_sent_radar_objects(self, frame):
+        """Returns the indices of the radar objects to be sent and the vehicle types of the frame"""
+        # Note: we only add the types of objects we know, this is a temporary solution
+        # Sumo simengine does not map types and lanes correctly (yet)
+        vtypes = frame.map_classes(VECLASS_FROM_RADAR_TO_SUMO)
+        unknown = np.flatnonzero(np.equal(vtypes, None))
+        if len(unknown):
+            vehclasses_radar = {str(frame.objects[i].get('class', None)) for i in unknown.tolist()}
+            print(f"Warning: Vehicle class not found for radar class: {', '.join(sorted(vehclasses_radar))}")
+        # At this stage, we only send cars, trucks and bikes. Also unknown types are not sent
+        return np.flatnonzero(np.isin(vtypes, SENT_VTYPES)), vtypes
+
+    @staticmethod
+    def radar_output_object(frame, i, vtype):
+        """Returns the id and the output object of the i:th radar object of the frame"""
+        obj = frame.objects[i]
+        new_obj = {}
+        obj_id = frame.ids[i] if frame.ids[i] is not None else uuid.uuid4()
+        new_obj['speed'] = obj.get('speed', None)
+        new_obj['quality'] = obj.get('quality', 99)
+        new_obj['sumo_id'] = obj.get('sumo_id', None)
+        new_obj['vtype'] = vtype
+        return obj_id, new_obj
+
     def get_objects_detected_by_radars(self):
         """Returns all the objects detected by the radars"""
-        detected_objects = self.get_objects_in_all_lanes()
-        det_obj_dict = {}
-        for obj in detected_objects:
-            new_obj = {}
-            obj_id = obj.get('id', uuid.uuid4())
-            new_obj['speed'] = obj.get('speed', None)
-            new_obj['quality'] = obj.get('quality', 99)
-            new_obj['sumo_id'] = obj.get('sumo_id', None)
-
-            # Note: we only add the types of objects we know, this is a temporary solution
-            # Sumo simengine does not map types and lanes correctly (yet)
-           
-            vehclass_radar = obj.get('class', None)   
-            
-            """
-            if vehclass_radar in ["bike_type"]: 
-                vehclass_sumo = obj.get('class', None)  #DBIK102025 Omit Sumo vehclass mapping 
-                BP = 1   #DBIK102025 Added breakpoint for bike_type
-            else: """
-
-            vehclass_sumo = VECLASS_FROM_RADAR_TO_SUMO.get(vehclass_radar, None)
-                           
-            new_obj['vtype'] = vehclass_sumo
-           
-            if not vehclass_sumo:
-                print(f"Warning: Vehicle class not found for radar class: {vehclass_radar}")
-            
-            # At this stage, we only send cars and trucs. Also unknown types are not sent
-            if vehclass_sumo in ['car_type', 'truck_type', 'bike_type']:  #DBIK2025 Added bike_type
-                det_obj_dict[obj_id] = new_obj
-
-        return det_obj_dict
+        frame = self.get_frame_in_all_lanes()
+        selected, vtypes = self.select_sent_radar_objects(frame)
+        return dict(self.radar_output_object(frame, i, vtypes[i]) for i in selected.tolist())
     
     def get_objects_detected_by_detectors(self):
         """Returns all the objects detected by the detectors"""
@@ -368,18 +618,27 @@ class FieldOfView:
             det_obj_dict.update(lane.get_objects_detected_by_detectors())
         return det_obj_dict
 
-    def get_objects_combined_from_radar_and_detectors(self):
-        """Returns the combined objects from radar and detectors"""
+    def get_objects_combined_from_radar_and_detectors(self, lane_frames=None):
+        """
+            Returns the radar objects, the detector objects and the fused objects
+            The radar objects are associated with the detector counted vehicles
+            of the same lane, every fused object has a source (fused, radar or
+            detector_count) and a confidence (0..1). A lane has as many fused
+            objects as the larger of its radar and detector counts.
+        """
         vehcounts = {
             'radar': None,
             'det': None,
             'combined': None
         }
-        
-        radar_objs = self.get_objects_detected_by_radars()
-        detector_objs = self.get_objects_detected_by_detectors()
+        now = time.time()
+        if lane_frames is None:
+            lane_frames = [lane.get_detected_frame_e3() for lane in self.lanes]
+        frame = self.get_frame_in_all_lanes(lane_frames)
+        selected, vtypes = self.select_sent_radar_objects(frame)
+        radar_items = [self.radar_output_object(frame, i, vtypes[i]) for i in selected]
+        radar_objs = dict(radar_items)
         vehcounts['radar'] = radar_objs
-        vehcounts['det'] = detector_objs
 
         rad_veh_count = len(vehcounts['radar'])
         if (self.group_name == "group16") and (rad_veh_count > 0):
@@ -387,34 +646,57 @@ class FieldOfView:
 
         # No dets, no need to combine
         if self.detectors_broken:
+            vehcounts['det'] = {}
+            confidence = quality_share(frame.quality[selected])
+            for (_, obj), conf in zip(radar_items, confidence.tolist(), strict=True):
+                obj['source'] = "radar"
+                obj['confidence'] = conf
             vehcounts['combined'] = radar_objs
             return vehcounts
-            
-        obj_count_diff = len(radar_objs) - len(detector_objs)
-        # More detector objects than radar objects
-        if obj_count_diff < 0:
-            # We add the missing objects to the radar objects
-            added_objects = 0
-            all_objects = radar_objs.copy()
-
-            for obj_id, obj in detector_objs.items():
-                if added_objects >= abs(obj_count_diff):
-                    break
-                if obj_id not in radar_objs:
-                    all_objects[obj_id] = obj
-                    added_objects += 1
-            vehcounts['combined'] = all_objects 
-            return vehcounts
-        # More radar objects than detector objects
-        elif obj_count_diff > 0:
-            # We sort the radar objects by the quality parameter
-            sorted_radar_objs = sorted(radar_objs.items(), key=lambda x: x[1].get('quality', 0), reverse=True)
-            # We add the missing objects to the detector objects
-            # but for now we return the radar objects
-            # This is a temporary solution
-        vehcounts['combined'] = radar_objs # Tmp
+
+        # Detector counted vehicles with lane and estimated distance
+        det_items = []
+        det_lane = []
+        det_dist = []
+        for lane_index, lane in enumerate(self.lanes):
+            lane_objs = lane.get_objects_detected_by_detectors(now)
+            det_items.extend(lane_objs.items())
+            det_lane.extend([lane_index] * len(lane_objs))
+            det_dist.append(lane.get_detector_distances(list(lane_objs), now, self.free_speed))
+        det_lane = np.array(det_lane, dtype=np.int64)
+        det_dist = np.concatenate(det_dist) if det_dist else np.zeros(0)
+        vehcounts['det'] = dict(det_items)
+
+        lane_sizes = [len(f) for f in lane_frames]
+        radar_lane = np.repeat(np.arange(len(lane_frames)), lane_sizes)[selected]
+        radar_dist = [lane.get_radar_distances(f) for lane, f in zip(self.lanes, lane_frames, strict=True)]
+        radar_dist = np.concatenate(radar_dist + [np.zeros(0)])[selected]
+        rows, cols, radar_conf, det_conf = associate(
+            radar_lane, radar_dist, frame.quality[selected], det_lane, det_dist,
+            self.gate_distance)
+
+        for (_, obj), conf in zip(radar_items, radar_conf.tolist(), strict=True):
+            obj['source'] = "radar"
+            obj['confidence'] = conf
+        for row, col in zip(rows.tolist(), cols.tolist(), strict=True):
+            obj = radar_items[row][1]
+            obj['source'] = "fused"
+            obj['det_id'] = det_items[col][0]
+        # The vehicles not seen by the radar, only as many as the detectors
+        # count more than the radar in the lane (oldest first)
+        combined = radar_objs.copy()
+        unmatched = np.ones(len(det_items), dtype=bool)
+        unmatched[cols] = False
+        n_lanes = len(self.lanes)
+        missing = np.bincount(det_lane, minlength=n_lanes) - np.bincount(radar_lane, minlength=n_lanes)
+        for col in np.flatnonzero(unmatched).tolist():
+            if missing[det_lane[col]] <= 0:
+                continue
+            missing[det_lane[col]] -= 1
+            obj_id, obj = det_items[col]
+            combined[obj_id] = dict(obj, confidence=float(det_conf[col]))
+        vehcounts['combined'] = combined
         return vehcounts
-        
 
 
     def get_e3_area_output(self):
@@ -428,7 +710,8 @@ class FieldOfView:
 
         #det_obj_dict = self.get_objects_detected_by_radars()
         #det_obj_dict = self.get_objects_detected_by_detectors()
-        det_obj_dict = self.get_objects_combined_from_radar_and_detectors()
+        lane_frames = [lane.get_detected_frame_e3() for lane in self.lanes]
+        det_obj_dict = self.get_objects_combined_from_radar_and_detectors(lane_frames)
         data['count'] = len(det_obj_dict['combined'])
 
         det_vehcount = self.get_detector_based_vehcount()
@@ -449,7 +732,13 @@ class FieldOfView:
         data['view_name'] = self.name
         data['objects'] = det_obj_dict['combined']
         data['offsets'] = self.get_lane_offsets_as_dict()
-        data['tstamp'] = datetime.datetime.now().timestamp() * 1000
+        now = datetime.datetime.now().timestamp()
+        self.update_queue_estimate(now, lane_frames)
+        data['queues'] = self.get_queue_output()
+        if self.stats:
+            self.update_stats(now, lane_frames)
+            data['stats'] = self.get_stats(now)
+        data['tstamp'] = now * 1000
 
         #print(self.out_str)
         return data
\ No newline at end of file
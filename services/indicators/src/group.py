@@ -2,14 +2,34 @@
 # Note: A lot of cunctionality is the same for many types, 
 # maybe we should inherit these
 
-import datetime
 import json
+import sys
+import time
+from collections import deque, namedtuple
+# Flat imports when run as a script, relative when imported as a package (tests)
+if __package__:
+    from .timed_buffer import TimedRingBuffer
+    from .timestamps import NS_PER_SECOND, parse_tstamp, seconds_to_ns
+    from .stream_metrics import StreamMetrics, DEFAULT_STALE_AFTER
+else:
+    from timed_buffer import TimedRingBuffer
+    from timestamps import NS_PER_SECOND, parse_tstamp, seconds_to_ns
+    from stream_metrics import StreamMetrics, DEFAULT_STALE_AFTER
 
 
 # Note: should be configureable
-DEFAULT_CLEANUP_INTERVAL = 10 # seconds
 DEFAULT_OLD_DATA_TRESHOLD = 60 # seconds 
+DEFAULT_HISTORY_SIZE = 600 # status messages, i.e. 60 s at 10 Hz
+DEFAULT_TRANSITION_LOG_SIZE = 100 # substate changes
 DEFAULT_SEND_INTERVAL = 1 # seconds
+DEFAULT_INTAKE_POLICY = 'lossless' # no messages are dropped under load
+
+GREEN_SUBSTATES = frozenset(['1', '4', '5'])
+
+# Compact status history item, the substate is an interned string, times in ns (epoch)
+GroupStatus = namedtuple('GroupStatus', ['data_sent', 'data_received', 'substate'])
+# Substate change, time is data received in ns (epoch)
+GroupTransition = namedtuple('GroupTransition', ['time', 'from_substate', 'to_substate'])
 
 class Group:
     """A class for handling signal groups"""
@@ -17,7 +37,17 @@ class Group:
     def __init__(self, group_id, group_params):
         self.group_id = group_id
         self.group_params = group_params
-        self.data = []
+        self.update_functions = [] # Functions to trigger when new data is received
+        self.archive = None # ArchiveWriter, set by the sensor twin
+        self.metrics = StreamMetrics(group_id, group_params.get('stream', {}).get('stale_after', DEFAULT_STALE_AFTER))
+        # Status history, old items are evicted when new ones are added
+        self.data = TimedRingBuffer(
+            capacity=group_params.get('history_size', DEFAULT_HISTORY_SIZE),
+            max_age=group_params.get('history_length', DEFAULT_OLD_DATA_TRESHOLD),
+            units_per_second=NS_PER_SECOND)
+        # Only the substate changes, for longer term queries than the history
+        self.transitions = deque(maxlen=group_params.get('transition_log_size', DEFAULT_TRANSITION_LOG_SIZE))
+        self.green_ended_at = None # ns (epoch)
         self.substate = ""
         self.is_red_b = None
         self.reset_counter_functions = [] # Functions to trigger counter reset
@@ -45,23 +75,64 @@ class Group:
     def add_data(self, data):
         """Adds data to the group"""
         #print(f"Group {self.group_id} got data: {data}")
-        self.data.append(data)
+        substate = sys.intern(data['substate'])
+        received = data['data_received']
+        self.metrics.record(received, data.get('data_sent'))
+        if self.archive:
+            self.archive.add_group_status(self.group_id, received, substate)
+        self.data.append(GroupStatus(data.get('data_sent'), received, substate), received)
+
+        last = self.get_logged_substate()
+        if substate != last:
+            self.transitions.append(GroupTransition(received, last, substate))
+            if last in GREEN_SUBSTATES and substate not in GREEN_SUBSTATES:
+                self.green_ended_at = received
 
     def remove_old_data(self, treshold=DEFAULT_OLD_DATA_TRESHOLD):
-        "Removes all data with sent timestamp older than treshold"
-        now = datetime.datetime.now()
-        for data in self.data:
-            if 'data_sent' in data:
-                data_sent = data['data_sent']
-                diff = now - data_sent
-                if diff.total_seconds() > treshold:
-                    self.data.remove(data)
+        "Removes all data with received timestamp older than treshold"
+        self.data.evict_older_than(time.time_ns() - seconds_to_ns(treshold))
 
     def get_last_data(self):
-        """Returns the last data"""
-        if len(self.data) == 0:
+        """Returns the last data, None if nothing received within the history length"""
+        self.data.evict_stale() # A silent group must not serve its last status forever
+        return self.data.last()
+
+    def is_green(self):
+        """Returns true if the last known substate is green"""
+        return self.substate in GREEN_SUBSTATES
+
+    def get_logged_substate(self):
+        """Returns the substate of the last logged change, None if nothing logged"""
+        return self.transitions[-1].to_substate if self.transitions else None
+
+    def time_since_last_green(self, now=None):
+        """
+            Returns seconds since the group was last green, 0.0 if green now
+            and None if the group has not been green since the start (now in epoch ns)
+        """
+        if self.get_logged_substate() in GREEN_SUBSTATES:
+            return 0.0
+        if self.green_ended_at is None:
             return None
-        return self.data[-1]
+        if now is None:
+            now = time.time_ns()
+        return (now - self.green_ended_at) / NS_PER_SECOND
+
+    def get_transitions(self, since=None):
+        """Returns the logged substate changes, optionally only those after since (epoch ns)"""
+        if since is None:
+            return list(self.transitions)
+        return [tr for tr in self.transitions if tr.time >= since]
+
+    def add_update_function(self, func):
+        """Adds a function to be called when new data is received"""
+        if func not in self.update_functions:
+            self.update_functions.append(func)
+
+    def trigger_update_functions(self):
+        """Triggers the update functions"""
+        for func in self.update_functions:
+            func()
 
     def get_nats_sub_params(self):
         """
@@ -73,6 +144,10 @@ class Group:
         params = {}
         params['subject'] = self.nats_subject
         params['callback'] = self.nats_callback
+        # Intake queue between the subscription and the callback
+        stream_params = self.group_params.get('stream', {})
+        params['intake_policy'] = stream_params.get('intake_policy', DEFAULT_INTAKE_POLICY)
+        params['intake_size'] = stream_params.get('intake_size', None)
         return params    
     
     def add_reset_counter_function(self, func):
@@ -96,12 +171,6 @@ class Group:
     #
     # ASYNC functions
     #
-    async def cleanup_old_data(self):
-        """Removes old data, this should be a separate task running at alla times"""
-        while True:
-            await asyncio.sleep(DEFAULT_CLEANUP_INTERVAL)
-            self.remove_old_data()
-
     async def nats_callback(self, msg):
         """The callback function for the nats and is assigned to the subscription"""
         subject = msg.subject
@@ -109,18 +178,13 @@ class Group:
         data = msg.data.decode()
         #print(f"Received a message on '{subject} {reply}': {data}")
         data_dict = json.loads(data)
-        if 'tstamp' in data_dict:
-            tstamp = data_dict['tstamp']
-            #tstamp_in_datetime = datetime.datetime.fromtimestamp(tstamp/1000)
-            if '.' in tstamp:
-                split_by_dot = tstamp.split(".")
-                tstamp = split_by_dot[0] + "." + split_by_dot[1][:6] # Remove the last digits
-            
-            tstamp_in_datetime = datetime.datetime.fromisoformat(tstamp) # Note: this id different from radar
-            tstamp_now = datetime.datetime.now()
-            data_dict['data_sent'] = tstamp_in_datetime
-            data_dict['data_received'] = tstamp_now
+        # Received time (epoch ns) is always set, the history is indexed with it
+        data_dict['data_received'] = time.time_ns()
+        sent = parse_tstamp(data_dict.get('tstamp')) # ISO string or epoch ms
+        if sent is not None:
+            data_dict['data_sent'] = sent
         self.add_data(data_dict)
+        self.trigger_update_functions()
 
         # Reset counters for views 
         if data_dict['substate'] in ['b','B']:
@@ -133,7 +197,7 @@ class Group:
             self.trigger_counter_block_functions(False)
 
         # Strore values for future use
-        self.substate = data_dict['substate']
+        self.substate = sys.intern(data_dict['substate'])
         if self.substate in ['r']:
             self.is_red_b = True
         else:
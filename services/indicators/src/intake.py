@@ -0,0 +1,112 @@
+"""Bounded intake queues for the NATS subscriptions
+
+The subscription callback only puts the raw message into the queue of the
+stream, the decoding and processing is done by a separate task. Thus the
+socket reader is never blocked by the processing and the queues do not grow
+without limit when the data comes in bursts. Two policies are available:
+    latest: when the queue is full the oldest message is dropped (radar frames,
+        only the newest frame matters)
+    lossless: when the queue is full the subscription waits for space, nothing
+        is dropped (detector edges and signal group changes)
+"""
+
+import asyncio
+import datetime
+import json
+from collections import deque
+
+POLICIES = ("latest", "lossless")
+DEFAULT_LATEST_SIZE = 1 # messages
+DEFAULT_LOSSLESS_SIZE = 1000 # messages
+DEFAULT_STATS_INTERVAL = 5 # seconds
+INTAKE_STATS_SUBJECT = "indicators.intake"
+
+
+class IntakeQueue:
+    """Bounded queue between a subscription and the processing of its messages"""
+
+    def __init__(self, name, callback, policy="lossless", size=None):
+        if policy not in POLICIES:
+            raise ValueError("Unknown intake policy: {}".format(policy))
+        if size is None:
+            size = DEFAULT_LATEST_SIZE if policy == "latest" else DEFAULT_LOSSLESS_SIZE
+        if size <= 0:
+            raise ValueError("Intake queue size must be positive")
+        self.name = name
+        self.callback = callback # Async function processing one message
+        self.policy = policy
+        self.size = size
+        self.messages = deque()
+        self.not_empty = asyncio.Event()
+        self.not_full = asyncio.Event()
+        self.not_full.set()
+        # Statistics
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+        self.errors = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __str__(self):
+        return "IntakeQueue {}: {}/{} ({}), dropped {}".format(
+            self.name, len(self), self.size, self.policy, self.dropped)
+
+    async def put(self, msg):
+        """The subscription callback, stores the message"""
+        self.received += 1
+        if len(self.messages) >= self.size:
+            if self.policy == "latest":
+                self.messages.popleft()
+                self.dropped += 1
+            else:
+                while len(self.messages) >= self.size:
+                    self.not_full.clear()
+                    await self.not_full.wait()
+        self.messages.append(msg)
+        self.max_depth = max(self.max_depth, len(self.messages))
+        self.not_empty.set()
+
+    async def get(self):
+        """Returns the oldest message, waits if there are none"""
+        while not self.messages:
+            self.not_empty.clear()
+            await self.not_empty.wait()
+        msg = self.messages.popleft()
+        self.not_full.set()
+        return msg
+
+    async def run(self):
+        """Processes the messages with the callback"""
+        while True:
+            msg = await self.get()
+            try:
+                await self.callback(msg)
+            except Exception as error: # A bad message must not stop the stream
+                self.errors += 1
+                print(f"Error processing message from {self.name}: {error}")
+            self.processed += 1
+
+    def get_stats(self):
+        """Returns the queue statistics as dict"""
+        stats = {}
+        stats["policy"] = self.policy
+        stats["size"] = self.size
+        stats["depth"] = len(self.messages)
+        stats["max_depth"] = self.max_depth
+        stats["received"] = self.received
+        stats["dropped"] = self.dropped
+        stats["processed"] = self.processed
+        stats["errors"] = self.errors
+        return stats
+
+
+async def send_intake_stats(nats, queues, subject=INTAKE_STATS_SUBJECT):
+    """Sends the statistics of the intake queues (every DEFAULT_STATS_INTERVAL by the scheduler)"""
+    data = {}
+    data["queues"] = {queue.name: queue.get_stats() for queue in queues}
+    data["dropped"] = sum(queue.dropped for queue in queues)
+    data["tstamp"] = datetime.datetime.now().timestamp() * 1000
+    await nats.publish(subject, json.dumps(data).encode())
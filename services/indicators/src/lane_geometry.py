@@ -0,0 +1,143 @@
+"""Spatial lane assignment of the radar objects
+
+The lanes of a radar can be given as polygons or as centrelines with a width
+(lat/lon points). The geometries are projected to local metres and indexed in
+a uniform grid when the radar is created. For a frame, the grid gives the
+candidate lanes of every object and only the candidates are tested exactly, all
+as array operations over the objects of the frame. Objects outside all the
+lanes get no lane, objects inside several lanes get the one whose centreline
+is nearest (polygons count as distance 0, the first polygon wins).
+"""
+
+import numpy as np
+
+EARTH_RADIUS = 6371000.0 # m
+DEFAULT_CELL_SIZE = 5.0 # m, grid cell side
+DEFAULT_LANE_WIDTH = 3.5 # m, for the centrelines
+NO_LANE = "None" # Lane of the objects outside the lanes, as RadarFrame has for missing lanes
+
+
+class LaneGeometry:
+    """The lane polygons and centrelines of one radar with a grid index"""
+
+    def __init__(self, lanes, cell_size=DEFAULT_CELL_SIZE):
+        """
+            lanes: dict of lane (as in the radar data) -> geometry, the geometry is either
+                {"polygon": [[lat, lon], ...]} or
+                {"centreline": [[lat, lon], ...], "width": m}
+        """
+        if not lanes:
+            raise ValueError("Lane geometry has no lanes")
+        if cell_size <= 0:
+            raise ValueError("Grid cell size must be positive")
+        self.cell_size = cell_size
+        self.names = np.array([str(name) for name in lanes], dtype=str)
+        points = []
+        for name, geometry in lanes.items():
+            coords = geometry.get("polygon", geometry.get("centreline"))
+            if coords is None or len(coords) < (3 if "polygon" in geometry else 2):
+                raise ValueError("Lane {} needs a polygon or a centreline".format(name))
+            points.extend(coords)
+        points = np.asarray(points, dtype=float)
+        self.origin = points.mean(axis=0) # lat, lon
+        self.polygons = {} # lane index -> (n, 2) array of vertices
+        self.centrelines = {} # lane index -> ((n, 2) array of points, half width)
+        bounds = []
+        for i, geometry in enumerate(lanes.values()):
+            if "polygon" in geometry:
+                vertices = self.project(*np.asarray(geometry["polygon"], dtype=float).T)
+                self.polygons[i] = vertices
+                margin = 0.0
+            else:
+                vertices = self.project(*np.asarray(geometry["centreline"], dtype=float).T)
+                margin = geometry.get("width", DEFAULT_LANE_WIDTH) / 2.0
+                self.centrelines[i] = (vertices, margin)
+            bounds.append((vertices.min(axis=0) - margin, vertices.max(axis=0) + margin))
+        self._build_grid(bounds)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __str__(self):
+        return "LaneGeometry: {} lanes, grid {}x{} cells".format(len(self), *self.grid.shape[1:])
+
+    def project(self, lat, lon):
+        """Returns the (n, 2) array of x, y in metres from the origin"""
+        lat0 = np.radians(self.origin[0])
+        x = np.radians(np.asarray(lon, dtype=float) - self.origin[1]) * np.cos(lat0) * EARTH_RADIUS
+        y = np.radians(np.asarray(lat, dtype=float) - self.origin[0]) * EARTH_RADIUS
+        return np.column_stack((x, y))
+
+    def _build_grid(self, bounds):
+        """Marks the cells covered by the bounding box of every lane"""
+        lows = np.array([low for low, _ in bounds])
+        highs = np.array([high for _, high in bounds])
+        self.grid_min = lows.min(axis=0)
+        shape = np.floor((highs.max(axis=0) - self.grid_min) / self.cell_size).astype(int) + 1
+        self.grid = np.zeros((len(bounds), shape[0], shape[1]), dtype=bool)
+        for i, (low, high) in enumerate(bounds):
+            x0, y0 = np.floor((low - self.grid_min) / self.cell_size).astype(int)
+            x1, y1 = np.floor((high - self.grid_min) / self.cell_size).astype(int)
+            self.grid[i, x0:x1 + 1, y0:y1 + 1] = True
+
+    def _candidates(self, xy):
+        """Returns the (lanes, n) mask of the candidate lanes of the points"""
+        cells = np.floor((xy - self.grid_min) / self.cell_size)
+        inside = np.all(np.isfinite(cells), axis=1) & (cells[:, 0] >= 0) & (cells[:, 1] >= 0) \
+            & (cells[:, 0] < self.grid.shape[1]) & (cells[:, 1] < self.grid.shape[2])
+        candidates = np.zeros((len(self), len(xy)), dtype=bool)
+        index = np.flatnonzero(inside)
+        cx, cy = cells[index].astype(int).T
+        candidates[:, index] = self.grid[:, cx, cy]
+        return candidates
+
+    @staticmethod
+    def _in_polygon(xy, vertices):
+        """Returns the mask of the points inside the polygon (even-odd rule)"""
+        x, y = xy[:, 0:1], xy[:, 1:2]
+        x0, y0 = vertices[:, 0], vertices[:, 1]
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+        crosses = (y0 > y) != (y1 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        return np.count_nonzero(crosses & (x < x_cross), axis=1) % 2 == 1
+
+    @staticmethod
+    def _distance_to_line(xy, points):
+        """Returns the distances of the points to the polyline"""
+        start, end = points[:-1], points[1:]
+        seg = end - start
+        seg_len2 = np.maximum(np.einsum("ij,ij->i", seg, seg), 1e-12)
+        rel = xy[:, None, :] - start[None, :, :]
+        t = np.clip(np.einsum("nij,ij->ni", rel, seg) / seg_len2, 0.0, 1.0)
+        nearest = start[None, :, :] + t[:, :, None] * seg[None, :, :]
+        return np.linalg.norm(xy[:, None, :] - nearest, axis=2).min(axis=1)
+
+    def assign(self, lat, lon, fallback=None):
+        """
+            Returns the lane (as string) of every point
+            fallback: lanes used for the points outside all the lanes, NO_LANE if None
+        """
+        xy = self.project(lat, lon)
+        n = len(xy)
+        distance = np.full((len(self), n), np.inf)
+        candidates = self._candidates(xy)
+        for i, vertices in self.polygons.items():
+            index = np.flatnonzero(candidates[i])
+            if len(index):
+                distance[i, index[self._in_polygon(xy[index], vertices)]] = 0.0
+        for i, (points, half_width) in self.centrelines.items():
+            index = np.flatnonzero(candidates[i])
+            if len(index):
+                d = self._distance_to_line(xy[index], points)
+                within = d <= half_width
+                distance[i, index[within]] = d[within]
+        if fallback is None:
+            lanes = np.full(n, NO_LANE, dtype=object)
+        else:
+            lanes = np.asarray(fallback, dtype=str).astype(object)
+        if n:
+            best = np.argmin(distance, axis=0)
+            found = np.isfinite(distance[best, np.arange(n)])
+            lanes[found] = self.names[best[found]]
+        return lanes.astype(str)
@@ -1,38 +1,366 @@
-"""A relay program for subscribing given channels in a NATs servers and relying them to another"""
+"""A relay program for subscribing given channels in NATS servers and relaying them to others
 
-FROM_NATS_SERVER = "10.8.0.2"
-TO_NATS_SERVER = "10.8.0.201"
+The relay subscribes (wildcards allowed) to the upstream servers, maps the
+subjects with the rewrite rules and publishes the messages to all the
+downstream servers. The messages are buffered in a bounded buffer and
+published in batches, thus a slow downstream connection does not block the
+subscriptions. When the buffer is full the oldest messages are dropped. The
+relay reconnects to the servers automatically and sends its throughput and lag
+counters periodically to the stats subject.
 
-TOPICS_TO_SUBSCRIBE = ["radar.270.1.objects_port.json", "radar.270.2.objects_port.json", "radar.270.3.objects_port.json"]
+Configuration (JSON file, comments allowed), all the keys are optional:
+    {
+        "upstream": ["nats://10.8.0.2:4222"],
+        "downstream": ["nats://10.8.0.201:4222"],
+        "subjects": ["radar.270.*.objects_port.json"],
+        "rewrite": [{"from": "radar.270.*.objects_port.json", "to": "lab.radar.270.$1.objects_port.json"}],
+        "buffer_size": 10000,
+        "max_batch": 500,
+        "flush_interval": 0.05,
+        "compression": "zlib",
+        "stats_subject": "relay.stats",
+        "stats_interval": 5
+    }
+In the rewrite rules $1, $2, ... refer to the tokens matched by the '*'
+wildcards and '>' in the target is replaced by the tokens matched by '>'.
+Compressed messages carry the header Content-Encoding: zlib, a relay receiving
+them decompresses them before relaying (unless it compresses them again).
+"""
 
+import argparse
 import asyncio
+import datetime
+import json
+import time
+import zlib
+from collections import deque
+from jsmin import jsmin
 from nats.aio.client import Client as NATS
+from nats.errors import ConnectionClosedError, ConnectionDrainingError, OutboundBufferLimitError
 
-async def main():
-    # Connect to the NATS servers
-    from_nats = NATS()
-    to_nats = NATS()
+DEFAULT_CONF = {
+    "upstream": ["nats://10.8.0.2:4222"],
+    "downstream": ["nats://10.8.0.201:4222"],
+    "subjects": ["radar.270.1.objects_port.json", "radar.270.2.objects_port.json", "radar.270.3.objects_port.json"],
+    "rewrite": [],
+    "buffer_size": 10000, # messages
+    "max_batch": 500, # messages published before yielding
+    "flush_interval": 0.05, # seconds
+    "compression": None, # None or "zlib"
+    "stats_subject": "relay.stats",
+    "stats_interval": 5 # seconds
+}
+COMPRESSIONS = (None, 'zlib')
+ENCODING_HEADER = "Content-Encoding"
+RECONNECT_TIME_WAIT = 2 # seconds
+# The client buffers the messages while reconnecting, these are raised if it cannot
+PUBLISH_ERRORS = (ConnectionClosedError, ConnectionDrainingError, OutboundBufferLimitError)
 
-    await from_nats.connect(f"nats://{FROM_NATS_SERVER}:4222")
-    await to_nats.connect(f"nats://{TO_NATS_SERVER}:4222")
 
-    # Subscribe to the topics
-    async def message_handler(msg):
-        await to_nats.publish(msg.subject, msg.data)
+class SubjectRewriter:
+    """Maps the subjects with the rewrite rules, the first matching rule is used"""
 
-    for topic in TOPICS_TO_SUBSCRIBE:
-        await from_nats.subscribe(topic, cb=message_handler)
+    def __init__(self, rules=()):
+        self.rules = []
+        for rule in rules:
+            pattern = rule['from'].split('.')
+            if '>' in pattern[:-1]:
+                raise ValueError("'>' must be the last token: {}".format(rule['from']))
+            wildcards = pattern.count('*')
+            for token in rule['to'].split('.'):
+                if token.startswith('$') and token[1:].isdigit() and not 1 <= int(token[1:]) <= wildcards:
+                    raise ValueError("{} has no matching '*' in {}".format(token, rule['from']))
+                if token == '>' and pattern[-1] != '>':
+                    raise ValueError("'>' in the target needs '>' in {}".format(rule['from']))
+            self.rules.append((pattern, rule['to']))
+        self._cache = {} # subject -> mapped subject, the subjects repeat
 
-    # Run the event loop
-    try:
+    def __len__(self):
+        return len(self.rules)
+
+    @staticmethod
+    def match(pattern, tokens):
+        """Returns the wildcard captures and the '>' tail, None if no match"""
+        captures = []
+        for i, token in enumerate(pattern):
+            if token == '>':
+                if i >= len(tokens):
+                    return None
+                return captures, '.'.join(tokens[i:])
+            if i >= len(tokens):
+                return None
+            if token == '*':
+                captures.append(tokens[i])
+            elif token != tokens[i]:
+                return None
+        if len(tokens) != len(pattern):
+            return None
+        return captures, None
+
+    def rewrite(self, subject):
+        """Returns the mapped subject, the subject itself if no rule matches"""
+        mapped = self._cache.get(subject)
+        if mapped is not None:
+            return mapped
+        mapped = subject
+        tokens = subject.split('.')
+        for pattern, target in self.rules:
+            result = self.match(pattern, tokens)
+            if result is None:
+                continue
+            captures, tail = result
+            mapped_tokens = []
+            for token in target.split('.'):
+                if token.startswith('$') and token[1:].isdigit():
+                    token = captures[int(token[1:]) - 1]
+                elif token == '>' and tail is not None:
+                    token = tail
+                mapped_tokens.append(token)
+            mapped = '.'.join(mapped_tokens)
+            break
+        self._cache[subject] = mapped
+        return mapped
+
+
+class RelayBuffer:
+    """Bounded buffer of the messages waiting to be published, drops the oldest when full"""
+
+    def __init__(self, size):
+        if size <= 0:
+            raise ValueError("Relay buffer size must be positive")
+        self.size = size
+        self.messages = deque() # (subject, data, headers, received)
+        self.not_empty = asyncio.Event()
+        self.dropped = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def put(self, subject, data, headers=None, received=None):
+        if received is None:
+            received = time.monotonic()
+        if len(self.messages) >= self.size:
+            self.messages.popleft()
+            self.dropped += 1
+        self.messages.append((subject, data, headers, received))
+        self.max_depth = max(self.max_depth, len(self.messages))
+        self.not_empty.set()
+
+    def take(self, count):
+        """Returns up to count oldest messages"""
+        batch = []
+        while self.messages and len(batch) < count:
+            batch.append(self.messages.popleft())
+        if not self.messages:
+            self.not_empty.clear()
+        return batch
+
+
+class RelayStats:
+    """Throughput and lag counters of the relay"""
+
+    def __init__(self):
+        self.received = 0
+        self.relayed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = 0
+        self.unpublished = 0
+        self.reconnects = 0
+        self.disconnects = 0
+        self.lag_sum = 0.0
+        self.lag_max = 0.0
+        self.batches = 0
+        self.interval_started = time.monotonic()
+
+    def add_lag(self, lag):
+        self.lag_sum += lag
+        if lag > self.lag_max:
+            self.lag_max = lag
+
+    def get_stats(self, buffer, now=None, reset=True):
+        """Returns the counters of the interval as dict, starts a new interval if reset"""
+        if now is None:
+            now = time.monotonic()
+        elapsed = max(now - self.interval_started, 1e-9)
+        stats = {}
+        stats['received'] = self.received
+        stats['relayed'] = self.relayed
+        stats['in_rate'] = self.received / elapsed # msg/s
+        stats['out_rate'] = self.relayed / elapsed # msg/s
+        stats['bytes_in'] = self.bytes_in
+        stats['bytes_out'] = self.bytes_out
+        stats['lag_mean'] = self.lag_sum / self.relayed if self.relayed else None # seconds
+        stats['lag_max'] = self.lag_max
+        stats['batches'] = self.batches
+        stats['depth'] = len(buffer)
+        stats['max_depth'] = buffer.max_depth
+        stats['dropped'] = buffer.dropped
+        stats['unpublished'] = self.unpublished
+        stats['errors'] = self.errors
+        stats['disconnects'] = self.disconnects
+        stats['reconnects'] = self.reconnects
+        if reset:
+            self.received = self.relayed = self.batches = 0
+            self.bytes_in = self.bytes_out = 0
+            self.lag_sum = self.lag_max = 0.0
+            self.interval_started = now
+        return stats
+
+
+class Relay:
+    """Relays the messages from the upstream servers to the downstream servers"""
+
+    def __init__(self, conf):
+        self.conf = dict(DEFAULT_CONF)
+        self.conf.update(conf)
+        if self.conf['compression'] not in COMPRESSIONS:
+            raise ValueError("Unknown compression: {}".format(self.conf['compression']))
+        self.rewriter = SubjectRewriter(self.conf['rewrite'])
+        self.buffer = RelayBuffer(self.conf['buffer_size'])
+        self.stats = RelayStats()
+        self.upstream = []
+        self.downstream = []
+
+    def __str__(self):
+        return "Relay: {} -> {}, {} subjects, {} rewrite rules".format(
+            self.conf['upstream'], self.conf['downstream'], len(self.conf['subjects']), len(self.rewriter))
+
+    def encode(self, data, headers):
+        """Returns the payload and headers to be published"""
+        encoding = headers.get(ENCODING_HEADER) if headers else None
+        if encoding == self.conf['compression']:
+            return data, headers
+        if encoding == 'zlib':
+            data = zlib.decompress(data)
+        if self.conf['compression'] == 'zlib':
+            return zlib.compress(data), {ENCODING_HEADER: 'zlib'}
+        return data, None
+
+    async def message_handler(self, msg):
+        """Subscription callback, only buffers the message"""
+        self.stats.received += 1
+        self.stats.bytes_in += len(msg.data)
+        self.buffer.put(msg.subject, msg.data, msg.headers)
+
+    async def connect(self, server, role):
+        async def disconnected():
+            self.stats.disconnects += 1
+            print("Disconnected from {} server {}".format(role, server))
+
+        async def reconnected():
+            self.stats.reconnects += 1
+            print("Reconnected to {} server {}".format(role, server))
+
+        async def error(e):
+            self.stats.errors += 1
+            print("NATS error ({} {}): {}".format(role, server, e))
+
+        nc = NATS()
+        await nc.connect(server, max_reconnect_attempts=-1, reconnect_time_wait=RECONNECT_TIME_WAIT,
+                         disconnected_cb=disconnected, reconnected_cb=reconnected, error_cb=error)
+        return nc
+
+    async def publish_batch(self, batch):
+        """Publishes the batch to all the open downstream servers"""
+        now = time.monotonic()
+        # Also the reconnecting clients, they buffer the messages until connected again
+        clients = [nc for nc in self.downstream if not nc.is_closed]
+        for subject, data, headers, received in batch:
+            subject = self.rewriter.rewrite(subject)
+            try:
+                data, headers = self.encode(data, headers)
+            except zlib.error as e:
+                self.stats.errors += 1
+                print("Bad compressed message in {}: {}".format(subject, e))
+                continue
+            published = False
+            for nc in clients:
+                # Only adds to the pending buffer of the client, the flusher sends it
+                try:
+                    await nc.publish(subject, data, headers=headers)
+                    published = True
+                except PUBLISH_ERRORS:
+                    self.stats.errors += 1
+            if not published:
+                self.stats.unpublished += 1
+                continue
+            self.stats.relayed += 1
+            self.stats.bytes_out += len(data)
+            self.stats.add_lag(now - received)
+        self.stats.batches += 1
+
+    async def run_publisher(self):
+        """Publishes the buffered messages in batches"""
+        max_batch = self.conf['max_batch']
+        flush_interval = self.conf['flush_interval']
+        while True:
+            await self.buffer.not_empty.wait()
+            if len(self.buffer) < max_batch:
+                await asyncio.sleep(flush_interval) # Lets the batch fill up
+            while len(self.buffer):
+                await self.publish_batch(self.buffer.take(max_batch))
+                await asyncio.sleep(0) # Lets the subscriptions run
+
+    async def send_stats(self):
+        """Sends and prints the counters periodically"""
         while True:
-            await asyncio.sleep(0.1)
+            await asyncio.sleep(self.conf['stats_interval'])
+            stats = self.stats.get_stats(self.buffer)
+            print("Relay: in {:.0f} msg/s, out {:.0f} msg/s, lag max {:.3f} s, depth {}, dropped {}".format(
+                stats['in_rate'], stats['out_rate'], stats['lag_max'], stats['depth'], stats['dropped']))
+            if self.conf['stats_subject']:
+                stats['tstamp'] = datetime.datetime.now().timestamp() * 1000
+                for nc in self.downstream:
+                    if nc.is_connected:
+                        await nc.publish(self.conf['stats_subject'], json.dumps(stats).encode())
+
+    async def run(self):
+        self.downstream = [await self.connect(server, 'downstream') for server in self.conf['downstream']]
+        self.upstream = [await self.connect(server, 'upstream') for server in self.conf['upstream']]
+        for nc in self.upstream:
+            for subject in self.conf['subjects']:
+                await nc.subscribe(subject, cb=self.message_handler)
+        print(self)
+        try:
+            await asyncio.gather(self.run_publisher(), self.send_stats())
+        finally:
+            for nc in self.upstream + self.downstream:
+                await nc.drain()
+
+
+async def run_relay(conf):
+    # The relay is created inside the event loop (asyncio objects)
+    await Relay(conf).run()
+
+
+def read_conf(filename):
+    """Reads the relay configuration file"""
+    with open(filename) as f:
+        return json.loads(jsmin(f.read()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NATS relay")
+    parser.add_argument('--conf', help='Relay configuration file (JSON)', type=str)
+    parser.add_argument('--upstream', help='Upstream server, overrides the conf', action='append')
+    parser.add_argument('--downstream', help='Downstream server, overrides the conf', action='append')
+    parser.add_argument('--subject', help='Subject to relay, overrides the conf', action='append')
+    args = parser.parse_args()
+
+    conf = read_conf(args.conf) if args.conf else {}
+    if args.upstream:
+        conf['upstream'] = args.upstream
+    if args.downstream:
+        conf['downstream'] = args.downstream
+    if args.subject:
+        conf['subjects'] = args.subject
+    try:
+        asyncio.run(run_relay(conf))
     except KeyboardInterrupt:
         pass
 
-    # Close the connections
-    await from_nats.close()
-    await to_nats.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    main()
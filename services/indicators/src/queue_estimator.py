@@ -0,0 +1,150 @@
+"""Queue length and spillback estimation of the lanes of a view
+
+The state of every lane is the number of vehicles between the in detector and
+the stop line with its variance, updated as a scalar Kalman filter:
+
+    predict: vehicles += arrivals - departures (detector edges since the last
+             update), the variance grows with the counted vehicles (miscounts)
+             and with time. Lanes without out detectors discharge at the
+             saturation flow when the group is green, lanes without in
+             detectors get the arrival variance instead of the counts.
+    update:  the radar object count of the lane is the measurement, its
+             variance grows with the count (occlusion in long queues) and with
+             lower radar quality.
+
+The vehicles are never negative, thus the counts cannot drift below zero. The
+queue length in metres is the vehicles times the jam spacing, fused with the
+radar tail (the farthest slow object from the stop line) when the lane has a
+stop line. A lane spills back when the queue reaches the in detector or the in
+detector is occupied longer than the spillback occupancy.
+
+All the lanes are updated together as arrays, the cost is O(lanes) per update.
+"""
+
+import numpy as np
+
+DEFAULT_JAM_SPACING = 7.0 # m per queued vehicle
+DEFAULT_SATURATION_FLOW = 0.5 # veh/s, discharge of the lanes without out detectors
+DEFAULT_QUEUE_SPEED = 2.0 # m/s, slower radar objects are queued
+DEFAULT_INITIAL_VARIANCE = 25.0 # veh^2, nothing known at the start
+DEFAULT_COUNT_VARIANCE = 0.05 # veh^2 per counted vehicle
+DEFAULT_DRIFT_VARIANCE = 0.01 # veh^2/s
+DEFAULT_ARRIVAL_VARIANCE = 0.2 # veh^2/s, lanes without in detectors
+DEFAULT_RADAR_VARIANCE = 1.0 # veh^2
+DEFAULT_RADAR_RELATIVE_STD = 0.1 # share of the radar count
+DEFAULT_TAIL_STD = 3.0 # m, radar tail position
+DEFAULT_SPILLBACK_OCCUPANCY = 5.0 # seconds the in detector is occupied
+MIN_QUALITY = 0.1 # share, radar variance is divided by the quality
+
+
+class QueueEstimator:
+    """Kalman filter of the vehicles in the lanes of a view"""
+
+    def __init__(self, lane_count, jam_spacing=DEFAULT_JAM_SPACING, saturation_flow=DEFAULT_SATURATION_FLOW,
+                 initial_variance=DEFAULT_INITIAL_VARIANCE, count_variance=DEFAULT_COUNT_VARIANCE,
+                 drift_variance=DEFAULT_DRIFT_VARIANCE, arrival_variance=DEFAULT_ARRIVAL_VARIANCE,
+                 radar_variance=DEFAULT_RADAR_VARIANCE, radar_relative_std=DEFAULT_RADAR_RELATIVE_STD,
+                 tail_std=DEFAULT_TAIL_STD, spillback_occupancy=DEFAULT_SPILLBACK_OCCUPANCY):
+        self.jam_spacing = jam_spacing
+        self.saturation_flow = saturation_flow
+        self.count_variance = count_variance
+        self.drift_variance = drift_variance
+        self.arrival_variance = arrival_variance
+        self.radar_variance = radar_variance
+        self.radar_relative_std = radar_relative_std
+        self.tail_std = tail_std
+        self.spillback_occupancy = spillback_occupancy
+        self.vehicles = np.zeros(lane_count) # State
+        self.variance = np.full(lane_count, float(initial_variance))
+        self.queue_length = np.zeros(lane_count) # m
+        self.queue_variance = self.variance * jam_spacing ** 2
+        self.spillback = np.zeros(lane_count, dtype=bool)
+        self.last_counts = None # (in, out) detector counts at the last update
+        self.last_time = None # seconds
+
+    def __len__(self):
+        return len(self.vehicles)
+
+    def __str__(self):
+        return "QueueEstimator: {} lanes, {:.1f} vehicles".format(len(self), self.vehicles.sum())
+
+    def predict(self, now, in_counts, out_counts, has_in, has_out, green):
+        """Moves the vehicles with the detector counts (cumulative counts of the lanes)"""
+        in_counts = np.asarray(in_counts, dtype=float)
+        out_counts = np.asarray(out_counts, dtype=float)
+        if self.last_time is None:
+            dt = 0.0
+            arrivals = departures = np.zeros(len(self))
+        else:
+            dt = max(0.0, now - self.last_time)
+            # Counts are cumulative, a smaller count (restart) is no change
+            arrivals = np.maximum(0.0, in_counts - self.last_counts[0])
+            departures = np.maximum(0.0, out_counts - self.last_counts[1])
+        self.last_time = now
+        self.last_counts = (in_counts, out_counts)
+        has_in = np.asarray(has_in, dtype=bool)
+        has_out = np.asarray(has_out, dtype=bool)
+        # Expected discharge without out detectors, Poisson variance
+        discharge = np.where(~has_out & green, self.saturation_flow * dt, 0.0)
+        self.vehicles += np.where(has_in, arrivals, 0.0) - np.where(has_out, departures, discharge)
+        self.variance += self.count_variance * (arrivals + departures) + self.drift_variance * dt \
+            + np.where(has_in, 0.0, self.arrival_variance * dt) + discharge
+        np.maximum(self.vehicles, 0.0, out=self.vehicles)
+
+    def update(self, radar_counts, radar_quality):
+        """Corrects the vehicles with the radar counts, nan for the lanes without radar"""
+        radar_counts = np.asarray(radar_counts, dtype=float)
+        measured = ~np.isnan(radar_counts)
+        if not measured.any():
+            return
+        z = radar_counts[measured]
+        quality = np.maximum(np.asarray(radar_quality, dtype=float)[measured], MIN_QUALITY)
+        r = (self.radar_variance + (self.radar_relative_std * z) ** 2) / quality
+        p = self.variance[measured]
+        gain = p / (p + r)
+        self.vehicles[measured] = np.maximum(0.0, self.vehicles[measured] + gain * (z - self.vehicles[measured]))
+        self.variance[measured] = (1.0 - gain) * p
+
+    def update_queue(self, radar_tails, lane_lengths, occupied_times):
+        """
+            Computes the queue lengths (m) and the spillback
+            radar_tails: m from the stop line to the end of the radar queue, nan if not measured
+        """
+        length = self.vehicles * self.jam_spacing
+        variance = self.variance * self.jam_spacing ** 2
+        tails = np.asarray(radar_tails, dtype=float)
+        measured = ~np.isnan(tails)
+        if measured.any():
+            # Inverse variance weighting of the model and the radar tail
+            r = self.tail_std ** 2
+            v = variance[measured]
+            length[measured] = (length[measured] * r + tails[measured] * v) / (v + r)
+            variance[measured] = v * r / (v + r)
+        self.queue_length = length
+        self.queue_variance = variance
+        lane_lengths = np.asarray(lane_lengths, dtype=float)
+        self.spillback = (length >= lane_lengths) \
+            | (np.asarray(occupied_times, dtype=float) >= self.spillback_occupancy)
+
+    def get_lane_output(self, index):
+        """Returns the estimate of a lane as dict"""
+        out = {}
+        out["vehicles"] = float(self.vehicles[index])
+        out["vehicles_std"] = float(np.sqrt(self.variance[index]))
+        out["queue_length"] = float(self.queue_length[index]) # m
+        out["queue_length_std"] = float(np.sqrt(self.queue_variance[index]))
+        out["queue_vehicles"] = float(self.queue_length[index] / self.jam_spacing)
+        out["spillback"] = bool(self.spillback[index])
+        return out
+
+
+def radar_queue_tail(distances, speeds, queue_speed=DEFAULT_QUEUE_SPEED, jam_spacing=DEFAULT_JAM_SPACING):
+    """
+        Returns the queue length (m) seen by the radar: the farthest slow object
+        from the stop line plus half a vehicle, 0 if no slow objects
+    """
+    distances = np.asarray(distances, dtype=float)
+    slow = (np.asarray(speeds, dtype=float) < queue_speed) & ~np.isnan(distances)
+    if not slow.any():
+        return 0.0
+    return float(distances[slow].max() + jam_spacing / 2.0)
@@ -1,13 +1,29 @@
 """The radar module providing radars to be used by the SensorTwin"""
 
-import datetime
 import json
 import asyncio
+import time
+# Flat imports when run as a script, relative when imported as a package (tests)
+if __package__:
+    from .timed_buffer import TimedRingBuffer
+    from .timestamps import NS_PER_SECOND, parse_tstamp, seconds_to_ns, ns_to_ms
+    from .tracker import RadarTracker
+    from .radar_frame import RadarFrame
+    from .lane_geometry import LaneGeometry, DEFAULT_CELL_SIZE
+    from .stream_metrics import StreamMetrics, DEFAULT_STALE_AFTER
+else:
+    from timed_buffer import TimedRingBuffer
+    from timestamps import NS_PER_SECOND, parse_tstamp, seconds_to_ns, ns_to_ms
+    from tracker import RadarTracker
+    from radar_frame import RadarFrame
+    from lane_geometry import LaneGeometry, DEFAULT_CELL_SIZE
+    from stream_metrics import StreamMetrics, DEFAULT_STALE_AFTER
 
 # Note: should be configureable
-DEFAULT_CLEANUP_INTERVAL = 10 # seconds
 DEFAULT_OLD_DATA_TRESHOLD = 60 # seconds 
+DEFAULT_HISTORY_SIZE = 1200 # frames, i.e. 60 s at 20 Hz
 DEFAULT_SEND_QUEUES_INTERVAL = 1 # seconds
+DEFAULT_INTAKE_POLICY = 'latest' # only the latest frames are kept under load
 
 
 class Radar:
@@ -29,7 +45,27 @@ class Radar:
                 print(f"Radar {radar_id} is missing nats_subject".format(radar_id))
         else:
             self.nats = False
-        self.data = []
+        # Optional tracking, gives stable ids for the objects over frames
+        tracking = radar_params.get('tracking', False)
+        if tracking:
+            self.tracker = RadarTracker(tracking if isinstance(tracking, dict) else {})
+        else:
+            self.tracker = None
+        # Optional lane geometries, the lanes are then assigned from the positions
+        lane_geometry = radar_params.get('lane_geometry', None)
+        if lane_geometry:
+            self.lane_geometry = LaneGeometry(lane_geometry, radar_params.get('lane_grid_size', DEFAULT_CELL_SIZE))
+            self.lane_fallback = radar_params.get('lane_fallback', False)
+        else:
+            self.lane_geometry = None
+        self.update_functions = [] # Functions to trigger when new data is received
+        self.archive = None # ArchiveWriter, set by the sensor twin
+        self.metrics = StreamMetrics(radar_id, radar_params.get('stale_after', DEFAULT_STALE_AFTER))
+        # Frame history, old frames are evicted when new ones are added
+        self.data = TimedRingBuffer(
+            capacity=radar_params.get('history_size', DEFAULT_HISTORY_SIZE),
+            max_age=radar_params.get('history_length', DEFAULT_OLD_DATA_TRESHOLD),
+            units_per_second=NS_PER_SECOND)
         
 
     def __str__(self):
@@ -39,33 +75,43 @@ class Radar:
     # Basic data access functions
     def add_data(self, data):
         """Adds data to the radar"""
-        self.data.append(data)
+        self.metrics.record(data['data_received'], data.get('data_sent'), empty=not data.get('objects'))
+        if self.tracker:
+            # Objects replaced by the tracks, radar time used if available
+            frame_time = data.get('data_sent', data['data_received']) / NS_PER_SECOND
+            data['raw_objects'] = data.get('objects', [])
+            data['objects'] = self.tracker.update(data['raw_objects'], frame_time)
+        # Frame decoded to columns once here, the lanes read their own part
+        frame = RadarFrame(data.get('objects', []))
+        if self.lane_geometry:
+            fallback = frame.lane if self.lane_fallback else None
+            frame.set_lanes(self.lane_geometry.assign(frame.lat, frame.lon, fallback))
+        data['frame'] = frame
+        if self.archive:
+            self.archive.add_radar_frame(self.radar_id, data['data_received'], frame)
+        self.data.append(data, data['data_received'])
        
     def remove_old_data(self, treshold=DEFAULT_OLD_DATA_TRESHOLD):
-        "Removes all data with sent timestamp older than treshold"
-        now = datetime.datetime.now()
-        for data in self.data:
-            if 'data_sent' in data:
-                data_sent = data['data_received']
-                diff = now - data_sent
-                if diff.total_seconds() > treshold:
-                    self.data.remove(data)
+        "Removes all data with received timestamp older than treshold"
+        self.data.evict_older_than(time.time_ns() - seconds_to_ns(treshold))
  
     def get_last_data(self):
-        """Returns the last data item"""
-        if len(self.data) == 0:
+        """Returns the last data item, None if nothing received within the history length"""
+        self.data.evict_stale() # A silent radar must not serve its last frame forever
+        last_data = self.data.last()
+        if last_data is None:
             return None
         # If there is an empty dataset, we should return the one before that
         # This fixes radar error, should be fixed elswhere and this to be removed
-        if len(self.data[-1]['objects']) == 0:
+        if len(last_data['objects']) == 0:
             if len(self.data) > 1:
                 return self.data[-2]
-        return self.data[-1]
+        return last_data
 
     def get_object_list(self, measurements = 1):
         """Returns the list of objects"""
         last_data = self.get_last_data()
-        if len(self.data) <= 0:
+        if last_data is None:
             return []
         if measurements == 1:
             # print('Last data: ', last_data)  #DBIK 202511
@@ -75,19 +121,31 @@ class Radar:
             # print('obj_list: ', obj_list)    #DBIK 202511
             return obj_list 
 
+    def get_lane_object_list(self, lane, measurements = 1):
+        """Returns the list of objects on the given lane (lane as string)"""
+        return self.get_lane_frame(lane, measurements).objects
+
+    def get_frame(self, measurements = 1):
+        """Returns the objects of the last n measurements as a RadarFrame"""
+        if measurements == 1:
+            last_data = self.get_last_data()
+            if last_data is None:
+                return RadarFrame()
+            return last_data['frame']
+        return RadarFrame(self.get_object_list_for_n_measurements(measurements))
+
+    def get_lane_frame(self, lane, measurements = 1):
+        """Returns the objects on the given lane as a RadarFrame"""
+        return self.get_frame(measurements).lane_frame(lane)
+
     def get_object_list_for_n_measurements(self, number_of_measurements):
         """
             Returns the list of objects for the last n measurements
             This should filter out totally empty messages
         """
         past_objects = {}
-        data_available = len(self.data)
-        if data_available >= number_of_measurements:
-            n = number_of_measurements
-        else:
-            n = data_available
-        last_data = self.data[:-n]
-        for data in last_data:
+        self.data.evict_stale()
+        for data in self.data.last_n(number_of_measurements):
             for obj in data['objects']:
                 id = obj['id']
                 past_objects[id] = obj
@@ -99,6 +157,16 @@ class Radar:
 
 
 
+    def add_update_function(self, func):
+        """Adds a function to be called when new data is received"""
+        if func not in self.update_functions:
+            self.update_functions.append(func)
+
+    def trigger_update_functions(self):
+        """Triggers the update functions"""
+        for func in self.update_functions:
+            func()
+
     def get_nats_sub_params(self):
         """
             Returns the nats subscription parameters 
@@ -109,6 +177,10 @@ class Radar:
         params = {}
         params['subject'] = self.nats_subject
         params['callback'] = self.nats_callback
+        # Intake queue between the subscription and the callback
+        stream_params = self.radar_params
+        params['intake_policy'] = stream_params.get('intake_policy', DEFAULT_INTAKE_POLICY)
+        params['intake_size'] = stream_params.get('intake_size', None)
         return params
 
 
@@ -119,25 +191,9 @@ class Radar:
         if not last_data:
             return {} # No data
         
-        queue_lengths = {}
-        objects = last_data['objects']
-        for obj in objects:
-            lane = obj['lane']
-            if lane not in queue_lengths:
-                queue_lengths[lane] = 0
-                
-            queue_lengths[lane] += 1
-                
-        return queue_lengths
+        return last_data['frame'].count_by_lane()
     
 # ASYNC functions
-    async def cleanup_old_data(self):
-        """Removes old data, this should be a separate task running at alla times"""
-        while True:
-            await asyncio.sleep(DEFAULT_CLEANUP_INTERVAL)
-            #print(self.radar_id, ":", self.get_queue_lengths_by_lane())
-            self.remove_old_data()
-
     async def nats_callback(self, msg):
         """The callback function for the nats and is assigned to the subscription"""
         subject = msg.subject
@@ -145,13 +201,13 @@ class Radar:
         data = msg.data.decode()
         #print(f"Received a message on '{subject} {reply}': {data}")
         data_dict = json.loads(data)
-        if 'tstamp' in data_dict:
-            tstamp = data_dict['tstamp']
-            tstamp_in_datetime = datetime.datetime.fromtimestamp(tstamp/1000)
-            tstamp_now = datetime.datetime.now()
-            data_dict['data_sent'] = tstamp_in_datetime
-            data_dict['data_received'] = tstamp_now
+        # Received time (epoch ns) is always set, the history is indexed with it
+        data_dict['data_received'] = time.time_ns()
+        sent = parse_tstamp(data_dict.get('tstamp'))
+        if sent is not None:
+            data_dict['data_sent'] = sent
         self.add_data(data_dict)
+        self.trigger_update_functions()
 
     async def send_queues(self, nats):
         """Send the queue lengths to the nats"""
@@ -161,6 +217,6 @@ class Radar:
             data = {}
             data['radar_id'] = self.radar_id
             data['queue_lengths'] = queue_lengths
-            data['tstamp'] = datetime.datetime.now().timestamp() * 1000
+            data['tstamp'] = ns_to_ms(time.time_ns())
             await nats.publish(self.queue_subject, json.dumps(data).encode())
             #print(f"Sent queue data from {self.radar_id}: {queue_lengths}")
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""Columnar radar frames
+
+A radar frame arrives as a list of object dicts. The frame is decoded once at
+ingest into NumPy columns (id, lane, class, speed, lat/lon, quality) so that
+counting, lane filtering, class mapping and speed averages are done as array
+operations. The original object dicts are kept in the same order, they are
+needed when the objects are sent out. The objects are also indexed by lane once
+per frame, the lane frames are sliced from the index and cached on the frame
+(every view reads the same lanes).
+"""
+
+import numpy as np
+
+DEFAULT_QUALITY = 99
+UNKNOWN_CLASS = -1 # Class code for missing or non integer classes
+
+
+class RadarFrame:
+    """The objects of one radar frame as columns"""
+    COLUMNS = ("ids", "lane", "cls", "speed", "lat", "lon", "quality")
+
+    def __init__(self, objects=None):
+        if objects is None:
+            objects = []
+        self.objects = objects
+        n = len(objects)
+        self.ids = np.empty(n, dtype=object)
+        self.ids[:] = [obj.get("id") for obj in objects]
+        self.lane = np.array([str(obj.get("lane")) for obj in objects], dtype=str)
+        self.cls = np.array([self._class_code(obj.get("class")) for obj in objects], dtype=np.int64)
+        self.speed = np.array([obj.get("speed", np.nan) for obj in objects], dtype=float)
+        self.lat = np.array([obj.get("lat", np.nan) for obj in objects], dtype=float)
+        self.lon = np.array([obj.get("lon", np.nan) for obj in objects], dtype=float)
+        self.quality = np.array([obj.get("quality", DEFAULT_QUALITY) for obj in objects], dtype=float)
+        self._index_lanes()
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __str__(self):
+        return "RadarFrame: {} objects".format(len(self))
+
+    @staticmethod
+    def _class_code(vehclass):
+        if isinstance(vehclass, (int, np.integer)) and not isinstance(vehclass, bool):
+            return int(vehclass)
+        return UNKNOWN_CLASS
+
+    @classmethod
+    def concatenate(cls, frames):
+        """Returns a new frame with the objects of all the frames"""
+        frame = cls.__new__(cls)
+        frame._lane_index = None # Indexed when the lanes are read
+        frames = list(frames)
+        frame.objects = [obj for f in frames for obj in f.objects]
+        for column in cls.COLUMNS:
+            if frames:
+                values = np.concatenate([getattr(f, column) for f in frames])
+            else:
+                values = getattr(cls(), column)
+            setattr(frame, column, values)
+        return frame
+
+    #
+    # Selecting objects
+    #
+
+    def select(self, index):
+        """Returns a new frame with the objects selected by a mask or index array"""
+        index = np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        frame = self.__class__.__new__(self.__class__)
+        frame._lane_index = None # Indexed when the lanes are read
+        frame.objects = [self.objects[i] for i in index.tolist()]
+        for column in self.COLUMNS:
+            setattr(frame, column, getattr(self, column)[index])
+        return frame
+
+    def set_lanes(self, lanes):
+        """Replaces the lanes of the objects, the radar's own lane is kept in 'radar_lane'"""
+        self.lane = np.asarray(lanes, dtype=str)
+        for obj, lane in zip(self.objects, self.lane.tolist(), strict=True):
+            if "radar_lane" not in obj:
+                obj["radar_lane"] = obj.get("lane")
+            obj["lane"] = lane
+        self._index_lanes()
+
+    def _index_lanes(self):
+        """Indexes the objects by lane, the lane frames are built when first read"""
+        self._lane_index = {}
+        self._lane_frames = {}
+        if not len(self.lane):
+            return
+        lanes, inverse = np.unique(self.lane, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.cumsum(np.bincount(inverse))[:-1]
+        self._lane_index = dict(zip(lanes.tolist(), np.split(order, bounds), strict=True))
+
+    def lane_index(self):
+        """Returns a dict of lane (as string) -> index array of the objects on the lane"""
+        if self._lane_index is None:
+            self._index_lanes()
+        return self._lane_index
+
+    def lane_mask(self, lane):
+        """Returns the mask of the objects on the given lane (lane as string)"""
+        return self.lane == str(lane)
+
+    def lane_frame(self, lane):
+        """Returns the objects of the given lane as a frame, the frame is shared by the readers"""
+        lane = str(lane)
+        lane_index = self.lane_index()
+        if lane not in self._lane_frames:
+            self._lane_frames[lane] = self.select(lane_index.get(lane, np.zeros(0, dtype=np.int64)))
+        return self._lane_frames[lane]
+
+    def lane_objects(self, lane):
+        """Returns the object dicts on the given lane"""
+        return self.lane_frame(lane).objects
+
+    #
+    # Aggregates
+    #
+
+    def count_by_lane(self):
+        """Returns a dict of lane (as string) -> number of objects"""
+        return {lane: len(index) for lane, index in self.lane_index().items()}
+
+    def mean_speed(self, mask=None):
+        """Returns the mean speed of the (masked) objects, None if there are none"""
+        speed = self.speed if mask is None else self.speed[mask]
+        speed = speed[~np.isnan(speed)]
+        if not len(speed):
+            return None
+        return float(speed.mean())
+
+    def map_classes(self, mapping):
+        """
+            Maps the radar classes with a dict of int class -> value
+            Returns an object array, None for the classes not in the mapping
+        """
+        codes = [c for c in mapping if isinstance(c, int) and c >= 0]
+        size = max(codes) + 1 if codes else 0
+        table = np.empty(size + 1, dtype=object) # Last item (None) for unmapped
+        for code in codes:
+            table[code] = mapping[code]
+        cls = np.where((self.cls >= 0) & (self.cls < size), self.cls, size)
+        return table[cls]
@@ -0,0 +1,131 @@
+"""Rolling traffic statistics over time windows
+
+The statistics are kept in windowed accumulators: the window is divided into
+time buckets and a running total is kept over them. Adding a value and reading
+the totals are O(1), the expired buckets are subtracted from the totals when
+time advances. The stored sensor histories are not needed for the statistics.
+"""
+
+import math
+
+DEFAULT_WINDOWS = [10, 60, 300] # seconds
+DEFAULT_BUCKETS = 10 # per window
+
+
+class WindowedAccumulator:
+    """
+        Sum and count of the values added during the last window seconds
+        The window is divided into buckets, the oldest bucket is dropped as
+        whole thus the effective window is between window - bucket size and
+        window seconds.
+    """
+
+    def __init__(self, window, buckets=DEFAULT_BUCKETS):
+        if window <= 0 or buckets <= 0:
+            raise ValueError("Window and buckets must be positive")
+        self.window = window
+        self.buckets = buckets
+        self.bucket_size = window / buckets
+        self._sums = [0.0] * buckets
+        self._counts = [0] * buckets
+        self._head = None # Id of the newest bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def __str__(self):
+        return "WindowedAccumulator: {} s, sum {}, count {}".format(self.window, self.sum, self.count)
+
+    def advance(self, now):
+        """Moves the window to the given time, expired buckets are dropped"""
+        bucket = math.floor(now / self.bucket_size)
+        if self._head is None:
+            self._head = bucket
+            return
+        if bucket <= self._head:
+            return
+        for b in range(self._head + 1, min(bucket, self._head + self.buckets) + 1):
+            i = b % self.buckets
+            self.sum -= self._sums[i]
+            self.count -= self._counts[i]
+            self._sums[i] = 0.0
+            self._counts[i] = 0
+        self._head = bucket
+        if not self.count:
+            self.sum = 0.0 # No drift from the float subtractions
+
+    def add(self, value, now, count=1):
+        """Adds a value (or a sum of count values) at the given time"""
+        self.advance(now)
+        i = self._head % self.buckets
+        self._sums[i] += value
+        self._counts[i] += count
+        self.sum += value
+        self.count += count
+
+    def mean(self, now):
+        """Returns the mean of the values in the window, None if no values"""
+        self.advance(now)
+        if not self.count:
+            return None
+        return self.sum / self.count
+
+    def total(self, now):
+        """Returns the sum of the values in the window"""
+        self.advance(now)
+        return self.sum
+
+
+class RollingStats:
+    """
+        Rolling statistics of a lane or a view over several windows
+        Updated with the changes of every frame (output cycle):
+            passed: vehicles passed the stop line (output detectors)
+            arrivals: vehicles arrived to the lane (input detectors)
+            red: True if the signal was not green
+            speed_sum, speed_count: the sum and number of the speed measurements
+            occupancy: share of the detectors occupied (0..1), None if unknown
+            queue: number of vehicles in the lane, None if unknown
+    """
+
+    def __init__(self, windows=None):
+        if windows is None:
+            windows = DEFAULT_WINDOWS
+        self.windows = list(windows)
+        self.passed = [WindowedAccumulator(w) for w in self.windows]
+        self.red_arrivals = [WindowedAccumulator(w) for w in self.windows]
+        self.speed = [WindowedAccumulator(w) for w in self.windows]
+        self.occupancy = [WindowedAccumulator(w) for w in self.windows]
+        self.queue = [WindowedAccumulator(w) for w in self.windows]
+        self.started_at = None
+
+    def __bool__(self):
+        return bool(self.windows)
+
+    def update(self, now, passed=0, arrivals=0, red=False, speed_sum=0.0, speed_count=0,
+               occupancy=None, queue=None):
+        """Adds the changes of one frame"""
+        if self.started_at is None:
+            self.started_at = now
+        for i in range(len(self.windows)):
+            self.passed[i].add(passed, now)
+            self.red_arrivals[i].add(arrivals if red else 0, now)
+            self.speed[i].add(speed_sum, now, count=speed_count)
+            if occupancy is not None:
+                self.occupancy[i].add(occupancy, now)
+            if queue is not None:
+                self.queue[i].add(queue, now)
+
+    def get_stats(self, now):
+        """Returns the statistics as dict of window (seconds, as string) -> values"""
+        stats = {}
+        for i, window in enumerate(self.windows):
+            # The flow is scaled with the time we have data for
+            elapsed = window if self.started_at is None else min(window, max(now - self.started_at, 1.0))
+            values = {}
+            values["flow"] = self.passed[i].total(now) / elapsed * 3600.0 # veh/h
+            values["mean_speed"] = self.speed[i].mean(now)
+            values["occupancy"] = self.occupancy[i].mean(now)
+            values["queue"] = self.queue[i].mean(now)
+            values["red_arrivals"] = self.red_arrivals[i].total(now)
+            stats[str(window)] = values
+        return stats
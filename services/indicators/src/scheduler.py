@@ -0,0 +1,168 @@
+"""Timer wheel for the periodic tasks of the sensor twin
+
+All the periodic outputs, cleanup and health messages are jobs of one
+TimerWheel instead of separate sleep loops. The time is divided into ticks
+(DEFAULT_TICK) and the jobs are kept in the wheel slot of the tick they are
+due, jobs further away than one revolution stay in the slot until their round
+comes. The periodic jobs are aligned to multiples of their interval, thus jobs
+with the same interval run on the same wakeup. The wheel sleeps until the next
+due tick (or until a job is woken earlier), the idle ticks cost nothing.
+
+Change triggered outputs are jobs that are woken with wake() when their inputs
+change, periodic if they also have a max interval. Rescheduling only replaces the
+due tick of the job, the old slot entry is skipped when its tick comes.
+"""
+
+import asyncio
+import math
+import time
+
+DEFAULT_TICK = 0.05 # seconds
+DEFAULT_WHEEL_SIZE = 512 # slots, i.e. 25.6 s at the default tick
+
+
+class Job:
+    """A task of the wheel, func is a coroutine function without arguments"""
+    __slots__ = ("name", "func", "interval", "due", "runs", "skipped", "errors")
+
+    def __init__(self, name, func, interval=None):
+        self.name = name
+        self.func = func
+        self.interval = interval # ticks, None if only run when woken
+        self.due = None # tick, None if not scheduled
+        self.runs = 0
+        self.skipped = 0 # Periods missed when the loop was late
+        self.errors = 0
+
+    def __str__(self):
+        return "Job {}: every {} ticks, due {}".format(self.name, self.interval, self.due)
+
+
+class TimerWheel:
+    """Runs the jobs at their due ticks"""
+
+    def __init__(self, tick=DEFAULT_TICK, size=DEFAULT_WHEEL_SIZE, clock=time.time):
+        if tick <= 0 or size <= 0:
+            raise ValueError("Tick and wheel size must be positive")
+        self.tick = tick
+        self.size = size
+        self.clock = clock # Wall clock, the alignment is the same in all the processes
+        self.slots = [[] for _ in range(size)] # (due tick, job)
+        self.jobs = []
+        self.last_tick = self.current_tick() # Ticks up to this have been run
+        self.changed = None # asyncio.Event, created in the event loop
+        self.wakeups = 0
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __str__(self):
+        return "TimerWheel: {} jobs, tick {} s, {} wakeups".format(len(self), self.tick, self.wakeups)
+
+    def current_tick(self):
+        return math.floor(self.clock() / self.tick)
+
+    def to_ticks(self, seconds):
+        return max(1, int(round(seconds / self.tick)))
+
+    def _insert(self, job, due):
+        job.due = max(due, self.last_tick + 1) # Never in the past
+        self.slots[job.due % self.size].append((job.due, job))
+        if self.changed is not None:
+            self.changed.set()
+
+    def add_periodic(self, name, func, interval, align=True):
+        """
+            Adds a job run every interval seconds, returns the job
+            align: first run on a multiple of the interval, otherwise after one interval
+        """
+        job = Job(name, func, self.to_ticks(interval))
+        now = max(self.current_tick(), self.last_tick)
+        if align:
+            due = (now // job.interval + 1) * job.interval
+        else:
+            due = now + job.interval
+        self.jobs.append(job)
+        self._insert(job, due)
+        return job
+
+    def add_job(self, name, func):
+        """Adds a job that is run only when woken, returns the job"""
+        job = Job(name, func)
+        self.jobs.append(job)
+        return job
+
+    def wake(self, job, delay=0.0):
+        """Runs the job after the delay (seconds), unless it is already due earlier"""
+        due = math.ceil((self.clock() + delay) / self.tick)
+        if job.due is None or due < job.due:
+            self._insert(job, due)
+
+    def cancel(self, job):
+        job.due = None # The slot entry is skipped
+
+    def next_due(self):
+        """Returns the next due tick, None if no jobs are scheduled"""
+        for tick in range(self.last_tick + 1, self.last_tick + 1 + self.size):
+            for due, job in self.slots[tick % self.size]:
+                if due == tick and job.due == due:
+                    return tick
+        # Only jobs beyond one revolution
+        dues = [due for slot in self.slots for due, job in slot if job.due == due]
+        return min(dues) if dues else None
+
+    def pop_due(self, now_tick):
+        """Returns the jobs due at or before the tick, the periodic jobs are rescheduled"""
+        first = max(self.last_tick + 1, now_tick - self.size + 1) # One revolution covers all the slots
+        due_jobs = []
+        for tick in range(first, now_tick + 1):
+            slot = self.slots[tick % self.size]
+            if not slot:
+                continue
+            kept = []
+            for due, job in slot:
+                if job.due != due:
+                    continue # Rescheduled or cancelled
+                if due <= now_tick:
+                    due_jobs.append(job)
+                else:
+                    kept.append((due, job)) # Later round
+            self.slots[tick % self.size] = kept
+        self.last_tick = max(self.last_tick, now_tick)
+        for job in due_jobs:
+            if job.interval is None:
+                job.due = None # Until woken again
+                continue
+            # Next period after now, the missed ones are skipped
+            periods = (now_tick - job.due) // job.interval + 1
+            job.skipped += periods - 1
+            self._insert(job, job.due + periods * job.interval)
+        return due_jobs
+
+    async def run_due(self, now_tick=None):
+        """Runs the due jobs, one at a time"""
+        if now_tick is None:
+            now_tick = self.current_tick()
+        for job in self.pop_due(now_tick):
+            job.runs += 1
+            try:
+                await job.func()
+            except Exception as error: # A failing job must not stop the others
+                job.errors += 1
+                print("Scheduled job {} failed: {}".format(job.name, error))
+
+    async def run(self):
+        """Runs the jobs until cancelled"""
+        self.changed = asyncio.Event()
+        while True:
+            self.changed.clear()
+            due = self.next_due()
+            timeout = None if due is None else due * self.tick - self.clock()
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout=timeout)
+                    continue # A job was added or woken, the next due may be earlier
+                except TimeoutError:
+                    pass
+            self.wakeups += 1
+            await self.run_due()
@@ -0,0 +1,144 @@
+"""Running the traffic indicators as several worker processes
+
+The fields of view are divided between the workers, either by the 'worker'
+parameter of the view or by hashing the view name. Each worker subscribes only
+to the streams its views use, the output subjects stay the same. The
+supervisor starts the workers, restarts them if they exit and publishes the
+combined health of the workers.
+"""
+
+import asyncio
+import datetime
+import json
+import os
+import zlib
+
+HEALTH_SUBJECT = "indicators.health" # Combined health, sent by the supervisor
+WORKER_HEALTH_SUBJECT = "indicators.health.worker" # Prefix, worker index added
+DEFAULT_HEALTH_INTERVAL = 5 # seconds
+DEFAULT_HEALTH_TIMEOUT = 15 # seconds without health message -> not healthy
+DEFAULT_RESTART_DELAY = 2 # seconds
+
+
+def view_worker(view_name, view_params, workers):
+    """Returns the index of the worker running the view"""
+    worker = view_params.get("worker", None)
+    if worker is not None:
+        return int(worker) % workers
+    # Stable over restarts, unlike the builtin hash
+    return zlib.crc32(view_name.encode()) % workers
+
+
+def select_views(view_params, worker_index, workers):
+    """Returns the view params of the views run by the given worker"""
+    return {name: params for name, params in view_params.items()
+            if view_worker(name, params, workers) == worker_index}
+
+
+def assign_views(view_params, workers):
+    """Returns list of view names for every worker"""
+    assignment = [[] for _ in range(workers)]
+    for name, params in view_params.items():
+        assignment[view_worker(name, params, workers)].append(name)
+    return assignment
+
+
+async def send_worker_health(nats, worker_index, sensor_twin):
+    """Sends the health of this worker (every DEFAULT_HEALTH_INTERVAL by the scheduler)"""
+    subject = "{}.{}".format(WORKER_HEALTH_SUBJECT, worker_index)
+    data = {}
+    data["worker"] = worker_index
+    data["pid"] = os.getpid()
+    data["views"] = list(sensor_twin.fovs)
+    data["radars"] = len(sensor_twin.radars)
+    data["detectors"] = len(sensor_twin.detectors)
+    data["groups"] = len(sensor_twin.groups)
+    data["tstamp"] = datetime.datetime.now().timestamp() * 1000
+    await nats.publish(subject, json.dumps(data).encode())
+
+
+class WorkerSupervisor:
+    """Starts and monitors the worker processes"""
+
+    def __init__(self, workers, worker_command, health_timeout=DEFAULT_HEALTH_TIMEOUT):
+        """
+            workers: number of worker processes
+            worker_command: function returning the command (list) for worker index
+        """
+        self.workers = workers
+        self.worker_command = worker_command
+        self.health_timeout = health_timeout
+        self.processes = [None] * workers
+        self.restarts = [0] * workers
+        self.last_health = [None] * workers # Latest health message of every worker
+        self.last_seen = [None] * workers # seconds (epoch)
+
+    def __str__(self):
+        alive = sum(1 for p in self.processes if p and p.returncode is None)
+        return "WorkerSupervisor: {}/{} workers running".format(alive, self.workers)
+
+    async def start_worker(self, index):
+        """Starts the worker process"""
+        cmd = self.worker_command(index)
+        self.processes[index] = await asyncio.create_subprocess_exec(*cmd)
+        print("Started worker {} (pid {})".format(index, self.processes[index].pid))
+
+    async def watch_worker(self, index):
+        """Starts the worker and restarts it when it exits"""
+        while True:
+            await self.start_worker(index)
+            returncode = await self.processes[index].wait()
+            print("Worker {} exited with code {}, restarting".format(index, returncode))
+            self.restarts[index] += 1
+            await asyncio.sleep(DEFAULT_RESTART_DELAY)
+
+    async def health_callback(self, msg):
+        """Stores the health messages of the workers"""
+        data = json.loads(msg.data.decode())
+        index = data.get("worker")
+        if isinstance(index, int) and 0 <= index < self.workers:
+            self.last_health[index] = data
+            self.last_seen[index] = datetime.datetime.now().timestamp()
+
+    def get_health(self, now=None):
+        """Returns the combined health of the workers as dict"""
+        if now is None:
+            now = datetime.datetime.now().timestamp()
+        workers = []
+        for index in range(self.workers):
+            process = self.processes[index]
+            last_seen = self.last_seen[index]
+            health = self.last_health[index] or {}
+            worker = {}
+            worker["worker"] = index
+            worker["pid"] = process.pid if process else None
+            worker["running"] = bool(process) and process.returncode is None
+            worker["restarts"] = self.restarts[index]
+            worker["views"] = health.get("views", [])
+            worker["last_seen"] = None if last_seen is None else now - last_seen
+            worker["healthy"] = worker["running"] and last_seen is not None \
+                and now - last_seen < self.health_timeout
+            workers.append(worker)
+        data = {}
+        data["workers"] = workers
+        data["healthy"] = all(w["healthy"] for w in workers)
+        data["tstamp"] = now * 1000
+        return data
+
+    async def send_health(self, nats, interval=DEFAULT_HEALTH_INTERVAL):
+        """Publishes the combined health periodically"""
+        while True:
+            await asyncio.sleep(interval)
+            await nats.publish(HEALTH_SUBJECT, json.dumps(self.get_health()).encode())
+
+    async def run(self, nats):
+        """Runs the workers, nats is a connected client"""
+        await nats.subscribe(WORKER_HEALTH_SUBJECT + ".*", cb=self.health_callback)
+        tasks = [asyncio.create_task(self.watch_worker(i)) for i in range(self.workers)]
+        tasks.append(asyncio.create_task(self.send_health(nats)))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for process in self.processes:
+                if process and process.returncode is None:
+                    process.terminate()
@@ -0,0 +1,138 @@
+"""Health and latency metrics of the input streams
+
+Every radar, detector and group keeps StreamMetrics of the messages it
+receives: message rate, inter-arrival gaps, latency (data received - data
+sent), empty frames and staleness. The gaps and latencies are kept in fixed
+size histograms, the metrics are published periodically and the counters are
+then started again. The times are recorded as int epoch nanoseconds (as the
+ingested data), the published metrics are in seconds.
+"""
+
+import bisect
+import json
+import time
+
+METRICS_SUBJECT = "indicators.metrics"
+DEFAULT_METRICS_INTERVAL = 5 # seconds
+DEFAULT_STALE_AFTER = 10 # seconds without messages -> stale
+NS_PER_SECOND = 1000000000
+NS_PER_MS = 1000000
+# Histogram bucket upper edges in seconds, the last bucket is open
+DEFAULT_BUCKET_EDGES = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Fixed size histogram, percentiles are given as bucket upper edges"""
+    __slots__ = ("edges", "counts", "count", "max")
+
+    def __init__(self, edges=DEFAULT_BUCKET_EDGES):
+        self.edges = edges
+        self.counts = [0] * (len(edges) + 1)
+        self.count = 0
+        self.max = None
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+        self.count += 1
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Returns the upper edge of the bucket of the q:th percentile (0..100), None if empty"""
+        if not self.count:
+            return None
+        target = q / 100.0 * self.count
+        total = 0
+        for i, count in enumerate(self.counts):
+            total += count
+            if total >= target and count:
+                # The open bucket and the top bucket are limited by the max seen
+                if i == len(self.edges):
+                    return self.max
+                return min(self.edges[i], self.max)
+        return self.max
+
+    def clear(self):
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.max = None
+
+
+class StreamMetrics:
+    """Metrics of the messages of one input stream"""
+
+    def __init__(self, name, stale_after=DEFAULT_STALE_AFTER):
+        """stale_after: seconds without messages before the stream is stale, None to disable"""
+        self.name = name
+        self.stale_after = stale_after
+        self.gaps = Histogram()
+        self.latencies = Histogram()
+        self.messages = 0 # In the current interval
+        self.empty = 0 # Empty frames in the current interval
+        self.total_messages = 0
+        self.last_received = None # ns (epoch)
+        self.interval_started = None
+
+    def __str__(self):
+        return "StreamMetrics {}: {} messages".format(self.name, self.total_messages)
+
+    def record(self, received, sent=None, empty=False):
+        """Records a message, times as epoch ns"""
+        if self.interval_started is None:
+            self.interval_started = received
+        if self.last_received is not None:
+            self.gaps.add(max(0, received - self.last_received) / NS_PER_SECOND)
+        if sent is not None:
+            self.latencies.add(max(0, received - sent) / NS_PER_SECOND)
+        self.last_received = received
+        self.messages += 1
+        self.total_messages += 1
+        if empty:
+            self.empty += 1
+
+    def get_metrics(self, now=None, reset=True):
+        """Returns the metrics of the interval as dict, starts a new interval if reset (now in epoch ns)"""
+        if now is None:
+            now = time.time_ns()
+        started = self.interval_started if self.interval_started is not None else now
+        elapsed = (now - started) / NS_PER_SECOND
+        metrics = {}
+        metrics["messages"] = self.messages
+        metrics["rate"] = self.messages / elapsed if elapsed > 0 else None # msg/s
+        metrics["gap_p50"] = self.gaps.percentile(50)
+        metrics["gap_p95"] = self.gaps.percentile(95)
+        metrics["gap_max"] = self.gaps.max
+        metrics["latency_p50"] = self.latencies.percentile(50)
+        metrics["latency_p95"] = self.latencies.percentile(95)
+        metrics["latency_p99"] = self.latencies.percentile(99)
+        metrics["empty_rate"] = self.empty / self.messages if self.messages else None
+        metrics["age"] = (now - self.last_received) / NS_PER_SECOND if self.last_received is not None else None
+        if self.stale_after is None:
+            metrics["stale"] = False # Event based stream, silence is normal
+        else:
+            metrics["stale"] = metrics["age"] is None or metrics["age"] > self.stale_after
+        if reset:
+            self.gaps.clear()
+            self.latencies.clear()
+            self.messages = 0
+            self.empty = 0
+            self.interval_started = now
+        return metrics
+
+
+async def send_stream_metrics(nats, sensor_twin, subject=METRICS_SUBJECT):
+    """Publishes the metrics of all the input streams (every DEFAULT_METRICS_INTERVAL by the scheduler)"""
+    now = time.time_ns()
+    data = {}
+    for stream_type, streams in (("radars", sensor_twin.radars),
+                                 ("detectors", sensor_twin.detectors),
+                                 ("groups", sensor_twin.groups)):
+        data[stream_type] = {name: stream.metrics.get_metrics(now) for name, stream in streams.items()}
+    stale = [name for streams in (data["radars"], data["detectors"], data["groups"])
+             for name, metrics in streams.items() if metrics["stale"]]
+    data["stale"] = stale
+    data["tstamp"] = now / NS_PER_MS
+    await nats.publish(subject, json.dumps(data).encode())
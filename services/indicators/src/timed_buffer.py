@@ -0,0 +1,190 @@
+"""Time indexed ring buffer for the sensor data histories"""
+
+import time
+
+DEFAULT_CAPACITY = 1200 # items
+DEFAULT_MAX_AGE = 60 # seconds
+NS_PER_SECOND = 1000000000
+
+
+class TimedRingBuffer:
+    """
+        A bounded history of items, each with a time key
+        The items are kept in key order, oldest first. The buffer is never
+        larger than the capacity and items older than max_age (relative to the
+        newest key) are evicted when new items are added. A silent stream adds
+        nothing, thus the readers call evict_stale to age out by wall clock.
+        The keys are seconds by default, with units_per_second=NS_PER_SECOND
+        they are integer epoch nanoseconds (as the ingested data).
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_age=DEFAULT_MAX_AGE, units_per_second=1):
+        """max_age in seconds"""
+        if capacity <= 0:
+            raise ValueError("Capacity must be positive")
+        self.capacity = capacity
+        self.units_per_second = units_per_second
+        self.max_age = self.to_units(max_age) # In key units
+        self._items = [None] * capacity
+        self._keys = [0.0] * capacity
+        self._head = 0 # index of the oldest item
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def __iter__(self):
+        """Iterates the items from oldest to newest"""
+        items = self._items
+        for i in range(self._count):
+            yield items[(self._head + i) % self.capacity]
+
+    def __getitem__(self, index):
+        """Returns the item by index, 0 is the oldest and -1 the newest"""
+        return self._items[self._physical(index)]
+
+    def __str__(self):
+        return "TimedRingBuffer: {}/{} items".format(self._count, self.capacity)
+
+    def to_units(self, seconds):
+        """Returns the seconds in key units"""
+        if self.units_per_second == 1:
+            return seconds
+        return int(round(seconds * self.units_per_second))
+
+    def now(self):
+        """Returns the current time in key units"""
+        if self.units_per_second == 1:
+            return time.time()
+        return time.time_ns() * self.units_per_second // NS_PER_SECOND
+
+    def _physical(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("TimedRingBuffer index out of range")
+        return (self._head + index) % self.capacity
+
+    def key_at(self, index):
+        """Returns the time key of the item by index"""
+        return self._keys[self._physical(index)]
+
+    def _bisect_left(self, key):
+        """Returns the index of the first item with key >= key"""
+        lo, hi = 0, self._count
+        keys = self._keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if keys[(self._head + mid) % self.capacity] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _bisect_right(self, key):
+        """Returns the index of the first item with key > key"""
+        lo, hi = 0, self._count
+        keys = self._keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key < keys[(self._head + mid) % self.capacity]:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def _drop_oldest(self, n):
+        for _ in range(n):
+            self._items[self._head] = None
+            self._head = (self._head + 1) % self.capacity
+        self._count -= n
+
+    #
+    # Adding data
+    #
+
+    def append(self, item, key=None):
+        """Adds the item as the newest, key defaults to current time"""
+        if key is None:
+            key = self.now()
+        if self._count and key < self._keys[self._physical(-1)]:
+            self.insert(item, key)
+            return
+        if self._count == self.capacity:
+            self._drop_oldest(1)
+        pos = (self._head + self._count) % self.capacity
+        self._items[pos] = item
+        self._keys[pos] = key
+        self._count += 1
+        self.evict_older_than(key - self.max_age)
+
+    def insert(self, item, key):
+        """Adds the item in key order, for data arriving out of order"""
+        index = self._bisect_right(key)
+        if self._count == self.capacity:
+            if index == 0:
+                return # Older than anything we keep
+            self._drop_oldest(1)
+            index -= 1
+        # Shift the newer items one step forward
+        for i in range(self._count, index, -1):
+            dst = (self._head + i) % self.capacity
+            src = (self._head + i - 1) % self.capacity
+            self._items[dst] = self._items[src]
+            self._keys[dst] = self._keys[src]
+        pos = (self._head + index) % self.capacity
+        self._items[pos] = item
+        self._keys[pos] = key
+        self._count += 1
+
+    def evict_older_than(self, key):
+        """Removes the items with key older than given"""
+        if self._count and self._keys[self._head] < key:
+            self._drop_oldest(self._bisect_left(key))
+
+    def evict_stale(self, now=None):
+        """Removes the items older than max_age from now (in key units, default current time)"""
+        if now is None:
+            now = self.now()
+        self.evict_older_than(now - self.max_age)
+
+    def clear(self):
+        self._items = [None] * self.capacity
+        self._head = 0
+        self._count = 0
+
+    #
+    # Data access
+    #
+
+    def last(self):
+        """Returns the newest item, None if empty"""
+        if not self._count:
+            return None
+        return self._items[(self._head + self._count - 1) % self.capacity]
+
+    def last_key(self):
+        """Returns the key of the newest item, None if empty"""
+        if not self._count:
+            return None
+        return self._keys[(self._head + self._count - 1) % self.capacity]
+
+    def last_n(self, n):
+        """Returns the last n items as list, oldest first"""
+        n = max(0, min(n, self._count))
+        return [self._items[(self._head + i) % self.capacity] for i in range(self._count - n, self._count)]
+
+    def since(self, key):
+        """Returns the items with key >= given key as list, oldest first"""
+        start = self._bisect_left(key)
+        return [self._items[(self._head + i) % self.capacity] for i in range(start, self._count)]
+
+    def last_seconds(self, seconds, now=None):
+        """Returns the items of the last n seconds as list, oldest first (now in key units)"""
+        if now is None:
+            now = self.now()
+        self.evict_stale(now) # Nothing received lately
+        return self.since(now - self.to_units(seconds))
@@ -0,0 +1,110 @@
+"""Timestamps of the ingested data
+
+All the ingested data is stamped with int64 epoch nanoseconds (time.time_ns),
+the histories are keyed with them and the ages are plain integer arithmetic.
+The sent timestamps ('tstamp') come in two formats: the radars send epoch
+milliseconds as a number and the detectors and groups send ISO 8601 strings
+(local time unless an offset is given, any number of fractional digits).
+parse_tstamp accepts both. The ISO strings are parsed by slicing, the epoch of
+the date and hour part is cached, thus datetime is only used once an hour.
+"""
+
+import datetime
+import time
+
+NS_PER_SECOND = 1000000000
+NS_PER_MS = 1000000
+_HOUR_CACHE_SIZE = 64
+
+
+def now_ns():
+    """Returns the current time as epoch nanoseconds"""
+    return time.time_ns()
+
+
+def seconds_to_ns(seconds):
+    return int(round(seconds * NS_PER_SECOND))
+
+
+def ns_to_seconds(ns):
+    return ns / NS_PER_SECOND
+
+
+def ns_to_ms(ns):
+    """Returns the epoch milliseconds (float), the format of the output tstamps"""
+    return ns / NS_PER_MS
+
+
+def ns_to_datetime(ns):
+    """Returns the local datetime (microsecond precision)"""
+    return datetime.datetime.fromtimestamp(ns / NS_PER_SECOND)
+
+
+def ns_to_iso(ns):
+    return ns_to_datetime(ns).isoformat()
+
+
+_hour_cache = {} # date and hour + offset -> epoch ns of the hour
+
+
+def _hour_ns(prefix, offset):
+    """Returns the epoch ns of the 'YYYY-MM-DDTHH' prefix, offset as string ('' for local time)"""
+    key = prefix + offset
+    hour = _hour_cache.get(key)
+    if hour is None:
+        dt = datetime.datetime(int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10]), int(prefix[11:13]))
+        if offset:
+            if offset in ("Z", "z"):
+                tz = datetime.timezone.utc
+            else:
+                sign = -1 if offset[0] == "-" else 1
+                minutes = int(offset[1:3]) * 60 + int(offset[-2:])
+                tz = datetime.timezone(sign * datetime.timedelta(minutes=minutes))
+            dt = dt.replace(tzinfo=tz)
+        hour = int(dt.timestamp()) * NS_PER_SECOND
+        if len(_hour_cache) >= _HOUR_CACHE_SIZE:
+            _hour_cache.clear()
+        _hour_cache[key] = hour
+    return hour
+
+
+def parse_iso_ns(tstamp):
+    """Returns the ISO 8601 timestamp 'YYYY-MM-DDTHH:MM[:SS[.fff...]][Z|+HH:MM]' as epoch ns"""
+    offset = ""
+    end = len(tstamp)
+    if tstamp[-1] in "Zz":
+        offset = "Z"
+        end -= 1
+    elif end > 19 and tstamp[-6] in "+-":
+        offset = tstamp[-6:]
+        end -= 6
+    ns = _hour_ns(tstamp[0:13], offset) + int(tstamp[14:16]) * 60 * NS_PER_SECOND
+    if end > 17:
+        # Float keeps the nanoseconds of a seconds value (< 60)
+        ns += int(round(float(tstamp[17:end]) * NS_PER_SECOND))
+    return ns
+
+
+def ms_to_ns(ms):
+    """Returns the epoch milliseconds as ns, the fraction separately (float precision)"""
+    if isinstance(ms, int):
+        return ms * NS_PER_MS
+    whole = int(ms)
+    return whole * NS_PER_MS + int(round((ms - whole) * NS_PER_MS))
+
+
+def parse_tstamp(tstamp):
+    """
+        Returns the sent timestamp as epoch ns, None if it cannot be parsed
+        Numbers (also numeric strings) are epoch milliseconds, strings ISO 8601
+    """
+    if isinstance(tstamp, (int, float)) and not isinstance(tstamp, bool):
+        return ms_to_ns(tstamp)
+    if isinstance(tstamp, str) and tstamp:
+        try:
+            if tstamp[0].isdigit() and len(tstamp) > 10 and tstamp[4] == "-":
+                return parse_iso_ns(tstamp)
+            return ms_to_ns(int(tstamp) if tstamp.isdigit() else float(tstamp))
+        except (ValueError, IndexError, OverflowError):
+            return None
+    return None
@@ -0,0 +1,185 @@
+"""Multi-frame object tracker for the radar streams
+
+The radars send a list of objects for every frame. The object ids are not
+reliable (e.g. the sim radar ids wrap at 255) and objects may disappear for a
+frame or two. The tracker associates the detections of a new frame to the
+existing tracks by position (predicted with the track velocity) and speed, and
+gives every track a stable id. The track state is kept in NumPy arrays.
+
+The velocity of a track is estimated from its matched positions in successive
+frames. The heading is only used if the radar gives it (sumo_angle, simulated
+radars only).
+"""
+
+import itertools
+
+import numpy as np
+
+# Flat imports when run as a script, relative when imported as a package (tests)
+if __package__:
+    from .association import greedy_assignment
+else:
+    from association import greedy_assignment
+
+EARTH_RADIUS = 6371000.0 # m
+
+DEFAULT_GATE_DISTANCE = 5.0 # m, max distance between predicted and measured position
+DEFAULT_GATE_SPEED = 5.0 # m/s, max speed difference
+DEFAULT_MAX_MISSED = 5 # frames a track is kept without detections
+DEFAULT_MIN_HITS = 2 # frames before a new track is output
+DEFAULT_SPEED_SMOOTHING = 0.3 # weight of the new speed measurement
+DEFAULT_VELOCITY_SMOOTHING = 0.3 # weight of the new velocity estimate (from positions)
+
+
+class RadarTracker:
+    """Tracks the radar objects across frames"""
+
+    def __init__(self, params=None):
+        if params is None:
+            params = {}
+        self.gate_distance = params.get("gate_distance", DEFAULT_GATE_DISTANCE)
+        self.gate_speed = params.get("gate_speed", DEFAULT_GATE_SPEED)
+        self.max_missed = params.get("max_missed", DEFAULT_MAX_MISSED)
+        self.min_hits = params.get("min_hits", DEFAULT_MIN_HITS)
+        self.speed_smoothing = params.get("speed_smoothing", DEFAULT_SPEED_SMOOTHING)
+        self.velocity_smoothing = params.get("velocity_smoothing", DEFAULT_VELOCITY_SMOOTHING)
+        # Positions are given as lat/lon (geo) or as metres (xy)
+        self.geo = params.get("coordinates", "geo") == "geo"
+        self.origin = None # lat/lon of the local coordinate system
+
+        self.track_ids = np.zeros(0, dtype=np.int64)
+        self.pos = np.zeros((0, 2))
+        self.vel = np.zeros((0, 2))
+        self.speed = np.zeros(0)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.missed = np.zeros(0, dtype=np.int64)
+        self.seen_pos = np.zeros((0, 2)) # Last matched position
+        self.seen_time = np.zeros(0) # seconds, time of the last matched position
+        self.objects = [] # Latest object dict of each track
+        self.last_time = None
+        self._next_id = itertools.count()
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def __str__(self):
+        return "RadarTracker: {} tracks".format(len(self))
+
+    def _positions(self, objects):
+        """Returns the positions of the objects in metres"""
+        coords = np.array([(obj["lat"], obj["lon"]) for obj in objects], dtype=float).reshape(-1, 2)
+        if not self.geo:
+            return coords
+        if self.origin is None:
+            self.origin = coords[0].copy()
+        lat0 = np.radians(self.origin[0])
+        d = np.radians(coords - self.origin)
+        # Local east (x) / north (y), accurate enough for an intersection
+        return np.column_stack((d[:, 1] * np.cos(lat0), d[:, 0])) * EARTH_RADIUS
+
+    @staticmethod
+    def _velocities(objects, speed, estimated):
+        """
+            Velocity vectors from speed and heading if the object has the heading
+            (sumo angle: 0 north, clockwise), otherwise the estimated ones
+        """
+        angle = np.array([obj.get("sumo_angle", np.nan) for obj in objects], dtype=float)
+        has_heading = ~np.isnan(angle)
+        angle = np.radians(np.where(has_heading, angle, 0.0))
+        heading_vel = np.column_stack((speed * np.sin(angle), speed * np.cos(angle)))
+        return np.where(has_heading[:, None], heading_vel, estimated)
+
+    def _estimate_velocities(self, t_idx, det_pos, time):
+        """
+            Returns the velocities of the matched tracks estimated from the
+            movement since their last matched position (smoothed)
+        """
+        vel = self.vel[t_idx]
+        dt = time - self.seen_time[t_idx]
+        moved = dt > 0.0
+        measured = vel.copy()
+        measured[moved] = (det_pos[moved] - self.seen_pos[t_idx][moved]) / dt[moved, None]
+        # The first estimate of a track is taken as is
+        weight = np.where(self.hits[t_idx] == 1, 1.0, self.velocity_smoothing)[:, None]
+        return (1.0 - weight) * vel + weight * measured
+
+    def _associate(self, pred, det_pos, speed):
+        """Returns matched (track, detection) index arrays, nearest first within the gates"""
+        cost = np.linalg.norm(pred[:, None, :] - det_pos[None, :, :], axis=2)
+        gated = (cost > self.gate_distance) | (np.abs(self.speed[:, None] - speed[None, :]) > self.gate_speed)
+        cost[gated] = np.inf
+        return greedy_assignment(cost)
+
+    def update(self, objects, time):
+        """
+            Updates the tracks with a new frame (list of object dicts, time in seconds)
+            Returns the list of tracked objects, with track id as 'id'
+        """
+        dt = 0.0 if self.last_time is None else max(0.0, time - self.last_time)
+        self.last_time = time
+
+        det_speed = np.array([obj.get("speed", 0.0) for obj in objects], dtype=float)
+        det_pos = self._positions(objects) if objects else np.zeros((0, 2))
+        pred = self.pos + self.vel * dt
+
+        t_idx, d_idx = self._associate(pred, det_pos, det_speed)
+
+        # Matched tracks
+        a = self.speed_smoothing
+        self.pos = pred
+        self.pos[t_idx] = det_pos[d_idx]
+        self.speed[t_idx] = (1.0 - a) * self.speed[t_idx] + a * det_speed[d_idx]
+        estimated = self._estimate_velocities(t_idx, det_pos[d_idx], time)
+        self.vel[t_idx] = self._velocities([objects[i] for i in d_idx], self.speed[t_idx], estimated)
+        self.seen_pos[t_idx] = det_pos[d_idx]
+        self.seen_time[t_idx] = time
+        self.hits[t_idx] += 1
+        self.missed += 1
+        self.missed[t_idx] = 0
+        for t, d in zip(t_idx.tolist(), d_idx.tolist(), strict=True):
+            self.objects[t] = objects[d]
+
+        # Lost tracks
+        keep = self.missed <= self.max_missed
+        if not keep.all():
+            self.track_ids = self.track_ids[keep]
+            self.pos = self.pos[keep]
+            self.vel = self.vel[keep]
+            self.speed = self.speed[keep]
+            self.hits = self.hits[keep]
+            self.missed = self.missed[keep]
+            self.seen_pos = self.seen_pos[keep]
+            self.seen_time = self.seen_time[keep]
+            self.objects = [obj for obj, k in zip(self.objects, keep.tolist(), strict=True) if k]
+
+        # New tracks from unmatched detections
+        new = np.ones(len(objects), dtype=bool)
+        new[d_idx] = False
+        if new.any():
+            n_new = int(new.sum())
+            new_objects = [obj for obj, n in zip(objects, new.tolist(), strict=True) if n]
+            self.track_ids = np.concatenate((self.track_ids, [next(self._next_id) for _ in range(n_new)]))
+            self.pos = np.concatenate((self.pos, det_pos[new]))
+            self.speed = np.concatenate((self.speed, det_speed[new]))
+            # Not moved yet, only the heading (if any) gives the velocity
+            self.vel = np.concatenate((self.vel, self._velocities(new_objects, det_speed[new], np.zeros((n_new, 2)))))
+            self.seen_pos = np.concatenate((self.seen_pos, det_pos[new]))
+            self.seen_time = np.concatenate((self.seen_time, np.full(n_new, float(time))))
+            self.hits = np.concatenate((self.hits, np.ones(n_new, dtype=np.int64)))
+            self.missed = np.concatenate((self.missed, np.zeros(n_new, dtype=np.int64)))
+            self.objects.extend(new_objects)
+
+        return self.get_tracked_objects()
+
+    def get_tracked_objects(self):
+        """Returns the confirmed tracks as object dicts (also the ones missed lately)"""
+        out = []
+        confirmed = np.flatnonzero(self.hits >= self.min_hits)
+        for i in confirmed.tolist():
+            obj = dict(self.objects[i])
+            obj["radar_obj_id"] = obj.get("id")
+            obj["id"] = int(self.track_ids[i])
+            obj["speed"] = float(self.speed[i])
+            obj["track_missed"] = int(self.missed[i])
+            out.append(obj)
+        return out
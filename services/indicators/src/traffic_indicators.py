@@ -12,17 +12,25 @@ IMPL_VERSION = "0.1"
 
 RADAR_TEST_TOPIC = "radar.270.1.objects_port.json"
 CONF_FILE = "models/testmodel/indicators.json"
+DEFAULT_CLEANUP_INTERVAL = 10 # seconds, removes the data of silent streams
 
 import asyncio
+import functools
+import os
+import sys
 from nats.aio.client import Client as NATS
 import argparse
 from confread import GlobalConf
 from radar import Radar
 from fusion2 import FieldOfView
-from detector import Detector
+from detector import Detector, DetectorLogic
+from detlogic import DetLogicEngine
 from group import Group
-import pandas as pd
-import re
+import sharding
+from intake import IntakeQueue, send_intake_stats, INTAKE_STATS_SUBJECT, DEFAULT_STATS_INTERVAL
+from stream_metrics import send_stream_metrics, METRICS_SUBJECT, DEFAULT_METRICS_INTERVAL
+from archive import ArchiveWriter, DEFAULT_SEGMENT_LENGTH
+from scheduler import TimerWheel
 
 # Note: should be in a separate file in the end
 class SensorTwin:
@@ -32,9 +40,13 @@ class SensorTwin:
         self.radars = {}
         self.detectors = {}
         self.groups = {}
+        self.detlogics = {} # Virtual detectors computed by the detlogic engine
+        self.detlogic_engine = None
         self.inputs = []
         self.outputs = []
         self.fovs = {} # Fields of View
+        # All the periodic outputs, cleanup and health messages
+        self.scheduler = TimerWheel()
         
 
     def __str__(self):
@@ -42,6 +54,8 @@ class SensorTwin:
         ret_str += "   Radars: {}\n".format(len(self.radars))
         ret_str += "   Detectors: {}\n".format(len(self.detectors))
         ret_str += "   Groups: {}\n".format(len(self.groups))
+        ret_str += "   Detlogics: {}\n".format(len(self.detlogics))
+        ret_str += "   Scheduled jobs: {}\n".format(len(self.scheduler))
         return ret_str
     
     #
@@ -88,6 +102,38 @@ class SensorTwin:
             fov.assign_groups(self.groups)
 
 
+    # DETECTOR LOGICS
+    def add_detector_logics(self, detlogic_dict, output_dict):
+        """Adds the detector logics and their outputs (virtual detectors)"""
+        if not output_dict:
+            return
+        try:
+            self.detlogic_engine = DetLogicEngine(detlogic_dict)
+        except ValueError as error:
+            print(f"Error: detlogics not used: {error}")
+            return
+        # Detector changes are fed to the engine
+        for name in self.detlogic_engine.input_names:
+            if name in self.detectors:
+                self.detectors[name].add_update_function(functools.partial(self.detlogic_input_changed, name))
+            else:
+                print(f"Warning: detlogic input {name} not found in detectors")
+
+        for name, params in output_dict.items():
+            det_logic = DetectorLogic(name, params)
+            if det_logic.function not in self.detlogic_engine.nodes:
+                print(f"Error: detlogic function {det_logic.function} not found in detlogics")
+                continue
+            det_logic.status = self.detlogic_engine.value(det_logic.function)
+            self.detlogic_engine.add_output_function(det_logic.function, det_logic.set_status)
+            self.detlogics[name] = det_logic
+
+    def detlogic_input_changed(self, det_name):
+        """Called when a detector used by the detlogics receives data"""
+        data = self.detectors[det_name].get_last_data()
+        if data is not None:
+            self.detlogic_engine.set_input(det_name, data['loop_on'])
+
     def assign_counting_blocks(self):
         """Assigns the counting blocks to the detectors"""
         for fov in self.fovs.values():
@@ -100,6 +146,32 @@ class SensorTwin:
             self.fovs[name] = fov
     
     
+    def keep_used_streams(self):
+        """Removes the streams not used by any field of view (when run as a worker)"""
+        radars = set()
+        detectors = set()
+        groups = set()
+        for fov in self.fovs.values():
+            for lane in fov.lanes:
+                radars.update(lane_radar.radar for lane_radar in lane.input_radars.values())
+                detectors.update(det for det in lane.in_dets.values())
+                detectors.update(det for det in lane.out_dets.values())
+            if fov.group:
+                groups.add(fov.group)
+        if self.detlogic_engine:
+            detectors.update(self.detectors[name] for name in self.detlogic_engine.input_names
+                             if name in self.detectors)
+        self.radars = {k: v for k, v in self.radars.items() if v in radars}
+        self.detectors = {k: v for k, v in self.detectors.items() if v in detectors}
+        self.groups = {k: v for k, v in self.groups.items() if v in groups}
+
+    def add_archive(self, archive):
+        """Archives the data of all the streams and the outputs of the views"""
+        for stream in list(self.radars.values()) + list(self.detectors.values()) + list(self.groups.values()):
+            stream.archive = archive
+        for name, fov in self.fovs.items():
+            fov.add_output_function(functools.partial(archive.add_view_output, name, fov.group_name))
+
     def get_all_configured_nats_subs(self):
         """Returns all nats subscriptions"""
         subs = []
@@ -122,43 +194,59 @@ class SensorTwin:
 
         return subs
 
-    def get_cleanup_tasks(self):
-        """Returns cleanup tasks for each sensor"""
-        tasks = []
-        # RADARS
-        for radar in self.radars.values():
-            tasks.append(radar.cleanup_old_data)
-        # DETS
-        for detector in self.detectors.values():
-            tasks.append(detector.cleanup_old_data)
-        
-        return tasks
-    
-    def get_send_messages_tasks(self):
-        """Returns the send queue tasks"""
-        tasks = []
+    def schedule_outputs(self, nats):
+        """Adds the outputs and the cleanup to the scheduler, the idle outputs are not scheduled"""
         # Fields of view
-        for fov in self.fovs.values():
-            tasks.append(fov.send_nats_messages)
-       
+        for name, fov in self.fovs.items():
+            if fov.schedule_output(self.scheduler, nats) is None:
+                print(f"View {name} has no outputs, not scheduled")
+
+        # Detector logics
+        for det_logic in self.detlogics.values():
+            det_logic.schedule_output(self.scheduler, nats)
+
+        self.scheduler.add_periodic("cleanup", self.remove_old_data, DEFAULT_CLEANUP_INTERVAL)
+
+    async def remove_old_data(self):
+        """Removes the old data of the streams, the histories of silent streams are not evicted otherwise"""
+        for stream in list(self.radars.values()) + list(self.detectors.values()) + list(self.groups.values()):
+            stream.remove_old_data()
+
+async def run_supervisor(command_line_params, config):
+    """Runs the workers as separate processes, each with a part of the views"""
+    workers = command_line_params.workers
+    assignment = sharding.assign_views(config.get_view_outputs(), workers)
+    for index, views in enumerate(assignment):
+        print("Worker {}: {}".format(index, ", ".join(views)))
+
+    def worker_command(index):
+        return [sys.executable, __file__] + sys.argv[1:] + ['--worker-index', str(index)]
+
+    supervisor = sharding.WorkerSupervisor(workers, worker_command)
+    nats = NATS()
+    await nats.connect(config.get_nats_params())
+    await supervisor.run(nats)
 
-        # Detectors (testing)
-        for detector in self.detectors.values():
-            tasks.append(detector.send_data) 
-        #for radar in self.radars.values():
-        #    tasks.append(radar.send_queues)
-        return tasks
 
 async def main():
     command_line_params = read_command_line()
     config = GlobalConf(command_line_params=command_line_params, conf=command_line_params.conf)
 
+    workers = command_line_params.workers
+    worker_index = command_line_params.worker_index
+    if workers > 1 and worker_index is None:
+        await run_supervisor(command_line_params, config)
+        return
+
     sensor_twin = SensorTwin()
     
     # Adds the field of views
     # Note: this has to be done _before_ adding the streams
     # Adding the streams also assigns them to the field of views
     fov_params = config.get_view_outputs()
+    if worker_index is not None:
+        # Only the views of this worker
+        fov_params = sharding.select_views(fov_params, worker_index, workers)
     sensor_twin.add_field_of_views(fov_params)
     
     # Adds the radar, detector and group streams
@@ -173,7 +261,25 @@ async def main():
     group_stream_params = config.get_group_stream_params()
     sensor_twin.add_group_streams(group_stream_params)
 
+    if worker_index is None or worker_index == 0:
+        # Detector logics are run by the first worker only
+        sensor_twin.add_detector_logics(config.get_detlogics(), config.get_detlogic_output_params())
+
     sensor_twin.assign_counting_blocks()
+    if worker_index is not None:
+        # Worker subscribes only to the streams of its own views
+        sensor_twin.keep_used_streams()
+
+    archive = None
+    if command_line_params.archive:
+        archive_dir = command_line_params.archive
+        if worker_index is not None:
+            # Every worker has its own archive
+            archive_dir = os.path.join(archive_dir, "worker{}".format(worker_index))
+        archive = ArchiveWriter(archive_dir, command_line_params.archive_segment, command_line_params.archive_retention)
+        archive.start()
+        sensor_twin.add_archive(archive)
+        print(archive)
 
     # Deubug
     #print("STREAM   PARAMS")
@@ -191,68 +297,40 @@ async def main():
     await nats.connect(nats_connection_params)
 
     # Sub to all subjects in config
+    # The messages go through bounded intake queues, processed in own tasks
     all_subs = sensor_twin.get_all_configured_nats_subs()
     #print("All subs:", all_subs)
+    intake_queues = []
     for sub in all_subs:
-        await nats.subscribe(sub['subject'], cb=sub['callback'])
-
-    # Add cleanup tast into asuncio loop for each sensor
-    tasks = sensor_twin.get_cleanup_tasks()
-    for task in tasks:
-        asyncio.create_task(task())
-
-    # For sending the queues
-    tasks = sensor_twin.get_send_messages_tasks()
-    for task in tasks:
-        asyncio.create_task(task(nats))
-
-    while True:
-        await asyncio.sleep(1)
-        print('***********************TRAFFIC_INDICATORS*****************************')
-        fovs_out = "Fovs:"
-
-        df = pd.DataFrame(columns=["Name", "Age", "Occupation"])
-
-        fovs_out = "Groups: "
-        for name, fov in sensor_twin.fovs.items():    
-            grp = fov.group_name
-            grp_num = int(re.findall(r"\d+", grp)[0])
-            if grp_num < 10:
-                add = " "
-            else:
-                add =""
-            fovs_out += " | " + add + str(grp_num)
-        fovs_out += " | "
-        print(fovs_out)
-
-        fovs_out = "States: "
-        for name, fov in sensor_twin.fovs.items():    
-            sig_state = fov.group.substate
-            if sig_state == None:
-                fovs_out += " |   " + sig_state
-            else:
-                fovs_out += " |  " + sig_state
-        fovs_out += " | "
-        print(fovs_out)
-
-        fovs_out = "Queues: "
-        for name, fov in sensor_twin.fovs.items():  
-            obj_cnt = len(fov.get_objects_in_all_lanes())
-            grp = fov.group_name
-            grp_num = int(re.findall(r"\d+", grp)[0])
-            if obj_cnt < 10:
-                add = " "
-            else:
-                add =""
-            fovs_out += " | " + add + str(obj_cnt)
-        fovs_out += " | "
-        print(fovs_out)
-
-        print('______________________________________________________________________')  
-
-        
-        
-
+        queue = IntakeQueue(sub['subject'], sub['callback'], sub['intake_policy'], sub['intake_size'])
+        intake_queues.append(queue)
+        asyncio.create_task(queue.run())
+        await nats.subscribe(sub['subject'], cb=queue.put)
+    # Outputs, cleanup and health messages are run by the scheduler
+    scheduler = sensor_twin.scheduler
+    sensor_twin.schedule_outputs(nats)
+    stats_subject = INTAKE_STATS_SUBJECT
+    metrics_subject = METRICS_SUBJECT
+    if worker_index is not None:
+        stats_subject += "." + str(worker_index)
+        metrics_subject += "." + str(worker_index)
+        scheduler.add_periodic("worker_health", functools.partial(
+            sharding.send_worker_health, nats, worker_index, sensor_twin), sharding.DEFAULT_HEALTH_INTERVAL)
+    scheduler.add_periodic("intake_stats", functools.partial(
+        send_intake_stats, nats, intake_queues, stats_subject), DEFAULT_STATS_INTERVAL)
+    scheduler.add_periodic("stream_metrics", functools.partial(
+        send_stream_metrics, nats, sensor_twin, metrics_subject), DEFAULT_METRICS_INTERVAL)
+    if sensor_twin.detlogic_engine:
+        asyncio.create_task(sensor_twin.detlogic_engine.run_timers())
+
+    print(sensor_twin)
+    print("Publishing stream metrics to: {}".format(metrics_subject))
+    try:
+        # Run until stopped
+        await scheduler.run()
+    finally:
+        if archive:
+            archive.close() # Writes the queued data
 
 
 def read_command_line():
@@ -281,6 +359,30 @@ def read_command_line():
     parser.add_argument('--nats-port',
                                 help='Nats server port ',
                                 required=False)
+
+    parser.add_argument('--workers',
+                                help='Number of worker processes, the views are '
+                                    'divided between them (default: 1)',
+                                type=int,
+                                default=1,
+                                required=False)
+    parser.add_argument('--worker-index',
+                                help='Runs as the given worker (started by the supervisor)',
+                                type=int,
+                                required=False)
+
+    parser.add_argument('--archive',
+                                help='Directory for archiving the inputs and outputs',
+                                required=False)
+    parser.add_argument('--archive-segment',
+                                help='Archive segment length in seconds (default: 3600)',
+                                type=int,
+                                default=DEFAULT_SEGMENT_LENGTH,
+                                required=False)
+    parser.add_argument('--archive-retention',
+                                help='Seconds the archive segments are kept (default: all)',
+                                type=int,
+                                required=False)
     
     args = parser.parse_args()
 
@@ -288,5 +390,3 @@ def read_command_line():
 
 if __name__ == "__main__":
     asyncio.run(main())
-
-ls
\ No newline at end of file
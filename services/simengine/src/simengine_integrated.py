@@ -435,7 +435,7 @@ def Sumo_e3detections_to_controller(
 
         for e3det in sumo_to_dets[e3det_id_sumo]:
             detlanes = e3det.lanes
-            if detlanes == []:
+            if not detlanes:
                 vehcount = traci.multientryexit.getLastStepVehicleNumber(e3det_id_sumo)
                 e3vehlist = traci.multientryexit.getLastStepVehicleIDs(e3det_id_sumo)
             else:
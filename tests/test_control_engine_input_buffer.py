@@ -0,0 +1,68 @@
+import unittest
+
+from services.control_engine.src.input_buffer import ControllerInputBuffer
+
+
+class FakeDetector:
+    """Records the loop values set by the buffer."""
+
+    def __init__(self):
+        self.loop_on = False
+        self.objects = None
+
+    def __setattr__(self, name, value):
+        if name == "loop_on":
+            self.__dict__.setdefault("history", []).append(value)
+        super().__setattr__(name, value)
+
+    def update_e3_vehicles(self, obj_list):
+        self.objects = obj_list
+
+
+class FakeGroup:
+    request_green = False
+
+
+class TestControllerInputBuffer(unittest.TestCase):
+    """Tests for the controller input buffer."""
+
+    def setUp(self):
+        self.buffer = ControllerInputBuffer()
+        self.det = FakeDetector()
+        self.det.history.clear()
+
+    def test_nothing_applied_before_tick(self):
+        self.buffer.set_loop(self.det, True)
+        self.assertFalse(self.det.loop_on)
+        self.buffer.apply()
+        self.assertTrue(self.det.loop_on)
+
+    def test_latest_value_kept(self):
+        self.buffer.set_loop(self.det, True)
+        self.buffer.set_loop(self.det, True)
+        self.buffer.set_e3_objects(self.det, {"a": {}})
+        self.buffer.set_e3_objects(self.det, {"b": {}})
+        self.buffer.apply()
+        self.assertEqual(self.det.history, [True])
+        self.assertEqual(self.det.objects, {"b": {}})
+        self.assertEqual(self.buffer.received, 4)
+        self.assertEqual(self.buffer.applied, 2)
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_short_pulse_is_not_lost(self):
+        self.buffer.set_loop(self.det, True)
+        self.buffer.set_loop(self.det, False)
+        self.buffer.apply()
+        self.assertEqual(self.det.history, [True, False])
+
+    def test_group_requests(self):
+        group = FakeGroup()
+        self.buffer.request_green(group)
+        self.buffer.request_green(group)
+        self.assertFalse(group.request_green)
+        self.buffer.apply()
+        self.assertTrue(group.request_green)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from services.control_engine.src.priority_requests import (
+    DEFAULT_REQUEST_LEVEL,
+    PriorityRequests,
+)
+
+
+class TestPriorityRequests(unittest.TestCase):
+    """Tests for the priority request book keeping."""
+
+    def test_default_level(self):
+        requests = PriorityRequests()
+        self.assertEqual(requests.level, DEFAULT_REQUEST_LEVEL)
+        self.assertFalse(requests)
+
+    def test_overlapping_requests(self):
+        requests = PriorityRequests()
+        requests.add("tram", 5)
+        requests.add("bus", 3)
+        self.assertEqual(requests.level, 5)
+        requests.discard("tram")
+        self.assertEqual(requests.level, 3)
+        requests.discard("bus")
+        self.assertEqual(requests.level, DEFAULT_REQUEST_LEVEL)
+
+    def test_replaced_level(self):
+        requests = PriorityRequests()
+        requests.add("tram", 5)
+        requests.add("tram", 3)
+        self.assertEqual(requests.level, 3)
+        self.assertEqual(len(requests), 1)
+
+    def test_removed_requests_are_compacted(self):
+        requests = PriorityRequests()
+        requests.add("tram", 5)
+        for i in range(100):
+            requests.add(i, 3)
+            requests.add(i, 4)
+            requests.discard(i)
+        self.assertEqual(requests.level, 5)
+        self.assertLessEqual(len(requests._heap), 2)  # noqa: SLF001
+        requests.discard("tram")
+        self.assertEqual(requests._heap, [])  # noqa: SLF001
+
+
+if __name__ == "__main__":
+    unittest.main()
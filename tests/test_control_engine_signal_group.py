@@ -0,0 +1,142 @@
+import json
+import os
+import unittest
+
+from services.control_engine.src.priority_requests import DEFAULT_REQUEST_LEVEL
+from services.control_engine.src.signal_group import GroupMachine, SignalGroup
+from services.control_engine.src.timer import VirtualTimer
+
+CONF_FILE = os.path.join(os.path.dirname(__file__), "..", "models", "test", "simple", "contr.json")
+
+
+class ExtendingExtender:
+    """Extender that always extends the green"""
+    extend = True
+
+
+class TestGroupMachine(unittest.TestCase):
+    """Tests for the signal groups sharing one state machine."""
+
+    @classmethod
+    def setUpClass(cls):
+        with open(CONF_FILE) as f:
+            cls.cnf = json.load(f)
+
+    def setUp(self):
+        self.timer = VirtualTimer(self.cnf["timer"])
+        self.grp_conf = dict(self.cnf["controller"]["signal_groups"]["east-r"])
+
+    def run_seconds(self, groups, seconds):
+        for _ in range(int(seconds / self.timer.time_step)):
+            for group in groups:
+                group.tick()
+            self.timer.tick()
+
+    def test_own_machine_if_not_given(self):
+        group = SignalGroup(self.timer, "group1", self.grp_conf)
+        self.assertEqual(group.machine.models, [group])
+        self.assertEqual(group.state, "Red_MinimumTime")
+        self.assertEqual(group.name, "group1: ")
+
+    def test_groups_share_machine_with_own_state(self):
+        machine = GroupMachine()
+        group1 = SignalGroup(self.timer, "group1", self.grp_conf, machine=machine)
+        conf2 = dict(self.grp_conf, min_red=10)
+        group2 = SignalGroup(self.timer, "group2", conf2, machine=machine)
+        self.assertEqual(machine.models, [group1, group2])
+
+        # Minimum red of group1 passes, group2 stays at its longer minimum
+        self.run_seconds([group1, group2], 5)
+        self.assertEqual(group1.state, "Red_CanEnd")
+        self.assertEqual(group2.state, "Red_MinimumTime")
+        self.assertGreater(group2.group_based_red.min_length, group1.group_based_red.min_length)
+
+    def test_min_green_start_and_end(self):
+        group = SignalGroup(self.timer, "group1", self.grp_conf)
+        group.extender = ExtendingExtender()
+        group.request_green = True
+        group.permit_green = True
+        states = []
+        for _ in range(10):
+            group.prev_state = group.state # As saved by the controller
+            group.tick()
+            self.timer.tick()
+            states.append((group.state, group.min_green_start(), group.min_green_end()))
+        for state, started, ended in states:
+            self.assertEqual(started, state == "Green_MinimumTime")
+            self.assertEqual(ended, state in ("Green_Extending", "Green_RemainGreen"))
+        self.assertIn("Green_MinimumTime", [state for state, _, _ in states])
+        self.assertEqual(states[-1][0], "Green_Extending")
+
+
+class TestGroupPriorityRequests(unittest.TestCase):
+    """Tests for the priority requests of two conflicting groups."""
+
+    @classmethod
+    def setUpClass(cls):
+        with open(CONF_FILE) as f:
+            cls.cnf = json.load(f)
+
+    def setUp(self):
+        self.timer = VirtualTimer(self.cnf["timer"])
+        grp_conf = dict(self.cnf["controller"]["signal_groups"]["east-r"], green_end="remain")
+        machine = GroupMachine()
+        self.group1 = SignalGroup(self.timer, "group1", grp_conf, machine=machine)
+        self.group2 = SignalGroup(self.timer, "group2", grp_conf, machine=machine)
+        self.group1.add_conflicting_group(self.group2)
+        self.group2.add_conflicting_group(self.group1)
+
+    def run_seconds(self, seconds):
+        for _ in range(int(seconds / self.timer.time_step)):
+            self.group1.tick()
+            self.group2.tick()
+            self.timer.tick()
+
+    def start_green(self, group):
+        """Runs the group to extended green with an extender that keeps extending"""
+        group.extender = ExtendingExtender()
+        group.request_green = True
+        group.permit_green = True
+        self.run_seconds(10)
+        self.assertEqual(group.state, "Green_Extending")
+
+    def priority_granted(self, group):
+        return group.va_green.other_group_request_priority()
+
+    def test_not_both_granted(self):
+        for level1, level2 in [(3, None), (None, 3), (3, 3), (3, 4), (4, 3)]:
+            if level1 is not None:
+                self.group1.add_priority_request("tram1", level1)
+            if level2 is not None:
+                self.group2.add_priority_request("tram2", level2)
+            cut1 = self.priority_granted(self.group1)
+            cut2 = self.priority_granted(self.group2)
+            self.assertFalse(cut1 and cut2, (level1, level2))
+            # Only a higher request of the other group cuts the green
+            self.assertEqual(cut1, (level2 or DEFAULT_REQUEST_LEVEL) > (level1 or DEFAULT_REQUEST_LEVEL))
+            self.assertEqual(cut2, (level1 or DEFAULT_REQUEST_LEVEL) > (level2 or DEFAULT_REQUEST_LEVEL))
+            self.group1.clear_priority_requests()
+            self.group2.clear_priority_requests()
+
+    def test_priority_cuts_conflicting_green(self):
+        self.start_green(self.group2)
+        self.group1.add_priority_request("tram", 3)
+        self.assertEqual(self.group2.other_request_level, 3)
+        self.run_seconds(1)
+        self.assertEqual(self.group2.state, "Green_RemainGreen")
+
+    def test_clear_restores_normal_operation(self):
+        self.start_green(self.group2)
+        self.group1.add_priority_request("tram", 3)
+        self.group1.clear_priority_requests()
+        self.assertEqual(self.group1.own_request_level, DEFAULT_REQUEST_LEVEL)
+        self.assertEqual(self.group2.other_request_level, DEFAULT_REQUEST_LEVEL)
+        self.assertFalse(self.group2.other_requests)
+        # The green is extended as without the request
+        self.run_seconds(5)
+        self.assertEqual(self.group2.state, "Green_Extending")
+        self.assertEqual(self.group1.state, "Red_CanEnd")
+
+
+if __name__ == "__main__":
+    unittest.main()
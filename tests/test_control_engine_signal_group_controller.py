@@ -0,0 +1,55 @@
+import contextlib
+import io
+import json
+import os
+import unittest
+
+from services.control_engine.src.signal_group_controller import PhaseRingController
+from services.control_engine.src.timer import VirtualTimer
+
+CONF_FILE = os.path.join(os.path.dirname(__file__), "..", "models", "test", "simple", "contr.json")
+
+
+class TestControllerPriorityRequests(unittest.TestCase):
+    """Tests for clearing the served priority requests in the controller."""
+
+    @classmethod
+    def setUpClass(cls):
+        with open(CONF_FILE) as f:
+            cls.cnf = json.load(f)
+
+    def setUp(self):
+        with contextlib.redirect_stdout(io.StringIO()):  # Config prints
+            self.timer = VirtualTimer(self.cnf["timer"])
+            self.controller = PhaseRingController(self.cnf["controller"], self.timer)
+        self.controller.print_status = False
+        self.groups = {grp.group_name: grp for grp in self.controller.groups}
+        self.groups["east-r"].request_green = True
+
+    def tick_until_min_green(self, group):
+        for _ in range(1000):
+            self.controller.tick()
+            self.timer.tick()
+            if group.is_in_min_green():
+                return
+        self.fail("No min green")
+
+    def test_overlapping_request_survives(self):
+        served, waiting = self.groups["east-r"], self.groups["south-l"]
+        served.add_priority_request("tram1", 5)
+        self.tick_until_min_green(served)
+        # A conflicting tram requests while the first one is being served
+        waiting.add_priority_request("tram2", 4)
+        self.controller.tick()
+        self.timer.tick()
+        self.assertEqual(len(served.own_requests), 0)
+        self.assertEqual(waiting.own_requests.sources, ["tram2"])
+        self.assertEqual(served.other_request_level, 4)
+        # Also the state update of the phase ring only clears the served group
+        self.controller.update_states()
+        self.assertEqual(waiting.own_requests.sources, ["tram2"])
+        self.assertEqual(served.other_request_level, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
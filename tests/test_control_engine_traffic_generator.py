@@ -0,0 +1,41 @@
+import argparse
+import json
+import os
+import unittest
+
+from services.control_engine.src.traffic_generator import generator_conf, run
+
+CONF_FILE = os.path.join(os.path.dirname(__file__), "..", "models", "test", "simple", "contr.json")
+
+
+class TestTrafficGenerator(unittest.TestCase):
+    """Tests for running the controller with synthetic traffic."""
+
+    @classmethod
+    def setUpClass(cls):
+        with open(CONF_FILE) as f:
+            cls.cnf = json.load(f)
+
+    def test_traffic_is_served(self):
+        stats, _ = run(self.cnf, 600, {"demand": 400, "seed": 1})
+        self.assertEqual(stats["sim_time"], 600)
+        self.assertGreater(stats["arrived"], 0)
+        self.assertGreater(stats["departed"], 0.8 * stats["arrived"])
+
+    def test_same_seed_same_result(self):
+        gen_conf = {"demand": 400, "arrivals": "platoon", "seed": 2}
+        stats1, _ = run(self.cnf, 300, gen_conf)
+        stats2, _ = run(self.cnf, 300, gen_conf)
+        self.assertEqual(stats1, stats2)
+
+    def test_arguments_override_configuration(self):
+        cnf = {"traffic_generator": {"demand": 200, "arrivals": "platoon", "platoon_size": 3}}
+        args = argparse.Namespace(demand=500.0, arrivals=None, seed=4)
+        self.assertEqual(generator_conf(cnf, args),
+                         {"demand": 500.0, "arrivals": "platoon", "platoon_size": 3, "seed": 4})
+        # The configuration itself is not changed
+        self.assertEqual(cnf["traffic_generator"]["demand"], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from services.indicators.src.archive import (
+    STRINGS_FILE,
+    ArchiveReader,
+    ArchiveWriter,
+    object_ids,
+)
+
+
+class Frame:
+    """Columns of a radar frame, as in RadarFrame"""
+
+    def __init__(self, ids, lanes):
+        n = len(ids)
+        self.ids = np.array(ids, dtype=object)
+        self.lane = np.array(lanes, dtype=str)
+        self.cls = np.zeros(n, dtype=np.int64)
+        self.speed = np.full(n, 5.0)
+        self.lat = np.full(n, 60.16)
+        self.lon = np.full(n, 24.92)
+        self.quality = np.full(n, 99.0)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, "archive")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, segment_length=3600, retention=None):
+        writer = ArchiveWriter(self.directory, segment_length, retention)
+        t0 = 1700000000.0
+        for i in range(20):
+            now = t0 + i * 600 # Every 10 minutes over 3+ hours
+            received = int(now) * 1000000000 # The streams stamp in epoch ns
+            writer.add_radar_frame("radar1", received, Frame([i, i + 100], ["1", "2"]))
+            writer.add_detector_data("det1", received, i % 2 == 0)
+            writer.add_group_status("group11", received, "A" if i % 2 else "c")
+            objects = {"obj{}".format(i): {"speed": 3.0, "quality": 99, "vtype": "car_type"}}
+            group = "group11" if i % 2 else "group2"
+            writer.add_view_output("view1", group, {"tstamp": now * 1000, "count": 1, "objects": objects})
+        writer.close()
+        return t0
+
+    def test_write_and_read(self):
+        t0 = self.write()
+        self.assertGreater(len(os.listdir(os.path.join(self.directory, "radar"))), 1)
+        reader = ArchiveReader(self.directory)
+        radar = reader.read("radar", t0 + 3000, t0 + 6000)
+        self.assertEqual(len(radar), 10) # 5 frames
+        self.assertEqual(reader.decode(radar["lane"][:2]).tolist(), ["1", "2"])
+        self.assertEqual(len(reader.read("radar", t0, t0 + 6000, lane="2")), 10)
+        objects = reader.read("view_objects", datetime.datetime.fromtimestamp(t0), t0 + 3600, group="group11")
+        self.assertEqual(objects["id"].tolist(), object_ids(["obj1", "obj3", "obj5"]).tolist())
+        self.assertEqual(len(reader.read("view_objects", None, None, id="obj3")), 1)
+        self.assertEqual(reader.read("radar", None, None, id=105)["lane"].tolist(), [reader.strings.lookup("2")])
+        self.assertEqual(len(reader.read("detector", None, None, loop_on=1)), 10)
+        self.assertEqual(len(reader.read("group", None, None, group="unknown")), 0)
+
+    def test_object_ids_not_interned(self):
+        self.write()
+        with open(os.path.join(self.directory, STRINGS_FILE)) as f:
+            strings = f.read()
+        self.assertNotIn("obj", strings)
+        ids = object_ids([5, np.int64(7), "5", None])
+        self.assertEqual(ids[:2].tolist(), [5, 7])
+        self.assertGreaterEqual(ids[2], 1 << 63) # Hashed, not the integer 5
+        self.assertEqual(object_ids(["5"]).tolist(), ids[2:3].tolist())
+
+    def test_retention(self):
+        self.write(segment_length=600, retention=1800)
+        segments = os.listdir(os.path.join(self.directory, "radar"))
+        self.assertLessEqual(len(segments), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
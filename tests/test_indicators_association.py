@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+
+from services.indicators.src.association import associate, detector_distance, greedy_assignment
+
+
+class TestAssociation(unittest.TestCase):
+
+    def test_greedy_assignment(self):
+        cost = np.array([[1.0, 5.0], [2.0, 9.0], [np.inf, np.inf]])
+        rows, cols = greedy_assignment(cost)
+        self.assertEqual(sorted(zip(rows.tolist(), cols.tolist(), strict=True)), [(0, 0), (1, 1)])
+        # Greedy, the cheapest pair first even if a row is left without a pair
+        cost = np.array([[1.0, 2.0], [1.5, np.inf]])
+        rows, cols = greedy_assignment(cost)
+        self.assertEqual(sorted(zip(rows.tolist(), cols.tolist(), strict=True)), [(0, 0)])
+
+    def test_lanes_and_distances(self):
+        # Radar objects at 5 m and 35 m in lane 0, 10 m in lane 1
+        radar_lane = np.array([0, 0, 1])
+        radar_dist = np.array([5.0, 35.0, 10.0])
+        quality = np.array([99, 99, 99])
+        # Counted vehicles: lane 0 at 30 m, lane 1 at 0 m, lane 1 far away
+        det_lane = np.array([0, 1, 1])
+        det_dist = np.array([30.0, 0.0, 200.0])
+        rows, cols, radar_conf, det_conf = associate(radar_lane, radar_dist, quality, det_lane, det_dist, 30.0)
+        self.assertEqual(sorted(zip(rows.tolist(), cols.tolist(), strict=True)), [(1, 0), (2, 1)])
+        self.assertLess(radar_conf[0], radar_conf[1]) # Not confirmed by the detectors
+        self.assertEqual(radar_conf[1], det_conf[0])
+        self.assertLess(det_conf[2], radar_conf[2])
+
+    def test_quality_order_without_positions(self):
+        nan = np.full(2, np.nan)
+        rows, cols, _, _ = associate(np.array([0, 0]), nan, np.array([50, 99]), np.array([0]), nan[:1])
+        self.assertEqual(rows.tolist(), [1])
+
+    def test_detector_distance(self):
+        self.assertEqual(detector_distance([0.0, 2.0, 10.0], 40.0, 10.0).tolist(), [40.0, 20.0, 0.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from services.indicators.src.detlogic import DetLogicEngine
+
+
+class TestDetLogicEngine(unittest.TestCase):
+    """Tests for the detector logic engine."""
+
+    def test_two_det_switch_and_combination(self):
+        engine = DetLogicEngine({
+            "switch": {"type": "two_det_switch", "detectors": {"request": "A", "clear": "B"}},
+            "not_b": {"type": "not", "input": "B"},
+            "out": {"type": "and", "inputs": ["switch", "not_b"]},
+        })
+        changes = []
+        engine.add_output_function("out", changes.append)
+        self.assertTrue(engine.value("not_b"))
+        engine.set_input("A", True, 0.0)
+        engine.set_input("A", False, 1.0)
+        self.assertTrue(engine.value("out"))
+        engine.set_input("B", True, 2.0)
+        engine.set_input("B", False, 3.0)
+        self.assertFalse(engine.value("switch"))
+        self.assertEqual(changes, [True, False])
+
+    def test_hold_and_delay_timers(self):
+        engine = DetLogicEngine({
+            "hold": {"type": "hold", "input": "A", "time": 2.0},
+            "delay": {"type": "delay", "input": "A", "time": 1.0},
+        })
+        engine.set_input("A", True, 0.0)
+        self.assertEqual(engine.next_deadline(), 1.0)
+        engine.advance(1.0)
+        self.assertTrue(engine.value("delay"))
+        engine.set_input("A", False, 5.0)
+        self.assertFalse(engine.value("delay"))
+        engine.advance(6.9)
+        self.assertTrue(engine.value("hold"))
+        engine.advance(7.0)
+        self.assertFalse(engine.value("hold"))
+
+    def test_cycle_is_rejected(self):
+        with self.assertRaises(ValueError):
+            DetLogicEngine({"x": {"type": "not", "input": "y"}, "y": {"type": "not", "input": "x"}})
+
+
+if __name__ == "__main__":
+    unittest.main()
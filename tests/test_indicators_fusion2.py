@@ -0,0 +1,169 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from services.indicators.src.fusion2 import DetectorObjectPool, FieldOfView
+from services.indicators.src.group import Group
+from services.indicators.src.radar import Radar
+from services.indicators.src.scheduler import TimerWheel
+
+STOP_LINE = [60.16, 24.92]
+M_LAT = 1.0 / 111195.0  # degrees per metre
+
+
+class FakeDetector:
+    """Loop detector with a fixed vehicle count."""
+
+    def __init__(self, count):
+        self.count = count
+
+    def get_vehicle_count(self):
+        return self.count
+
+    def get_last_data(self):
+        return None
+
+    def add_update_function(self, func):
+        pass
+
+
+def radar_object(obj_id, distance):
+    """Car on lane 1, distance (m) north of the stop line."""
+    return {"id": obj_id, "lane": 1, "class": 0, "speed": 5.0, "quality": 100,
+            "lat": STOP_LINE[0] + distance * M_LAT, "lon": STOP_LINE[1]}
+
+
+class TestDetectorObjectPool(unittest.TestCase):
+    """Tests for the synthetic objects of the detector counted vehicles."""
+
+    def test_ids_are_stable(self):
+        pool = DetectorObjectPool("tram_type")
+        first = pool.resize(2, now=10.0)
+        second = pool.resize(3, now=11.0)
+        self.assertEqual(list(second)[:2], list(first))
+        for obj_id, obj in first.items():
+            self.assertIs(second[obj_id], obj)
+        self.assertEqual(second[list(second)[2]]["vtype"], "tram_type")
+        self.assertEqual(pool.get_ages(list(second), 12.0).tolist(), [2.0, 2.0, 1.0])
+
+    def test_oldest_removed_first(self):
+        pool = DetectorObjectPool()
+        ids = list(pool.resize(3, now=1.0))
+        self.assertEqual(list(pool.resize(1, now=2.0)), ids[2:])
+        self.assertEqual(pool.resize(-1), {})
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(pool.arrived, {})
+
+
+class TestFieldOfViewCombined(unittest.TestCase):
+    """Tests for the e3 output of the combined radar and detector objects."""
+
+    def setUp(self):
+        self.radar = Radar("radar1", {"connection": "none"})
+        self.view = FieldOfView("group1_view", {
+            "type": "e3",
+            "group": "group1",
+            "lanes": [{
+                "name": "lane 1",
+                "in_dets": {"det1": {}},
+                "object_lists": {"radar1_lane1": {"stream": "radar1", "lane": 1}},
+                "stop_line": STOP_LINE,
+                "in_det_distance": 10,
+            }],
+        })
+        self.view.assign_radars({"radar1": self.radar})
+        self.view.assign_detectors({"det1": FakeDetector(3)})
+        self.view.assign_groups({"group1": Group("group1", {"stream": {"connection": "none"}})})
+
+    def add_frame(self, distances):
+        objects = [radar_object(i, distance) for i, distance in enumerate(distances)]
+        self.radar.add_data({"data_received": time.time_ns(), "objects": objects})
+
+    def test_unassociated_objects_not_double_counted(self):
+        # The radar sees vehicles far out, the counted ones queue near the stop line
+        self.add_frame([100.0, 110.0, 120.0])
+        data = self.view.get_e3_area_output()
+        self.assertEqual(data["count"], 3)
+        self.assertEqual(len(data["objects"]), 3)
+        self.assertEqual({obj["source"] for obj in data["objects"].values()}, {"radar"})
+
+    def test_detector_count_fills_the_lane(self):
+        self.add_frame([5.0])
+        data = self.view.get_e3_area_output()
+        self.assertEqual(data["count"], 3)
+        self.assertEqual(len(data["objects"]), 3)
+        sources = sorted(obj["source"] for obj in data["objects"].values())
+        self.assertEqual(sources, ["detector_count", "detector_count", "fused"])
+
+    def test_lane_frames_read_once_per_output(self):
+        self.add_frame([5.0, 20.0])
+        lane = self.view.lanes[0]
+        with patch.object(lane, "get_detected_frame_e3", wraps=lane.get_detected_frame_e3) as read:
+            data = self.view.get_e3_area_output()
+        self.assertEqual(read.call_count, 1)
+        self.assertEqual(data["stats"]["lanes"]["lane 1"]["60"]["mean_speed"], 5.0)
+
+
+class Clock:
+    """Settable clock for the wheel"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestFieldOfViewChangeTrigger(unittest.IsolatedAsyncioTestCase):
+    """Tests for the change triggered output of a view."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.wheel = TimerWheel(tick=0.1, size=64, clock=self.clock)
+        self.view = FieldOfView("group1_view", {
+            "type": "grp_view",
+            "trigger": "change",
+            "coalesce_time": 0.2,
+            "min_interval": 0.5,
+            "max_interval": 2.0,
+        })
+        self.sent = []
+        self.view.add_output_function(lambda data: self.sent.append(round(self.clock.now - 1000.0, 1)))
+        self.view.schedule_output(self.wheel, None)
+
+    async def advance(self, seconds):
+        """Runs the wheel tick by tick"""
+        for _ in range(int(round(seconds / self.wheel.tick))):
+            self.clock.now += self.wheel.tick
+            await self.wheel.run_due(self.wheel.current_tick())
+
+    async def test_changes_are_coalesced(self):
+        await self.advance(0.3)
+        self.view.mark_inputs_changed()
+        self.view.mark_inputs_changed()
+        await self.advance(0.1)
+        self.view.mark_inputs_changed()  # Within the coalesce time of the first change
+        await self.advance(0.6)
+        self.assertEqual(self.sent, [0.5])
+
+    async def test_min_interval(self):
+        self.view.mark_inputs_changed()
+        await self.advance(0.3)
+        self.assertEqual(self.sent, [0.2])
+        # Changed again right after the output, not sent before the min interval
+        self.view.mark_inputs_changed()
+        await self.advance(1.0)
+        self.assertEqual(self.sent, [0.2, 0.7])
+
+    async def test_max_interval_without_changes(self):
+        await self.advance(4.5)
+        self.assertEqual(self.sent, [2.0, 4.0])
+
+    async def test_idle_view_is_not_scheduled(self):
+        view = FieldOfView("idle_view", {"type": "grp_view", "trigger": "change"})
+        self.assertIsNone(view.schedule_output(self.wheel, None))
+        view.mark_inputs_changed()  # Nothing to wake
+
+
+if __name__ == "__main__":
+    unittest.main()
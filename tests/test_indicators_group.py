@@ -0,0 +1,76 @@
+import time
+import unittest
+
+from services.indicators.src.group import Group, GroupStatus, GroupTransition
+from services.indicators.src.timestamps import seconds_to_ns
+
+
+class TestGroupHistory(unittest.TestCase):
+    """Tests for the status history of a signal group."""
+
+    def setUp(self):
+        self.group = Group("group1", {"stream": {"connection": "none"}, "history_length": 60})
+
+    def add_status(self, substate, age=0):
+        received = time.time_ns() - seconds_to_ns(age)
+        self.group.add_data({"substate": substate, "data_received": received})
+        return received
+
+    def test_last_status(self):
+        self.add_status("a", age=2)
+        self.add_status("1", age=1)
+        self.assertEqual(self.group.get_last_data().substate, "1")
+
+    def test_history_is_bounded(self):
+        group = Group("group1", {"stream": {"connection": "none"}, "history_size": 3})
+        for substate in ("a", "b", "0", "1", "5"):
+            group.add_data({"substate": substate, "data_received": time.time_ns()})
+        self.assertEqual([status.substate for status in group.data], ["0", "1", "5"])
+
+    def test_status_is_compact(self):
+        received = self.add_status("4")
+        status = self.group.get_last_data()
+        self.assertIsInstance(status, GroupStatus)
+        self.assertEqual(status, GroupStatus(None, received, "4"))
+
+    def test_silent_group_ages_out(self):
+        # Nothing newer arrives, the status ages out by the current time
+        self.add_status("1", age=61)
+        self.assertIsNone(self.group.get_last_data())
+        self.assertEqual(len(self.group.data), 0)
+
+
+class TestGroupTransitions(unittest.TestCase):
+    """Tests for the substate transition log of a signal group."""
+
+    def setUp(self):
+        self.group = Group("group1", {"stream": {"connection": "none"}, "transition_log_size": 3})
+
+    def add_status(self, substate, received):
+        self.group.add_data({"substate": substate, "data_received": received})
+
+    def test_only_changes_are_logged(self):
+        for received, substate in enumerate(["a", "a", "1", "1", "1", "b"]):
+            self.add_status(substate, received)
+        self.assertEqual(self.group.get_transitions(), [
+            GroupTransition(0, None, "a"), GroupTransition(2, "a", "1"), GroupTransition(5, "1", "b")])
+        self.assertEqual(self.group.get_transitions(since=2), self.group.get_transitions()[1:])
+
+    def test_log_is_bounded(self):
+        for received, substate in enumerate(["a", "1", "b", "0", "a"]):
+            self.add_status(substate, received)
+        self.assertEqual([tr.to_substate for tr in self.group.get_transitions()], ["b", "0", "a"])
+
+    def test_time_since_last_green(self):
+        self.add_status("a", 0)
+        self.assertIsNone(self.group.time_since_last_green(now=1))
+        self.add_status("1", seconds_to_ns(1))
+        self.assertEqual(self.group.time_since_last_green(now=seconds_to_ns(2)), 0.0)
+        self.add_status("5", seconds_to_ns(3))  # Still green
+        self.add_status("b", seconds_to_ns(4))
+        self.add_status("a", seconds_to_ns(5))
+        self.assertAlmostEqual(self.group.time_since_last_green(now=seconds_to_ns(10)), 6.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import asyncio
+import unittest
+
+from services.indicators.src.intake import IntakeQueue
+
+
+class TestIntakeQueue(unittest.IsolatedAsyncioTestCase):
+    """Tests for the bounded intake queues."""
+
+    async def test_latest_drops_oldest(self):
+        processed = []
+
+        async def callback(msg):
+            processed.append(msg)
+
+        queue = IntakeQueue("radar", callback, policy="latest", size=2)
+        for i in range(5):
+            await queue.put(i)
+        self.assertEqual(list(queue.messages), [3, 4])
+        self.assertEqual(queue.dropped, 3)
+        task = asyncio.create_task(queue.run())
+        await asyncio.sleep(0)
+        task.cancel()
+        self.assertEqual(processed, [3, 4])
+
+    async def test_lossless_waits_for_space(self):
+        processed = []
+
+        async def callback(msg):
+            processed.append(msg)
+            await asyncio.sleep(0)
+
+        queue = IntakeQueue("det", callback, policy="lossless", size=2)
+        task = asyncio.create_task(queue.run())
+        for i in range(10):
+            await queue.put(i)
+        while len(processed) < 10:
+            await asyncio.sleep(0)
+        task.cancel()
+        self.assertEqual(processed, list(range(10)))
+        self.assertEqual(queue.get_stats()["dropped"], 0)
+        self.assertLessEqual(queue.max_depth, 2)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            IntakeQueue("x", None, policy="newest")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+
+from services.indicators.src.lane_geometry import LaneGeometry, NO_LANE
+
+LAT0, LON0 = 60.16, 24.92
+M_LAT = 1.0 / 111195.0 # degrees per metre
+M_LON = M_LAT / np.cos(np.radians(LAT0))
+
+
+def point(x, y):
+    return [LAT0 + y * M_LAT, LON0 + x * M_LON]
+
+
+class TestLaneGeometry(unittest.TestCase):
+
+    def setUp(self):
+        # Two parallel northbound lanes, one as polygon and one as centreline
+        self.geometry = LaneGeometry({
+            "0": {"polygon": [point(0, 0), point(3, 0), point(3, 50), point(0, 50)]},
+            "1": {"centreline": [point(4.5, 0), point(4.5, 50)], "width": 3.0},
+        })
+
+    def assign(self, points, fallback=None):
+        lat, lon = np.array(points).T
+        return self.geometry.assign(lat, lon, fallback).tolist()
+
+    def test_assign(self):
+        lanes = self.assign([point(1, 10), point(4, 40), point(20, 10), point(1, 60)])
+        self.assertEqual(lanes, ["0", "1", NO_LANE, NO_LANE])
+
+    def test_fallback_and_missing_positions(self):
+        lanes = self.assign([point(4.5, 5), point(20, 10), [np.nan, np.nan]], fallback=["7", "7", "8"])
+        self.assertEqual(lanes, ["1", "7", "8"])
+
+    def test_empty(self):
+        self.assertEqual(self.geometry.assign(np.array([]), np.array([])).tolist(), [])
+
+    def test_bad_geometry(self):
+        with self.assertRaises(ValueError):
+            LaneGeometry({"0": {"polygon": [point(0, 0), point(1, 1)]}})
+
+
+if __name__ == "__main__":
+    unittest.main()
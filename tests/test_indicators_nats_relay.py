@@ -0,0 +1,89 @@
+import unittest
+import zlib
+
+from nats.errors import OutboundBufferLimitError
+
+from services.indicators.src.nats_relay import Relay, RelayBuffer, SubjectRewriter
+
+
+class FakeClient:
+    """Downstream client recording the published subjects"""
+
+    def __init__(self, is_closed=False, full=False):
+        self.is_closed = is_closed
+        self.full = full
+        self.subjects = []
+
+    async def publish(self, subject, data, headers=None):
+        if self.full:
+            raise OutboundBufferLimitError
+        self.subjects.append(subject)
+
+
+class TestSubjectRewriter(unittest.TestCase):
+
+    def test_wildcards(self):
+        rewriter = SubjectRewriter([
+            {"from": "radar.270.*.objects_port.json", "to": "lab.radar.270.$1.objects"},
+            {"from": "detector.>", "to": "lab.detector.>"},
+        ])
+        self.assertEqual(rewriter.rewrite("radar.270.2.objects_port.json"), "lab.radar.270.2.objects")
+        self.assertEqual(rewriter.rewrite("detector.status.d1"), "lab.detector.status.d1")
+        self.assertEqual(rewriter.rewrite("radar.270.objects_port.json"), "radar.270.objects_port.json")
+        self.assertEqual(rewriter.rewrite("detector"), "detector")
+
+    def test_bad_rule(self):
+        with self.assertRaises(ValueError):
+            SubjectRewriter([{"from": "a.>.b", "to": "c"}])
+        with self.assertRaises(ValueError):
+            SubjectRewriter([{"from": "a.*.b", "to": "c.$2"}])
+        with self.assertRaises(ValueError):
+            SubjectRewriter([{"from": "a.*.b", "to": "c.$0"}])
+        with self.assertRaises(ValueError):
+            SubjectRewriter([{"from": "a.*", "to": "c.>"}])
+
+
+class TestRelayBuffer(unittest.TestCase):
+
+    def test_drops_oldest(self):
+        buffer = RelayBuffer(3)
+        for i in range(5):
+            buffer.put("s", str(i).encode())
+        self.assertEqual(buffer.dropped, 2)
+        batch = buffer.take(2)
+        self.assertEqual([m[1] for m in batch], [b"2", b"3"])
+        self.assertEqual(len(buffer), 1)
+
+
+class TestRelayEncode(unittest.TestCase):
+
+    def test_compression(self):
+        compressing = Relay({"compression": "zlib"})
+        data, headers = compressing.encode(b"x" * 100, None)
+        self.assertEqual(zlib.decompress(data), b"x" * 100)
+        plain = Relay({})
+        self.assertEqual(plain.encode(data, headers), (b"x" * 100, None))
+
+
+class TestRelayPublish(unittest.IsolatedAsyncioTestCase):
+
+    async def test_counts_published(self):
+        relay = Relay({"rewrite": [{"from": "a.*", "to": "b.$1"}]})
+        reconnecting, closed = FakeClient(), FakeClient(is_closed=True)
+        relay.downstream = [reconnecting, closed]
+        await relay.publish_batch([("a.1", b"xyz", None, 0.0), ("a.2", b"x", None, 0.0)])
+        self.assertEqual(reconnecting.subjects, ["b.1", "b.2"])
+        self.assertEqual(closed.subjects, [])
+        self.assertEqual((relay.stats.relayed, relay.stats.bytes_out), (2, 4))
+
+    async def test_not_counted_if_not_published(self):
+        relay = Relay({})
+        relay.downstream = [FakeClient(full=True), FakeClient(is_closed=True)]
+        await relay.publish_batch([("a", b"xyz", None, 0.0)])
+        stats = relay.stats.get_stats(relay.buffer)
+        self.assertEqual((stats["relayed"], stats["bytes_out"], stats["lag_mean"]), (0, 0, None))
+        self.assertEqual((stats["unpublished"], stats["errors"]), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
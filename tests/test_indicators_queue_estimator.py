@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+
+from services.indicators.src.queue_estimator import QueueEstimator, radar_queue_tail
+
+
+class TestQueueEstimator(unittest.TestCase):
+    """Tests for the per lane queue estimator."""
+
+    def test_detector_counts_and_discharge(self):
+        estimator = QueueEstimator(2, saturation_flow=0.5)
+        has_in, has_out = [True, True], [True, False]
+        estimator.predict(0.0, [0, 0], [0, 0], has_in, has_out, green=False)
+        estimator.predict(10.0, [6, 6], [2, 0], has_in, has_out, green=False)
+        np.testing.assert_allclose(estimator.vehicles, [4.0, 6.0])
+        # Lane without out detectors discharges when green, never below zero
+        estimator.predict(30.0, [6, 6], [2, 0], has_in, has_out, green=True)
+        np.testing.assert_allclose(estimator.vehicles, [4.0, 0.0])
+        variance = estimator.variance.copy()
+        estimator.predict(31.0, [6, 6], [12, 0], has_in, has_out, green=True)
+        self.assertEqual(estimator.vehicles[0], 0.0) # Miscounted departures
+        self.assertTrue(np.all(estimator.variance > variance))
+
+    def test_radar_update_reduces_uncertainty(self):
+        estimator = QueueEstimator(3, initial_variance=25.0)
+        estimator.predict(0.0, [0, 0, 0], [0, 0, 0], [True] * 3, [True] * 3, green=False)
+        estimator.predict(1.0, [8, 8, 8], [0, 0, 0], [True] * 3, [True] * 3, green=False)
+        estimator.update([5.0, np.nan, 5.0], [1.0, 1.0, 0.2])
+        self.assertLess(estimator.vehicles[0], 8.0)
+        self.assertGreater(estimator.vehicles[0], 5.0)
+        self.assertEqual(estimator.vehicles[1], 8.0) # No radar
+        self.assertLess(estimator.variance[0], estimator.variance[1])
+        # Lower quality radar, smaller correction
+        self.assertGreater(estimator.vehicles[2], estimator.vehicles[0])
+
+    def test_queue_length_and_spillback(self):
+        estimator = QueueEstimator(2, jam_spacing=7.0, spillback_occupancy=5.0)
+        estimator.vehicles[:] = [2.0, 2.0]
+        estimator.variance[:] = [1.0, 1.0]
+        tail = radar_queue_tail([5.0, 12.0, 30.0], [0.0, 1.0, 10.0])
+        self.assertEqual(tail, 15.5) # The moving object is not queued
+        estimator.update_queue([tail, np.nan], [40.0, 40.0], [0.0, 6.0])
+        self.assertEqual(estimator.queue_length[1], 14.0)
+        self.assertTrue(14.0 < estimator.queue_length[0] < 15.5)
+        self.assertEqual(estimator.spillback.tolist(), [False, True])
+        out = estimator.get_lane_output(1)
+        self.assertEqual(out["queue_vehicles"], 2.0)
+        self.assertEqual(out["vehicles_std"], 1.0)
+        self.assertEqual(radar_queue_tail([], []), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
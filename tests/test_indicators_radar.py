@@ -0,0 +1,33 @@
+import time
+import unittest
+
+from services.indicators.src.radar import Radar
+from services.indicators.src.timestamps import seconds_to_ns
+
+
+class TestRadarHistory(unittest.TestCase):
+    """Tests for the frame history of a radar."""
+
+    def setUp(self):
+        self.radar = Radar("radar1", {"connection": "none", "history_length": 60})
+
+    def add_frame(self, age, object_id):
+        received = time.time_ns() - seconds_to_ns(age)
+        self.radar.add_data({"data_received": received, "objects": [{"id": object_id}]})
+
+    def test_last_frame(self):
+        self.add_frame(2, 1)
+        self.add_frame(1, 2)
+        self.assertEqual(self.radar.get_object_list(), [{"id": 2}])
+
+    def test_silent_radar_ages_out(self):
+        # Nothing newer arrives, the frames age out by the current time
+        self.add_frame(70, 1)
+        self.add_frame(61, 2)
+        self.assertIsNone(self.radar.get_last_data())
+        self.assertEqual(self.radar.get_object_list(), [])
+        self.assertEqual(self.radar.get_object_list(3), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from services.indicators.src.radar_frame import RadarFrame
+
+
+OBJECTS = [
+    {"id": 1, "lane": 0, "class": 4, "speed": 3.0, "quality": 100},
+    {"id": 2, "lane": 1, "class": 7, "speed": 1.0},
+    {"id": 3, "lane": "0", "class": "unknown", "speed": 5.0},
+]
+
+
+class TestRadarFrame(unittest.TestCase):
+    """Tests for the columnar radar frames."""
+
+    def test_lane_filtering_and_counts(self):
+        frame = RadarFrame(OBJECTS)
+        self.assertEqual(frame.count_by_lane(), {"0": 2, "1": 1})
+        self.assertEqual([obj["id"] for obj in frame.lane_objects("0")], [1, 3])
+        self.assertEqual(len(frame.lane_frame("2")), 0)
+        self.assertAlmostEqual(frame.mean_speed(frame.lane_mask("0")), 4.0)
+
+    def test_lane_frames_indexed_once(self):
+        frame = RadarFrame([dict(obj) for obj in OBJECTS])
+        lane_frame = frame.lane_frame("0")
+        self.assertEqual(lane_frame.ids.tolist(), [1, 3])
+        self.assertEqual(lane_frame.speed.tolist(), [3.0, 5.0])
+        # Every reader of the lane gets the same frame
+        self.assertIs(frame.lane_frame(0), lane_frame)
+        # New lanes are indexed again
+        frame.set_lanes(["1", "1", "2"])
+        self.assertEqual(frame.lane_frame("1").ids.tolist(), [1, 2])
+        self.assertEqual(frame.count_by_lane(), {"1": 2, "2": 1})
+        self.assertEqual(len(frame.lane_frame("0")), 0)
+
+    def test_selected_frame_lanes(self):
+        frame = RadarFrame.concatenate([RadarFrame(OBJECTS[:1]), RadarFrame(OBJECTS[1:])])
+        self.assertEqual([obj["id"] for obj in frame.lane_objects("0")], [1, 3])
+        self.assertEqual(frame.select([1]).count_by_lane(), {"1": 1})
+        self.assertEqual(RadarFrame().count_by_lane(), {})
+
+    def test_class_mapping(self):
+        frame = RadarFrame(OBJECTS)
+        vtypes = frame.map_classes({4: "car_type", 7: "truck_type"})
+        self.assertEqual(vtypes.tolist(), ["car_type", "truck_type", None])
+
+    def test_concatenate(self):
+        frame = RadarFrame.concatenate([RadarFrame(OBJECTS[:1]), RadarFrame(), RadarFrame(OBJECTS[1:])])
+        self.assertEqual(frame.ids.tolist(), [1, 2, 3])
+        self.assertEqual(frame.quality.tolist(), [100.0, 99.0, 99.0])
+        self.assertEqual(len(RadarFrame.concatenate([])), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from services.indicators.src.rolling_stats import RollingStats, WindowedAccumulator
+
+
+class TestWindowedAccumulator(unittest.TestCase):
+    """Tests for the bucketed window accumulator."""
+
+    def test_values_expire_with_buckets(self):
+        acc = WindowedAccumulator(10, buckets=10)
+        acc.add(1.0, 0.5)
+        acc.add(2.0, 5.5)
+        self.assertEqual(acc.total(9.9), 3.0)
+        self.assertEqual(acc.total(10.5), 2.0)
+        self.assertAlmostEqual(acc.mean(10.5), 2.0)
+        self.assertIsNone(acc.mean(100.0))
+        self.assertEqual(acc.sum, 0.0)
+
+    def test_long_gap_clears_everything(self):
+        acc = WindowedAccumulator(60, buckets=6)
+        for t in range(60):
+            acc.add(1.0, float(t))
+        self.assertEqual(acc.count, 60)
+        self.assertEqual(acc.total(1000.0), 0.0)
+
+
+class TestRollingStats(unittest.TestCase):
+    """Tests for the rolling traffic statistics."""
+
+    def test_flow_speed_and_red_arrivals(self):
+        stats = RollingStats([10])
+        for t in range(10):
+            stats.update(float(t), passed=1, arrivals=1, red=t < 5, speed_sum=10.0, speed_count=2, queue=t)
+        values = stats.get_stats(9.5)["10"]
+        self.assertAlmostEqual(values["flow"], 10 / 9.5 * 3600.0)
+        self.assertAlmostEqual(values["mean_speed"], 5.0)
+        self.assertEqual(values["red_arrivals"], 5)
+        self.assertAlmostEqual(values["queue"], 4.5)
+        self.assertIsNone(values["occupancy"])
+
+
+if __name__ == "__main__":
+    unittest.main()
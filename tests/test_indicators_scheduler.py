@@ -0,0 +1,69 @@
+import unittest
+
+from services.indicators.src.scheduler import TimerWheel
+
+
+class Clock:
+    """Settable clock for the wheel"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestTimerWheel(unittest.IsolatedAsyncioTestCase):
+    """Tests for the timer wheel scheduler."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.wheel = TimerWheel(tick=0.1, size=8, clock=self.clock)
+        self.runs = []
+
+    def job(self, name):
+        async def func():
+            self.runs.append(name)
+        return func
+
+    async def advance(self, seconds):
+        """Runs the wheel tick by tick"""
+        for _ in range(int(round(seconds / self.wheel.tick))):
+            self.clock.now += self.wheel.tick
+            await self.wheel.run_due(self.wheel.current_tick())
+
+    async def test_periodic_jobs_are_aligned(self):
+        self.wheel.add_periodic("a", self.job("a"), 0.5)
+        self.clock.now += 0.2
+        self.wheel.add_periodic("b", self.job("b"), 0.5)
+        self.wheel.add_periodic("c", self.job("c"), 2.0) # Beyond one revolution
+        await self.advance(2.0)
+        self.assertEqual(self.runs.count("a"), 4)
+        self.assertEqual(self.runs.count("b"), 4)
+        self.assertEqual(self.runs.count("c"), 1)
+        self.assertEqual(self.runs[:2], ["a", "b"]) # Same tick
+
+    async def test_wake_and_cancel(self):
+        job = self.wheel.add_job("event", self.job("event"))
+        self.assertIsNone(self.wheel.next_due())
+        self.wheel.wake(job, 0.3)
+        self.wheel.wake(job, 0.5) # Already due earlier
+        await self.advance(1.0)
+        self.assertEqual(self.runs, ["event"])
+        periodic = self.wheel.add_periodic("p", self.job("p"), 0.4)
+        self.wheel.wake(periodic)
+        self.wheel.cancel(periodic)
+        await self.advance(1.0)
+        self.assertEqual(self.runs, ["event"])
+
+    async def test_late_loop_skips_periods(self):
+        job = self.wheel.add_periodic("a", self.job("a"), 0.2)
+        self.clock.now += 3.0 # Longer than the wheel
+        await self.wheel.run_due(self.wheel.current_tick())
+        self.assertEqual(self.runs, ["a"])
+        self.assertGreater(job.skipped, 0)
+        self.assertGreater(job.due, self.wheel.last_tick)
+
+
+if __name__ == "__main__":
+    unittest.main()
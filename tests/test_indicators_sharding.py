@@ -0,0 +1,38 @@
+import unittest
+
+from services.indicators.src.sharding import WorkerSupervisor, assign_views, select_views, view_worker
+
+
+VIEWS = {
+    "group1_view": {"type": "e3"},
+    "group2_view": {"type": "e3", "worker": 1},
+    "group3_view": {"type": "e3"},
+    "group4_view": {"type": "e3", "worker": 0},
+}
+
+
+class TestSharding(unittest.TestCase):
+    """Tests for dividing the views between the workers."""
+
+    def test_every_view_has_one_worker(self):
+        assignment = assign_views(VIEWS, 3)
+        names = sorted(name for views in assignment for name in views)
+        self.assertEqual(names, sorted(VIEWS))
+        for index, views in enumerate(assignment):
+            self.assertEqual(sorted(select_views(VIEWS, index, 3)), sorted(views))
+
+    def test_configured_worker_and_stable_hash(self):
+        self.assertEqual(view_worker("group2_view", VIEWS["group2_view"], 3), 1)
+        self.assertEqual(view_worker("group4_view", VIEWS["group4_view"], 3), 0)
+        self.assertEqual(view_worker("group1_view", {}, 4), view_worker("group1_view", {}, 4))
+        self.assertEqual(select_views(VIEWS, 0, 1), VIEWS)
+
+    def test_health_without_workers_running(self):
+        supervisor = WorkerSupervisor(2, lambda index: [])
+        health = supervisor.get_health(now=100.0)
+        self.assertFalse(health["healthy"])
+        self.assertEqual([w["running"] for w in health["workers"]], [False, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import datetime
+import unittest
+
+from services.indicators.src.stream_metrics import Histogram, StreamMetrics, NS_PER_SECOND
+
+
+class TestStreamMetrics(unittest.TestCase):
+    """Tests for the input stream metrics."""
+
+    def test_histogram_percentiles(self):
+        hist = Histogram(edges=(0.01, 0.1, 1.0))
+        for value in [0.005] * 90 + [0.5] * 9 + [3.0]:
+            hist.add(value)
+        self.assertEqual(hist.percentile(50), 0.01)
+        self.assertEqual(hist.percentile(95), 1.0)
+        self.assertEqual(hist.percentile(100), 3.0)
+        self.assertIsNone(Histogram().percentile(50))
+
+    def test_rate_latency_and_staleness(self):
+        metrics = StreamMetrics("radar", stale_after=1.0)
+        start = datetime.datetime(2025, 1, 1, 12, 0, 0).timestamp() * NS_PER_SECOND
+        for i in range(11):
+            received = int(start + 0.1 * i * NS_PER_SECOND)
+            sent = received - 40 * 1000000
+            metrics.record(received, sent, empty=(i == 0))
+        now = int(start + NS_PER_SECOND)
+        values = metrics.get_metrics(now)
+        self.assertAlmostEqual(values["rate"], 11.0)
+        self.assertAlmostEqual(values["latency_p50"], 0.04, places=3)
+        self.assertAlmostEqual(values["empty_rate"], 1 / 11)
+        self.assertFalse(values["stale"])
+        later = metrics.get_metrics(now + 5 * NS_PER_SECOND)
+        self.assertEqual(later["messages"], 0)
+        self.assertTrue(later["stale"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+from services.indicators.src.timed_buffer import NS_PER_SECOND, TimedRingBuffer
+
+
+class TestTimedRingBuffer(unittest.TestCase):
+    """Tests for the time indexed ring buffer."""
+
+    def test_capacity_is_bounded(self):
+        buf = TimedRingBuffer(capacity=3, max_age=100)
+        for i in range(5):
+            buf.append(i, float(i))
+        self.assertEqual(list(buf), [2, 3, 4])
+        self.assertEqual(buf.last(), 4)
+        self.assertEqual(buf[0], 2)
+
+    def test_old_items_evicted_on_append(self):
+        buf = TimedRingBuffer(capacity=10, max_age=5)
+        for t in (0.0, 1.0, 2.0, 8.0):
+            buf.append(t, t)
+        self.assertEqual(list(buf), [8.0])
+
+    def test_silent_stream_evicted_by_wall_clock(self):
+        buf = TimedRingBuffer(capacity=10, max_age=5)
+        buf.append("a", 1.0)
+        buf.append("b", 2.0)
+        # Nothing is appended, the items only age out by the current time
+        buf.evict_stale(now=6.5)
+        self.assertEqual(list(buf), ["b"])
+        buf.evict_stale(now=7.5)
+        self.assertIsNone(buf.last())
+
+    def test_evict_stale_in_ns(self):
+        buf = TimedRingBuffer(capacity=10, max_age=60, units_per_second=NS_PER_SECOND)
+        buf.append("old", buf.now() - 61 * NS_PER_SECOND)
+        buf.append("new")
+        buf.evict_stale()
+        self.assertEqual(list(buf), ["new"])
+
+    def test_range_queries(self):
+        buf = TimedRingBuffer(capacity=4, max_age=100)
+        for i in range(6):
+            buf.append(i, float(i))
+        self.assertEqual(buf.last_n(2), [4, 5])
+        self.assertEqual(buf.last_n(10), [2, 3, 4, 5])
+        self.assertEqual(buf.since(3.5), [4, 5])
+        self.assertEqual(buf.last_seconds(2, now=5.0), [3, 4, 5])
+
+    def test_out_of_order_insert(self):
+        buf = TimedRingBuffer(capacity=4, max_age=100)
+        for t in (1.0, 3.0, 2.0, 0.5):
+            buf.append(t, t)
+        self.assertEqual(list(buf), [0.5, 1.0, 2.0, 3.0])
+        buf.append(0.1, 0.1)  # Full and older than anything kept
+        self.assertEqual(list(buf), [0.5, 1.0, 2.0, 3.0])
+
+    def test_empty(self):
+        buf = TimedRingBuffer()
+        self.assertIsNone(buf.last())
+        self.assertEqual(buf.last_n(3), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import datetime
+import unittest
+
+from services.indicators.src.timestamps import NS_PER_SECOND, parse_tstamp, ns_to_ms
+
+
+class TestTimestamps(unittest.TestCase):
+    """Tests for the sent timestamp parser."""
+
+    def test_epoch_milliseconds(self):
+        self.assertEqual(parse_tstamp(1700000000123), 1700000000123000000)
+        self.assertEqual(parse_tstamp(1700000000123.5), 1700000000123500000)
+        self.assertEqual(parse_tstamp("1700000000123"), 1700000000123000000)
+        self.assertEqual(ns_to_ms(1700000000123000000), 1700000000123.0)
+
+    def test_iso_strings(self):
+        local = datetime.datetime(2025, 3, 1, 12, 30, 15, 123456)
+        expected = int(local.timestamp()) * NS_PER_SECOND + 123456789
+        self.assertEqual(parse_tstamp("2025-03-01T12:30:15.123456789"), expected)
+        self.assertEqual(parse_tstamp("2025-03-01T12:30:15.123456"), expected - 789)
+        self.assertEqual(parse_tstamp("2025-03-01T12:30:15"), int(local.timestamp()) * NS_PER_SECOND)
+        utc = datetime.datetime(2025, 3, 1, 10, 30, 15, tzinfo=datetime.timezone.utc)
+        self.assertEqual(parse_tstamp("2025-03-01T10:30:15Z"), int(utc.timestamp()) * NS_PER_SECOND)
+        self.assertEqual(parse_tstamp("2025-03-01T12:30:15+02:00"), int(utc.timestamp()) * NS_PER_SECOND)
+
+    def test_invalid(self):
+        self.assertIsNone(parse_tstamp(None))
+        self.assertIsNone(parse_tstamp(""))
+        self.assertIsNone(parse_tstamp("not a time"))
+        self.assertIsNone(parse_tstamp(True))
+
+
+if __name__ == "__main__":
+    unittest.main()
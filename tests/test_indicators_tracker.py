@@ -0,0 +1,60 @@
+import unittest
+
+from services.indicators.src.tracker import RadarTracker
+
+
+def frame(objects):
+    """Objects as (radar id, x, y, speed), heading north."""
+    return [
+        {"id": oid, "lat": x, "lon": y, "speed": speed, "sumo_angle": 0.0, "lane": 1}
+        for oid, x, y, speed in objects
+    ]
+
+
+class TestRadarTracker(unittest.TestCase):
+    """Tests for the radar object tracker."""
+
+    def setUp(self):
+        # Note: with xy coordinates lat is x and lon is y (north)
+        self.tracker = RadarTracker({"coordinates": "xy", "min_hits": 2, "max_missed": 2})
+
+    def test_track_ids_stable_over_radar_id_wrap(self):
+        ids = []
+        for step in range(5):
+            radar_id = 254 + step  # Wraps past 255
+            objs = self.tracker.update(frame([(radar_id % 256, 0.0, 10.0 * step * 0.1, 10.0)]), step * 0.1)
+            ids.extend(obj["id"] for obj in objs)
+        self.assertEqual(len(set(ids)), 1)
+        self.assertEqual(len(ids), 4)  # First frame not yet confirmed
+
+    def test_flickering_object_keeps_track(self):
+        self.tracker.update(frame([(1, 0.0, 0.0, 0.0), (2, 20.0, 0.0, 0.0)]), 0.0)
+        first = {o["lat"]: o["id"] for o in self.tracker.update(frame([(1, 0.0, 0.0, 0.0), (2, 20.0, 0.0, 0.0)]), 0.1)}
+        # Object at x=20 missing for one frame
+        objs = self.tracker.update(frame([(1, 0.0, 0.0, 0.0)]), 0.2)
+        self.assertEqual(len(objs), 2)
+        objs = self.tracker.update(frame([(7, 0.0, 0.0, 0.0), (9, 20.0, 0.0, 0.0)]), 0.3)
+        self.assertEqual({o["lat"]: o["id"] for o in objs}, first)
+
+    def test_lost_track_removed(self):
+        for step in range(2):
+            self.tracker.update(frame([(1, 0.0, 0.0, 0.0)]), step * 0.1)
+        for step in range(2, 6):
+            objs = self.tracker.update([], step * 0.1)
+        self.assertEqual(objs, [])
+        self.assertEqual(len(self.tracker), 0)
+
+    def test_velocity_from_positions_without_heading(self):
+        # Real radars give no heading, the object moves east at 8 m/s
+        ids = []
+        for step in (0, 1, 2, 4, 5):  # Frame 3 missing, the object moves 8 m meanwhile
+            obj = {"id": step, "lat": 4.0 * step, "lon": 0.0, "speed": 8.0, "lane": 1}
+            ids.extend(o["id"] for o in self.tracker.update([obj], step * 0.5))
+        self.assertEqual(len(set(ids)), 1)
+        self.assertEqual(len(ids), 4)
+        self.assertAlmostEqual(self.tracker.vel[0][0], 8.0)
+        self.assertAlmostEqual(self.tracker.vel[0][1], 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()